@@ -0,0 +1,186 @@
+import threading
+from typing import Callable, Dict, Iterable, Iterator, Optional, Set
+
+from gitlab import Gitlab, GitlabError, GitlabHttpError
+from gitlab.v4.objects import Project, MergeRequest, ProjectMergeRequest
+
+from config.settings import logger, settings
+from controller.gitlab import get_local_commit, prime_file
+from controller.local_repo import LocalRefError
+
+HELM_DIR = '.helm'
+VALUES_FILE_NAME = 'values-prod.yaml'
+# Основной values-prod.yaml. Параметры собираются из всех values-prod.yaml каталога .helm, см. is_values_path
+VALUES_PATH = f'{HELM_DIR}/{VALUES_FILE_NAME}'
+
+
+def is_values_path(path: str) -> bool:
+    """
+        Метод проверяет, что путь - один из values-prod.yaml каталога .helm (основной или сабчарта)
+    """
+    return path.startswith(f'{HELM_DIR}/') and path.rsplit('/', 1)[-1] == VALUES_FILE_NAME
+
+
+class MergeRequestContext:
+    """
+        Общий контекст MR, который создаётся один раз в main.py и передаётся во все стадии.
+        Изменённые пути читаются постранично из /merge_requests/:iid/diffs, содержимое диффов не хранится
+        и запрашивается отдельно только через diff()
+    """
+
+    def __init__(self, project: Project, mr: MergeRequest):
+        self.project = project
+        self.mr = mr
+        self._lock = threading.Lock()
+        self._paths: Set[str] = set()
+        self._pages: Optional[Iterator[str]] = None
+        self._complete = False
+        self._diffs: Dict[str, Optional[str]] = {}
+
+    def _iter_diffs(self) -> Iterator[dict]:
+        gl = self.project.manager.gitlab
+        try:
+            yield from gl.http_list(f'/projects/{self.project.id}/merge_requests/{self.mr.iid}/diffs',
+                                    iterator=True, per_page=100)
+        except GitlabHttpError as e:
+            if e.response_code != 404:
+                raise
+            # Эндпоинт /diffs появился в GitLab 15.7, в более старых версиях берём полный changes()
+            logger.debug('Эндпоинт /diffs недоступен, используем mr.changes()')
+            yield from self.mr.changes()['changes']
+
+    def _local_paths(self) -> Optional[Set[str]]:
+        # Изменённые пути из локального git diff, если обе ветки есть в локальной копии
+        target = get_local_commit(self.project, self.mr.target_branch)
+        source = get_local_commit(self.project, self.mr.source_branch)
+        if not target or not source:
+            return None
+        try:
+            return target[0].changed_paths(target[1], source[1])
+        except LocalRefError as e:
+            logger.debug(f'Не удалось получить изменения MR из локальной копии: {e}')
+            return None
+
+    def _iter_paths(self) -> Iterator[str]:
+        local_paths = self._local_paths()
+        if local_paths is not None:
+            yield from local_paths
+            return
+
+        for diff in self._iter_diffs():
+            yield diff['new_path']
+            if diff.get('old_path') and diff['old_path'] != diff['new_path']:
+                yield diff['old_path']
+
+    def prime_changed_paths(self, paths: Iterable[str]):
+        """
+            Метод задаёт полный список изменённых путей, полученный другим способом
+        """
+        with self._lock:
+            self._paths = set(paths)
+            self._complete = True
+
+    def _advance(self, until: Optional[Callable[[str], bool]] = None) -> bool:
+        # Дочитывает страницы диффов до пути, подходящего под until (или до конца), и сообщает, найден ли он
+        if self._pages is None:
+            self._pages = self._iter_paths()
+        for changed in self._pages:
+            self._paths.add(changed)
+            if until and until(changed):
+                return True
+        self._complete = True
+        return False
+
+    def is_changed(self, path: str) -> bool:
+        """
+            Метод проверяет, изменён ли файл в MR. Страницы диффов запрашиваются только до первого совпадения
+        """
+        with self._lock:
+            if path in self._paths or self._complete:
+                return path in self._paths
+            return self._advance(path.__eq__)
+
+    def is_values_changed(self) -> bool:
+        """
+            Метод проверяет, изменён ли в MR хотя бы один values-prod.yaml каталога .helm.
+            Страницы диффов запрашиваются только до первого совпадения
+        """
+        with self._lock:
+            if any(is_values_path(path) for path in self._paths):
+                return True
+            return not self._complete and self._advance(is_values_path)
+
+    @property
+    def changed_paths(self) -> Set[str]:
+        """
+            Полный список изменённых путей MR
+        """
+        with self._lock:
+            if not self._complete:
+                self._advance()
+            return self._paths
+
+    def diff(self, path: str) -> Optional[str]:
+        """
+            Метод возвращает содержимое диффа для одного файла. Запрос выполняется только при вызове
+        """
+        with self._lock:
+            if path not in self._diffs:
+                self._diffs[path] = next((diff.get('diff') for diff in self._iter_diffs()
+                                          if path in (diff['new_path'], diff.get('old_path'))), None)
+            return self._diffs[path]
+
+
+def context_from_graphql(gl: Gitlab, project_id: int, mr_iid: int, source_branch: Optional[str] = None,
+                         target_branch: Optional[str] = None) -> MergeRequestContext:
+    """
+        Метод строит контекст MR по одному пакетному GraphQL запросу: проект, MR, изменённые пути и нужные файлы
+        обеих веток сразу попадают в кэши, и стадиям остаётся только коммит.
+        Если ветки MR известны заранее, файлы запрашиваются в том же запросе, иначе - вторым
+    """
+    from controller.graphql import fetch_merge_request_bundle
+
+    bundle = fetch_merge_request_bundle(gl, project_id, mr_iid, source_branch, target_branch)
+    node, mr_node = bundle['project'], bundle['merge_request']
+
+    project = Project(gl.projects, {
+        'id': project_id,
+        'name': node['name'],
+        'path_with_namespace': node['fullPath'],
+        'web_url': node['webUrl'],
+    })
+    mr = ProjectMergeRequest(project.mergerequests, {
+        'iid': int(mr_node['iid']),
+        'project_id': project_id,
+        'title': mr_node['title'],
+        'state': mr_node['state'],
+        'web_url': mr_node['webUrl'],
+        'source_branch': mr_node['sourceBranch'],
+        'target_branch': mr_node['targetBranch'],
+        'sha': mr_node['diffHeadSha'],
+    })
+
+    ctx = MergeRequestContext(project, mr)
+    ctx.prime_changed_paths(bundle['changed_paths'])
+    for ref, files in bundle['files'].items():
+        for path, blob in files.items():
+            prime_file(project, ref, path, blob)
+    return ctx
+
+
+def load_context(gl: Gitlab, project_id: int, mr_iid: int, source_branch: Optional[str] = None,
+                 target_branch: Optional[str] = None,
+                 get_project: Optional[Callable[[int], Project]] = None) -> MergeRequestContext:
+    """
+        Метод строит контекст MR одним GraphQL запросом, а при ошибке или settings.graphql=False - через REST API
+    """
+    if settings.graphql:
+        from controller.graphql import GraphQLError
+
+        try:
+            return context_from_graphql(gl, project_id, mr_iid, source_branch, target_branch)
+        except (GraphQLError, GitlabError) as e:
+            logger.debug(f'GraphQL запрос для {project_id}:{mr_iid} не выполнен, используем REST API: {e}')
+
+    project = get_project(project_id) if get_project else gl.projects.get(project_id)
+    return MergeRequestContext(project, project.mergerequests.get(mr_iid))
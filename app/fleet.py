@@ -0,0 +1,132 @@
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+from gitlab import Gitlab
+from gitlab.v4.objects import Project
+
+from app.context import load_context
+from app.stages import STAGES, get_handler, run_stage
+from config.settings import logger, settings
+
+Target = Tuple[int, int]
+
+
+def parse_targets(targets: Iterable[str]) -> List[Tuple[int, Optional[int]]]:
+    """
+        Метод разбирает цели в формате '<project_id>:<merge_request_iid>' или '<project_id>' (все открытые MR проекта)
+    """
+    result = []
+    for target in targets:
+        project_id, _, mr_iid = str(target).partition(':')
+        result.append((int(project_id), int(mr_iid) if mr_iid else None))
+    return result
+
+
+def discover_projects(gl: Gitlab) -> Iterator[int]:
+    """
+        Метод обходит все проекты группы settings.namespace, включая подгруппы
+    """
+    group = gl.groups.get(settings.namespace)
+    for project in group.projects.list(include_subgroups=True, archived=False, iterator=True):
+        yield project.id
+
+
+def expand_targets(gl: Gitlab, targets: Iterable[str]) -> Iterator[Target]:
+    """
+        Метод превращает список целей в пары (project_id, merge_request_iid).
+        Если цели не заданы - берутся все открытые MR в проектах namespace
+    """
+    parsed = parse_targets(targets) or [(project_id, None) for project_id in discover_projects(gl)]
+    for project_id, mr_iid in parsed:
+        if mr_iid is not None:
+            yield project_id, mr_iid
+            continue
+        project = gl.projects.get(project_id, lazy=True)
+        for mr in project.mergerequests.list(state='opened', iterator=True):
+            yield project_id, mr.iid
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return set(json.load(f).get('done', []))
+    except FileNotFoundError:
+        return set()
+
+
+def save_checkpoint(path: str, done: Set[str]):
+    """
+        Метод атомарно сохраняет список обработанных целей, чтобы прерванный запуск продолжился с того же места
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.fleet-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'done': sorted(done)}, f)
+    os.replace(tmp_path, path)
+
+
+def run_fleet(gl: Gitlab, stage: Optional[str], targets: Optional[Iterable[str]] = None) -> Optional[dict]:
+    """
+        Метод запускает стадию для множества MR в пуле потоков с общим клиентом GitLab.
+        Прогресс сохраняется в settings.fleet_checkpoint после каждой цели, после успешного завершения файл удаляется
+    """
+    # Неизвестная стадия не выполнилась бы ни для одной цели, но все они попали бы в прогресс как обработанные
+    if not stage or not get_handler(stage):
+        logger.error(f'Неизвестная стадия: {stage}. Доступные стадии: {", ".join(STAGES)}')
+        return None
+
+    checkpoint = settings.fleet_checkpoint
+    done = load_checkpoint(checkpoint)
+    if done:
+        logger.info(f'Продолжаем прерванный запуск, уже обработано: {len(done)}')
+
+    lock = threading.Lock()
+    summary = {'ok': 0, 'skipped': 0, 'failed': 0}
+
+    @lru_cache(maxsize=None)
+    def get_project(project_id: int) -> Project:
+        return gl.projects.get(project_id)
+
+    def process(project_id: int, mr_iid: int) -> str:
+        ctx = load_context(gl, project_id, mr_iid, get_project=get_project)
+        try:
+            succeeded = run_stage(stage, ctx)
+        except SystemExit:
+            # Стадии завершают процесс через exit(1), если изменений нет
+            return 'skipped'
+        return 'ok' if succeeded else 'failed'
+
+    with ThreadPoolExecutor(max_workers=settings.fleet_workers) as pool:
+        futures = {}
+        for project_id, mr_iid in expand_targets(gl, targets if targets is not None else settings.fleet_targets):
+            key = f'{project_id}:{mr_iid}'
+            if key not in done:
+                futures[pool.submit(process, project_id, mr_iid)] = key
+
+        logger.info(f'Стадия {stage} будет запущена для {len(futures)} MR в {settings.fleet_workers} потоков')
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                status = future.result()
+            except Exception as e:
+                logger.error(f'Ошибка при обработке {key}: {e}')
+                summary['failed'] += 1
+                continue
+
+            summary[status] += 1
+            if status == 'failed':
+                # Не выполненная стадия не попадает в прогресс и будет повторена при продолжении запуска
+                continue
+            with lock:
+                done.add(key)
+                save_checkpoint(checkpoint, done)
+
+    logger.info(f'Обработка завершена: {summary}')
+    if not summary['failed'] and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return summary
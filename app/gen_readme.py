@@ -1,12 +1,15 @@
-import datetime
-import re
-from typing import Dict, Any
+from io import StringIO
+from typing import Dict, Any, Optional, Tuple
 
 import gitlab
 from gitlab.v4.objects import Project, MergeRequest
 from ruamel.yaml import YAML
+from app.context import MergeRequestContext
+from app.render import render_markdown
+from app.sections import update_sections
 from config.settings import logger
-from controller.gitlab import create_commit, get_file, get_repository_tree
+from controller.async_gitlab import run_concurrently
+from controller.gitlab import create_commit, get_file, find_file, get_file_meta
 
 
 def is_new_readme(project: Project, branch) -> bool:
@@ -15,51 +18,34 @@ def is_new_readme(project: Project, branch) -> bool:
     """
     try:
         # Пытаемся получить информацию о файле
-        project.files.get(file_path='README.md', ref=branch)
-        return False
+        return get_file_meta(project, 'README.md', ref=branch) is None
 
-    except gitlab.GitlabGetError as e:
-        if e.response_code == 404:
-            return True
+    except gitlab.GitlabHeadError:
         raise  # Повторно вызываем исключение если это не 404 ошибка
     except Exception as e:
         print(f"Произошла ошибка: {str(e)}")
         return True
 
 
-def is_edited(mr: MergeRequest) -> bool:
-    """
-        Метод проверяет были ли изменения в файле README.yaml
-    """
-    changes = mr.changes()
-    files = [diff['new_path'] for diff in changes['changes']]
-    if '.helm/values-prod.yaml' in files:
-        return True
-    return False
-
-
 def get_yaml(project: Project, branch: str):
     """
         Метод получает сгенерированный на предыдущем этапе ямл
     """
     try:
-        tree = get_repository_tree(project, branch)
+        # Поиск файла README.yaml
+        file = find_file(project, branch, 'README.yaml')
     except Exception as e:
-        logger.error(f'Ошибка при получении дерева репозитория: {e}')
+        logger.error(f'Ошибка при поиске файла README.yaml: {e}')
         return None
 
-    # Поиск файла README.yaml
-    files = [i for i in tree if i.get('type') == 'blob' and re.search(r'README.yaml', i.get('name'))]
-
     yaml = {}
-    for file in files:
+    if file:
         try:
-            raw_file = get_file(project, file.get('path'), branch=branch)
+            raw_file = get_file(project, file.get('path'), branch=branch, blob_id=file.get('id'))
             if raw_file:
-                yaml = YAML(typ='safe', pure=True).load(raw_file) if file else None
+                yaml = YAML(typ='safe', pure=True).load(raw_file)
         except Exception as e:
             logger.error(f'Ошибка при загрузке файла {file.get("path")}: {e}')
-            continue
     return yaml
 
 
@@ -67,113 +53,9 @@ def yaml_to_markdown(yaml_data: Dict[str, Any]) -> str:
     """
         Преобразует данные из YAML в Markdown.
     """
-    markdown = "# Project Documentation\n"
-    markdown += f"### Дата формирования: {datetime.date.today().isoformat()}\n\n"
-
-    # Team
-    markdown += "## Team\n"
-    markdown += f"- **Name:** {yaml_data.get('team', {}).get('name', 'N/A')}\n\n"
-
-    # Links
-    markdown += "## Links\n"
-    markdown += f"- **Project Link:** [{yaml_data.get('link', 'N/A')}]({yaml_data.get('link', 'N/A')})\n"
-    markdown += f"- **Jira Project:** [{yaml_data.get('jira-project', 'N/A')}]({yaml_data.get('jira-project', 'N/A')})\n\n"
-
-    # Description
-    markdown += "## Description\n"
-    markdown += f"{yaml_data.get('description', 'N/A')}\n\n"
-
-    # Load Testing
-    markdown += "## Load Testing\n"
-    for test in yaml_data.get('load-testing', []):
-        markdown += f"- **Date:** {test.get('date', 'N/A')}\n"
-        markdown += f"- **Link:** [{test.get('link', 'N/A')}]({test.get('link', 'N/A')})\n"
-    markdown += "\n"
-
-    # Parameters
-    markdown += "## Parameters\n"
-    for param_type, params in yaml_data.get('parameters', {}).items():
-        markdown += f"### {param_type.capitalize()}\n"
-        markdown += generate_md_table_from_dicts(params)
-        markdown += "\n"
-    markdown += '# End\n'
-    return markdown
-
-
-def create_markdown_table(headers, rows, alignments=None):
-    """
-        Генерирует Markdown-таблицу.
-
-        Аргументы:
-            headers (list): Заголовки столбцов (например, ["Name", "Age"])
-            rows (list of lists): Данные таблицы (например, [["Alice", 25], ["Bob", 30]])
-            alignments (list): Выравнивание для каждого столбца (None = по умолчанию,
-                              варианты: "left", "center", "right")
-
-        Возвращает:
-            str: Готовая таблица в формате Markdown
-    """
-    # Проверка совпадения количества колонок
-    num_columns = len(headers)
-    for row in rows:
-        if len(row) != num_columns:
-            raise ValueError("Количество элементов в строке не совпадает с заголовками")
-
-    # Определение выравнивания
-    align_map = {
-        "left": ":---",
-        "center": ":---:",
-        "right": "---:"
-    }
-
-    if not alignments:
-        alignments = ["left"] * num_columns
-    elif len(alignments) != num_columns:
-        raise ValueError("Количество значений выравнивания должно совпадать с количеством колонок")
-
-    # Создание разделителя выравнивания
-    separator = "|".join([align_map.get(align, "---") for align in alignments])
-
-    # Сборка таблицы
-    table = []
-    # Заголовки
-    table.append("|".join(headers))
-    # Разделитель
-    table.append(f"|{separator}|")
-    # Данные
-    for row in rows:
-        table.append("|".join(map(str, row)))
-
-    return "\n".join(table)
-
-
-def generate_md_table_from_dicts(data_dicts, alignments=None):
-    """
-    Генерирует Markdown-таблицу из списка словарей
-
-    :param data_dicts: Список словарей с ключами 'name' и 'description'
-    :param alignments: Список выравниваний для колонок (по умолчанию: left)
-    :return: Готовая таблица в формате Markdown
-    """
-    # Проверка наличия обязательных ключей
-    required_keys = ['name', 'description']
-    for item in data_dicts:
-        if not all(key in item for key in required_keys):
-            raise ValueError("Словарь должен содержать ключи 'name' и 'description'")
-
-    # Формируем заголовки и данные
-    headers = ["Name", "Description"]
-    rows = [
-        [item['name'], item['description']]
-        for item in data_dicts
-    ]
-
-    # Настройки выравнивания по умолчанию
-    if not alignments:
-        alignments = ["left", "left"]
-
-    # Создаем таблицу
-    return create_markdown_table(headers, rows, alignments)
+    markdown = StringIO()
+    render_markdown(yaml_data, markdown)
+    return markdown.getvalue()
 
 
 def get_existing_readme(project: Project, branch):
@@ -181,80 +63,104 @@ def get_existing_readme(project: Project, branch):
         Метод получает текущее README.md для обновления
     """
     try:
-        tree = get_repository_tree(project, branch)
+        # Поиск файла README.md
+        file = find_file(project, branch, 'README.md', fallback=False)
     except Exception as e:
-        logger.error(f'Ошибка при получении дерева репозитория: {e}')
+        logger.error(f'Ошибка при поиске файла README.md: {e}')
         return None
 
-    # Поиск файла README.md
-    files = [i for i in tree if i.get('type') == 'blob' and re.search(r'README.md', i.get('name'))]
-
-    for file in files:
+    if file:
         try:
-            raw_file = get_file(project, file.get('path'), branch=branch)
-            if raw_file:
-                return raw_file
+            return get_file(project, file.get('path'), branch=branch, blob_id=file.get('id'))
         except Exception as e:
             logger.error(f'Ошибка при загрузке файла {file.get("path")}: {e}')
             return None
 
 
-def update_readme(old_markdown, new_markdown) -> str:
+def update_readme(old_markdown: str, new_markdown: str) -> str:
     """
         Метод должен обновляет блок сгенерированного текста независимо от положения в файле, сохраняя пользовательские данные
     """
-    start_pattern = r'#\s*Project\sDocumentation'
-    end_pattern = r'#\s*End'
-    updated_content = ''
-    pattern = rf'({start_pattern}.*?{end_pattern})'
-    match = re.search(pattern, old_markdown, flags=re.DOTALL)
-
-    if match:
-        old_section = match.group(1)
-        updated_content = old_markdown.replace(old_section, f"{new_markdown}")
-
-        logger.info("Документ успешно обновлен.")
+    updated_content, replaced = update_sections(old_markdown, new_markdown)
+    if replaced:
+        logger.info(f"Документ успешно обновлен. Обновлены блоки: {', '.join(replaced)}")
     else:
-        logger.info("Раздел '# Project Documentation ... # End' не найден.")
+        logger.info("Раздел '# Project Documentation ... # End' не найден. Добавляем его в конец документа.")
 
     return updated_content
 
 
-def create_markdown_file(project: Project, mr: MergeRequest):
+def build_markdown(ctx: MergeRequestContext, yaml_data: Optional[Dict[str, Any]] = None) -> Optional[Tuple[str, str]]:
     """
-        Создает Markdown-файл на основе данных из YAML-файла.
-        :param branch - source_branch из merge request
+        Метод формирует README.md в памяти.
+        Если yaml_data не передан, подготовленный ямл берётся из исходной ветки.
+        Возвращает действие для коммита (create/update) и текст README.md или None, если ямл или текущий README.md
+        не получен
     """
+    project, mr = ctx.project, ctx.mr
+
+    # Одновременно получаем признак нового README.md, текущий README.md из целевой ветки и, при необходимости, ямл
+    calls = [
+        (is_new_readme, project, mr.target_branch),
+        (get_existing_readme, project, mr.target_branch),
+    ]
+    if yaml_data is None:
+        calls.append((get_yaml, project, mr.source_branch))
+    new_readme, existing_markdown, *fetched = run_concurrently(*calls)
+    if fetched:
+        yaml_data = fetched[0]
+
+    if not yaml_data:
+        return None
 
-    if is_edited(mr):
-        # Получаем подготовленный ямл из исходной ветки
-        yaml_data = get_yaml(project, mr.source_branch)
-        if is_new_readme(project, mr.target_branch):
+    if new_readme:
+        # В целевой ветке README.md нет, но в исходной его мог уже создать предыдущий запуск
+        source_missing, source_markdown = run_concurrently(
+            (is_new_readme, project, mr.source_branch),
+            (get_existing_readme, project, mr.source_branch),
+        )
+        if source_missing:
             logger.info('README.md ненайден\nНачинаем генерацию нового')
-            try:
-                if yaml_data:
-                    # Преобразовываем yaml в markdown
-                    markdown_content = yaml_to_markdown(yaml_data)
-                    # Коммитим markdown в исходную ветку
-                    create_commit(project, mr.source_branch, 'README.md', 'create', markdown_content)
-            except Exception as e:
-                logger.info(f"Ошибка при создании Markdown-файла: {e}")
-        else:
-            logger.info('README.md ненайден\nВносим изменения в текущий документ')
-            try:
-                if yaml_data:
-                    # Получаем текст текущего файла
-                    existing_markdown = get_existing_readme(project, mr.target_branch)
-                    # Получаем текст обновленный вариант
-                    new_markdown = yaml_to_markdown(yaml_data)
-                    # Обновляем текст текущего файла
-                    markdown_content = update_readme(existing_markdown, new_markdown)
-                    # Коммитим изменения
-                    create_commit(project, mr.source_branch, 'README.md', 'update', markdown_content)
-            except Exception as e:
-                logger.info(f"Ошибка при обновлении Markdown-файла: {e}")
+            # Преобразовываем yaml в markdown
+            return 'create', yaml_to_markdown(yaml_data)
+        if source_markdown is None:
+            logger.error(f'README.md ветки {mr.source_branch} найден, но не прочитан, README.md не изменён')
+            return None
+        logger.info(f'README.md уже создан в ветке {mr.source_branch}\nВносим изменения в него')
+        return 'update', update_readme(source_markdown, yaml_to_markdown(yaml_data))
+
+    if existing_markdown is None:
+        # Без текущего текста обновлённый README.md состоял бы из одного сгенерированного раздела
+        logger.error('README.md найден, но не прочитан, README.md не изменён')
+        return None
 
-            logger.info(f"Файл README успешно создан")
+    logger.info('README.md найден\nВносим изменения в текущий документ')
+    # Обновляем текст текущего файла
+    return 'update', update_readme(existing_markdown, yaml_to_markdown(yaml_data))
+
+
+def create_markdown_file(ctx: MergeRequestContext) -> bool:
+    """
+        Создает Markdown-файл на основе данных из YAML-файла.
+        Возвращает True, только если README.md сформирован и закоммичен (или не изменился).
+        Ошибка записывается в лог, а стадия возвращает False: такой запуск не попадёт в журнал и будет повторён
+        :param ctx - контекст merge request
+    """
+    if ctx.is_values_changed():
+        try:
+            result = build_markdown(ctx)
+            if not result:
+                logger.error("Markdown-файл не сформирован")
+                return False
+            # Коммитим markdown в исходную ветку
+            action, markdown_content = result
+            create_commit(ctx.project, ctx.mr.source_branch, 'README.md', action, markdown_content)
+        except Exception as e:
+            logger.error(f"Ошибка при формировании Markdown-файла: {e}")
+            return False
+
+        logger.info(f"Файл README успешно создан")
+        return True
     else:
         logger.info("Изменения отсутствуют")
         exit(1)
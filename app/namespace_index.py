@@ -0,0 +1,141 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from config.settings import logger, settings
+from controller.parameter_db import Row, get_parameter_db
+
+if TYPE_CHECKING:
+    from gitlab import Gitlab
+    from gitlab.v4.objects import Project
+
+# Проект namespace: (id, путь, ветка по умолчанию или None для пустого репозитория)
+NamespaceProject = Tuple[int, str, Optional[str]]
+
+
+def list_projects(gl: 'Gitlab') -> Iterator[NamespaceProject]:
+    """
+        Метод обходит все проекты группы settings.namespace, включая подгруппы
+    """
+    group = gl.groups.get(settings.namespace)
+    for project in group.projects.list(include_subgroups=True, archived=False, simple=True, iterator=True):
+        yield project.id, project.path_with_namespace, project.default_branch
+
+
+def get_head(gl: 'Gitlab', project_id: int, branch: str) -> str:
+    return gl.projects.get(project_id, lazy=True).branches.get(branch).commit['id']
+
+
+def get_descriptions(project: 'Project', head_sha: str) -> Dict[Tuple[str, str], str]:
+    """
+        Метод возвращает описания параметров из README.yaml в корне репозитория: {(раздел, имя): описание}.
+        Обход дерева в поисках README.yaml в другом каталоге для каждого проекта namespace обошёлся бы дорого.
+        Файл читается C-парсером: он на порядок быстрее чистого Python, а нужны из файла только строки описаний
+    """
+    from ruamel.yaml import YAML
+
+    from app.parameters import DEFAULT_DESCRIPTION
+    from controller.gitlab import find_file, open_file
+
+    file = find_file(project, head_sha, 'README.yaml', fallback=False)
+    if not file:
+        return {}
+    with open_file(project, file['path'], head_sha, file.get('id')) as stream:
+        if stream is None:
+            raise ValueError(f'не удалось прочитать {file["path"]}')
+        config = YAML(typ='safe').load(stream)
+
+    descriptions = {}
+    sections = (config.get('parameters') if isinstance(config, dict) else None) or {}
+    for kind, entries in sections.items():
+        for entry in entries if isinstance(entries, list) else []:
+            if isinstance(entry, dict) and entry.get('description') not in (None, DEFAULT_DESCRIPTION):
+                descriptions[(kind, entry.get('name'))] = str(entry['description'])
+    return descriptions
+
+
+def index_project(gl: 'Gitlab', project_id: int, head_sha: str) -> List[Row]:
+    """
+        Метод собирает параметры всех values-prod.yaml проекта и их описания из README.yaml.
+        Файлы читаются по head SHA, а не по имени ветки: результат соответствует SHA, записанному в индекс,
+        даже если в ветку успели запушить
+    """
+    # Модули стадий импортируются только при обновлении индекса: поиск (LOOKUP) работает с одним SQLite
+    from app.parameters import collect_parameters
+
+    project = gl.projects.get(project_id, lazy=True)
+    parameters = collect_parameters(project, head_sha)
+    if parameters is None:
+        raise ValueError('не удалось прочитать values-prod.yaml')
+    descriptions = get_descriptions(project, head_sha)
+
+    return [(service, kind, name, descriptions.get((kind, name)))
+            for service, kinds in parameters.services.items()
+            for kind, names in kinds.items()
+            for name in names]
+
+
+def refresh_index(gl: 'Gitlab') -> Optional[dict]:
+    """
+        Метод обновляет индекс параметров namespace. Для каждого проекта запрашивается head SHA ветки по умолчанию,
+        values-prod.yaml и README.yaml перечитываются только у проектов, где он изменился.
+        Проекты обрабатываются в index_workers потоков, запись в индекс идёт из одного потока по мере готовности.
+        Проекты, которых больше нет в namespace (удалены, архивированы), убираются из индекса
+    """
+    db = get_parameter_db()
+    if not db:
+        return None
+    known = db.heads()
+    projects = list(list_projects(gl))
+    logger.info(f'Проектов в namespace {settings.namespace}: {len(projects)}, в индексе: {len(known)}')
+
+    def process(project_id: int, branch: Optional[str]) -> Optional[Tuple[Optional[str], List[Row]]]:
+        head_sha = get_head(gl, project_id, branch) if branch else None
+        if project_id in known and known[project_id] == head_sha:
+            return None
+        return head_sha, index_project(gl, project_id, head_sha) if head_sha else []
+
+    summary = {'indexed': 0, 'unchanged': 0, 'failed': 0, 'removed': 0}
+    with ThreadPoolExecutor(max_workers=settings.index_workers) as pool:
+        futures = {pool.submit(process, project_id, branch): (project_id, path)
+                   for project_id, path, branch in projects}
+        for future in as_completed(futures):
+            project_id, path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # Прежние данные проекта остаются в индексе, SHA не обновляется - проект перечитается в следующий раз
+                logger.error(f'Ошибка при индексации проекта {path}: {e}')
+                summary['failed'] += 1
+                continue
+            if result is None:
+                summary['unchanged'] += 1
+                continue
+            head_sha, rows = result
+            db.replace_project(project_id, path, head_sha, rows)
+            logger.debug(f'Проект {path} проиндексирован: {len(rows)} параметров')
+            summary['indexed'] += 1
+
+    removed = set(known) - {project_id for project_id, _, _ in projects}
+    if removed:
+        db.remove_projects(removed)
+        summary['removed'] = len(removed)
+
+    logger.info(f'Индекс параметров обновлён: {summary}')
+    return summary
+
+
+def print_lookup(query: str, kind: Optional[str] = None):
+    """
+        Метод выводит проекты и сервисы, в которых используется параметр: по строке на сервис,
+        поля разделены табуляцией (проект, сервис, раздел, имя, описание)
+    """
+    db = get_parameter_db()
+    if not db:
+        return
+    start = time.perf_counter()
+    rows = db.search(query, kind)
+    elapsed = time.perf_counter() - start
+    for row in rows:
+        print('\t'.join([row['project'], row['service'], row['kind'], row['name'], row['description'] or '']))
+    logger.info(f'Найдено: {len(rows)} за {elapsed * 1000:.2f} мс')
@@ -0,0 +1,286 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections.abc import Set
+from typing import BinaryIO, Dict, Iterable, KeysView, List, Optional, Tuple
+
+from gitlab.v4.objects import Project
+
+from app.context import HELM_DIR, VALUES_FILE_NAME
+from app.values_parser import (
+    Node,
+    extract_file_parameters,
+    extract_file_trees,
+    extract_parameters,
+    extract_trees,
+    merge_nodes,
+    node_names,
+)
+from config.settings import logger, settings
+from controller.async_gitlab import run_concurrently
+from controller.gitlab import get_repository_tree, open_file
+
+DEFAULT_DESCRIPTION = '<DESCRIPTION>'
+
+# Параллельный разбор в процессах окупается только на больших файлах
+PARALLEL_PARSE_MIN_SIZE = 1024 * 1024
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+class ParameterIndex:
+    """
+        Параметры values-prod.yaml всех сервисов: {сервис: {раздел: {имя: None}}}.
+        Порядок параметров сохраняется в порядке появления, повторы из разных файлов объединяются.
+        Если файлы разобраны в хэш-деревья (merge_trees), они доступны в trees: {сервис: {раздел: Node}}
+    """
+
+    def __init__(self, kinds: Iterable[str]):
+        self.kinds = list(kinds)
+        self.services: Dict[str, Dict[str, Dict[str, None]]] = {}
+        self.trees: Dict[str, Dict[str, Node]] = {}
+        self._names: Dict[str, Dict[str, None]] = {}
+
+    def merge(self, parsed: Dict[str, Dict[str, List[str]]]):
+        """
+            Метод добавляет результат разбора одного файла values
+        """
+        for service, kinds in parsed.items():
+            indexed = self.services.setdefault(service, {kind: {} for kind in self.kinds})
+            for kind, names in kinds.items():
+                indexed.setdefault(kind, {}).update(dict.fromkeys(names))
+                self._names.setdefault(kind, {}).update(dict.fromkeys(names))
+
+    def merge_trees(self, parsed: Dict[str, Dict[str, Node]]):
+        """
+            Метод добавляет хэш-деревья разделов одного файла values, имена параметров берутся из их ключей
+        """
+        for service, kinds in parsed.items():
+            trees = self.trees.setdefault(service, {})
+            for kind, node in kinds.items():
+                trees[kind] = merge_nodes(trees[kind], node) if kind in trees else node
+        self.merge({service: {kind: node_names(node) for kind, node in kinds.items()}
+                    for service, kinds in parsed.items()})
+
+    def keys(self, kind: str) -> KeysView:
+        """
+            Метод возвращает имена параметров раздела по всем сервисам без копирования: порядок и проверка вхождения за O(1)
+        """
+        return self._names.get(kind, {}).keys()
+
+    def names(self, kind: str, service: Optional[str] = None) -> List[str]:
+        """
+            Метод возвращает имена параметров раздела одного сервиса или объединение по всем сервисам
+        """
+        if service is not None:
+            return list(self.services.get(service, {}).get(kind, {}))
+        return list(self._names.get(kind, {}))
+
+    def __contains__(self, item) -> bool:
+        kind, name = item
+        return name in self._names.get(kind, {})
+
+    def __bool__(self) -> bool:
+        return bool(self.services)
+
+
+class ParameterStore:
+    """
+        Параметры одного раздела README.yaml с доступом по имени.
+        Порядок записей и пользовательские описания сохраняются. Добавление, удаление и переименование выполняются за O(1):
+        удалённые записи помечаются пустыми и вычищаются один раз в to_list()
+    """
+
+    def __init__(self, entries: Iterable[dict] = ()):
+        self._entries: List[Optional[dict]] = []
+        self._positions: Dict[str, int] = {}
+        for entry in entries:
+            name = entry.get('name') if isinstance(entry, dict) else None
+            if name is not None and name in self._positions:
+                continue
+            if name is not None:
+                self._positions[name] = len(self._entries)
+            self._entries.append(entry)
+
+    def __contains__(self, name) -> bool:
+        return name in self._positions
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def get(self, name) -> Optional[dict]:
+        position = self._positions.get(name)
+        return self._entries[position] if position is not None else None
+
+    def add(self, name, description: str = DEFAULT_DESCRIPTION) -> bool:
+        if name in self._positions:
+            return False
+        self._positions[name] = len(self._entries)
+        self._entries.append({'name': name, 'description': description})
+        return True
+
+    def remove(self, name) -> bool:
+        position = self._positions.pop(name, None)
+        if position is None:
+            return False
+        self._entries[position] = None
+        return True
+
+    def rename(self, old_name, new_name) -> bool:
+        """
+            Метод переименовывает параметр на месте, сохраняя его описание
+        """
+        if old_name not in self._positions or new_name in self._positions:
+            return False
+        position = self._positions.pop(old_name)
+        self._positions[new_name] = position
+        self._entries[position] = {**self._entries[position], 'name': new_name}
+        return True
+
+    def names(self) -> KeysView:
+        return self._positions.keys()
+
+    def to_list(self) -> List[dict]:
+        return [entry for entry in self._entries if entry is not None]
+
+
+def load_stores(config: dict, kinds: Iterable[str]) -> Dict[str, ParameterStore]:
+    """
+        Метод строит хранилища по всем разделам README.yaml: проверяемым и уже присутствующим в файле
+    """
+    parameters = config.get('parameters') or {}
+    return {kind: ParameterStore(parameters.get(kind) or []) for kind in dict.fromkeys([*kinds, *parameters])}
+
+
+def dump_stores(config: dict, stores: Dict[str, ParameterStore]) -> dict:
+    config['parameters'] = {kind: store.to_list() for kind, store in stores.items()}
+    return config
+
+
+def diff_names(old: Iterable, new: Iterable) -> Tuple[list, list]:
+    """
+        Метод возвращает добавленные и удалённые имена в исходном порядке.
+        Множества и KeysView используются как есть, из остальных коллекций один раз строится индекс
+    """
+    old_index = old if isinstance(old, Set) else dict.fromkeys(old)
+    new_index = new if isinstance(new, Set) else dict.fromkeys(new)
+    added = [name for name in new_index if name not in old_index]
+    removed = [name for name in old_index if name not in new_index]
+    return added, removed
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+        Метод возвращает пул процессов для разбора больших файлов. Пул создаётся из рабочих потоков, пока работают
+        HTTP-запросы и логирование: fork скопировал бы захваченные другими потоками блокировки, поэтому процессы
+        запускаются через spawn
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=settings.parse_workers,
+                                              mp_context=multiprocessing.get_context('spawn'))
+        return _parse_pool
+
+
+def stream_size(stream: BinaryIO) -> int:
+    if isinstance(stream, io.BytesIO):
+        return len(stream.getbuffer())
+    return os.fstat(stream.fileno()).st_size
+
+
+def load_values(project: Project, file_path: str, branch: str, blob_id: Optional[str], kinds: List[str],
+                parallel: bool, trees: bool = False) -> Optional[dict]:
+    """
+        Метод скачивает и разбирает один файл values. Содержимое передаётся в парсер потоком, без декодирования в строку.
+        Большие файлы при parallel=True разбираются в пуле процессов: файл на диске передаётся туда по пути.
+        При trees=True вместо имён параметров строятся хэш-деревья разделов.
+        Возвращает None, если файл не получен или не разобран
+    """
+    extract, extract_file = (extract_trees, extract_file_trees) if trees else \
+        (extract_parameters, extract_file_parameters)
+    try:
+        with open_file(project, file_path, branch, blob_id) as stream:
+            if stream is None:
+                return None
+            if not parallel or stream_size(stream) < PARALLEL_PARSE_MIN_SIZE:
+                return extract(stream, kinds)
+            if isinstance(stream, io.BytesIO):
+                return get_parse_pool().submit(extract, stream.getvalue(), kinds).result()
+            return get_parse_pool().submit(extract_file, stream.name, kinds).result()
+    except Exception as e:
+        logger.error(f'Ошибка при разборе файла {file_path}: {e}')
+        return None
+
+
+class ParseCache:
+    """
+        Общие результаты разбора файлов values по SHA blob для веток одного сравнения.
+        Неизменённый в MR файл разбирается один раз, даже если обе ветки читают его одновременно:
+        второй поток дожидается результата первого. Результаты разбора не изменяются после возврата,
+        поэтому их можно отдавать нескольким ParameterIndex
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures: Dict[Tuple[str, bool], Future] = {}
+
+    def load(self, project: Project, file_path: str, branch: str, blob_id: Optional[str], kinds: List[str],
+             parallel: bool, trees: bool = False) -> Optional[dict]:
+        if blob_id is None:
+            return load_values(project, file_path, branch, blob_id, kinds, parallel, trees)
+        with self._lock:
+            future = self._futures.get((blob_id, trees))
+            owner = future is None
+            if owner:
+                future = self._futures[(blob_id, trees)] = Future()
+        if not owner:
+            return future.result()
+        try:
+            result = load_values(project, file_path, branch, blob_id, kinds, parallel, trees)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+
+def collect_parameters(project: Project, branch: str, trees: bool = False,
+                       cache: Optional[ParseCache] = None) -> Optional[ParameterIndex]:
+    """
+        Метод собирает параметры из всех файлов values-prod.yaml в каталоге .helm ветки.
+        Файлы скачиваются и разбираются одновременно, поэтому время сбора близко ко времени самого медленного файла.
+        trees=True дополнительно строит хэш-деревья разделов для сравнения значений (app.values_diff),
+        cache позволяет не разбирать повторно файлы, общие с другой веткой
+    """
+    try:
+        tree = get_repository_tree(project, branch, path=HELM_DIR)
+    except Exception as e:
+        logger.error(f'Ошибка при получении дерева репозитория: {e}')
+        return None
+
+    # Поиск файлов values-prod.yaml
+    files = [i for i in tree or [] if i.get('type') == 'blob' and i.get('name') == VALUES_FILE_NAME]
+    logger.info(f'Найдено файлов {VALUES_FILE_NAME}: {len(files)}')
+
+    kinds = settings.list_of_checked_paremeters
+    # Несколько больших файлов разбираются в пуле процессов
+    parallel = len(files) > 1 and settings.parse_workers > 1
+    load = cache.load if cache else load_values
+    parsed_files = run_concurrently(*[(load, project, file.get('path'), branch, file.get('id'), kinds, parallel, trees)
+                                      for file in files])
+
+    index = ParameterIndex(kinds)
+    for file, parsed in zip(files, parsed_files):
+        if parsed is None:
+            # Без одного из файлов часть параметров выглядела бы удалённой
+            logger.error(f'Ошибка при загрузке файла {file.get("path")}')
+            return None
+        if trees:
+            index.merge_trees(parsed)
+        else:
+            index.merge(parsed)
+    return index
@@ -1,9 +1,21 @@
-import re
+from typing import Dict, List, Optional, Tuple
 import gitlab.exceptions
 from gitlab.v4.objects import Project, MergeRequest
+from app.context import MergeRequestContext
+from app.parameters import (
+    DEFAULT_DESCRIPTION,
+    ParameterIndex,
+    ParseCache,
+    collect_parameters,
+    diff_names,
+    dump_stores,
+    load_stores,
+)
+from app.values_diff import diff_services, log_diff
 from config.settings import logger, settings
 from ruamel.yaml import YAML, StringIO
-from controller.gitlab import get_gitlab, get_repository_tree, get_file, create_commit
+from controller.async_gitlab import run_concurrently
+from controller.gitlab import CommitConflictError, get_gitlab, get_file, create_commit, find_file, get_file_meta
 
 
 def is_new_readme(project: Project, branch) -> bool:
@@ -12,53 +24,25 @@ def is_new_readme(project: Project, branch) -> bool:
     """
     try:
         # Пытаемся получить информацию о файле
-        project.files.get(file_path='README.yaml', ref=branch)
-        return True
+        return get_file_meta(project, 'README.yaml', ref=branch) is not None
 
-    except gitlab.GitlabGetError as e:
-        if e.response_code == 404:
-            return False
+    except gitlab.GitlabHeadError:
         raise  # Повторно вызываем исключение если это не 404 ошибка
     except Exception as e:
         print(f"Произошла ошибка: {str(e)}")
         return False
 
 
-def get_parameters(project: Project, branch: str) -> list:
+def get_parameters(project: Project, branch: str, trees: bool = False,
+                   cache: Optional[ParseCache] = None) -> Optional[ParameterIndex]:
     """
-        Метод получает список параметров values-prod.yaml
+        Метод получает параметры из всех values-prod.yaml ветки
     """
-    result = []
     logger.info(f'Начата генерация readme для проекта: {project.name} из ветки {branch}')
+    return collect_parameters(project, branch, trees, cache)
 
-    try:
-        tree = get_repository_tree(project, branch, path='.helm')
-    except Exception as e:
-        logger.error(f'Ошибка при получении дерева репозитория: {e}')
-        return None
-
-    # Поиск файлов values-prod.yaml
-    files = [i for i in tree if i.get('type') == 'blob' and re.search(r'values-prod.yaml', i.get('name'))]
-
-    config = {}
-    for file in files:
-        try:
-            raw_file = get_file(project, file.get('path'), branch=branch)
-            if raw_file:
-                config = YAML(typ='safe', pure=True).load(raw_file)
-        except Exception as e:
-            logger.error(f'Ошибка при загрузке файла {file.get("path")}: {e}')
-            continue
-
-    # Сбор параметров configmap и secret
-    for service, values in config.items():
-        for parameter in ['configmap', 'secret']:
-            result.append(list(values[parameter].keys()))
-
-    return result
 
-
-def prepare_yaml(parameters: list) -> dict:
+def prepare_yaml(parameters: ParameterIndex) -> dict:
     """
     Метод формирует словарь на основе шаблона result
     """
@@ -82,87 +66,109 @@ def prepare_yaml(parameters: list) -> dict:
         }
     }
 
-    # Заполняем configmap
-    for param in parameters[0]:
-        result['parameters']['configmap'].append({
-            'name': param,
-            'description': '<DESCRIPTION>'
-        })
-
-    # Заполняем secret
-    for param in parameters[1]:
-        result['parameters']['secret'].append({
-            'name': param,
-            'description': '<DESCRIPTION>'
-        })
+    # Заполняем configmap, secret и прочие проверяемые разделы
+    for kind in parameters.kinds:
+        result['parameters'].setdefault(kind, []).extend(
+            {'name': param, 'description': DEFAULT_DESCRIPTION} for param in parameters.keys(kind)
+        )
 
     return result
 
 
-def is_edited(mr: MergeRequest) -> bool:
-    """
-        Метод проверяет были ли изменения в файле values_prod.yaml
-    """
-    changes = mr.changes()
-    files = [diff['new_path'] for diff in changes['changes']]
-    if '.helm/values-prod.yaml' in files:
-        return True
-    return False
-
-
 def compare_configs(dev_parameters, feature_parameters) -> tuple[list, list]:
     """
         Метод принимает два списка параметров и возвращает кортеж из добавленных и удалённых параметров
     """
-    dev = set(dev_parameters)
-    feature = set(feature_parameters)
-    added = list(feature - dev)  # Элементы, которые есть в list2, но нет в list1
-    removed = list(dev - feature)  # Элементы, которые есть в list1, но нет в list2
-    return added, removed
+    return diff_names(dev_parameters, feature_parameters)
 
 
-def update_yaml(project:Project, branch:str, added_cfgm, removed_cfgm, added_sec, removed_sec) -> dict:
+def compare_values(dev_params: ParameterIndex, feature_params: ParameterIndex) -> Dict[str, Tuple[list, list, list]]:
     """
-        Получаем существующий ямл и вносим изменения на основе added и removed параметров
-        Это плохая функция, её стоит бы переписать, но лучше идей у меня нет
+        Метод сравнивает values-prod.yaml веток по хэш-деревьям и возвращает изменения каждого раздела README.yaml:
+        добавленные, удалённые и переименованные параметры.
+        Переименованием считается ключ верхнего уровня, который в каком-либо сервисе сменил имя при прежнем значении,
+        если старое имя пропало из всех сервисов, а новое раньше не встречалось ни в одном
+    """
+    diffs = diff_services(dev_params.trees, feature_params.trees, settings.list_of_checked_paremeters)
+    log_diff(diffs)
+
+    changes = {}
+    for kind in settings.list_of_checked_paremeters:
+        added, removed = compare_configs(dev_params.keys(kind), feature_params.keys(kind))
+        added_names, removed_names = set(added), set(removed)
+        renamed: Dict[str, str] = {}
+        for diff in diffs.values():
+            for (old_kind, *old_key), (_, *new_key) in diff.renamed:
+                if old_kind != kind or len(old_key) != 1:
+                    continue
+                old_name, new_name = old_key[0], new_key[0]
+                # Каждое имя участвует не больше чем в одном переименовании
+                if old_name in removed_names and new_name in added_names:
+                    renamed[old_name] = new_name
+                    removed_names.discard(old_name)
+                    added_names.discard(new_name)
+        changes[kind] = (
+            [name for name in added if name in added_names],
+            [name for name in removed if name in removed_names],
+            list(renamed.items()),
+        )
+    return changes
+
+
+def get_readme_yaml(project: Project, branch: str) -> Optional[dict]:
+    """
+        Метод получает существующий README.yaml ветки.
+        Возвращает пустой словарь, если файла нет, и None, если файл есть, но прочитать его не удалось
     """
-    logger.info('Обновляем ямл')
-    #Получаем ямл который есть в основной ветка
     try:
-        tree = get_repository_tree(project, branch, path='.')
+        # Поиск файла README.yaml
+        file = find_file(project, branch, 'README.yaml')
     except Exception as e:
-        logger.error(f'Ошибка при получении дерева репозитория: {e}')
+        logger.error(f'Ошибка при поиске файла README.yaml: {e}')
         return None
-    # Поиск файлов README.yaml
-    files = [i for i in tree if i.get('type') == 'blob' and re.search(r'README.yaml', i.get('name'))]
 
     config = {}
-    for file in files:
+    if file:
         try:
-            raw_file = get_file(project, file.get('path'), branch=branch)
-            if raw_file:
-                config = YAML(typ='safe', pure=True).load(raw_file)
+            raw_file = get_file(project, file.get('path'), branch=branch, blob_id=file.get('id'))
+            if raw_file is None:
+                logger.error(f'Файл {file.get("path")} не получен')
+                return None
+            config = YAML(typ='safe', pure=True).load(raw_file) or {}
         except Exception as e:
             logger.error(f'Ошибка при загрузке файла {file.get("path")}: {e}')
-            continue
-
-    #Добавляем новые параметры
-    for parameter in added_cfgm:
-        config['parameters']['configmap'].append({'name': parameter, 'description': '<DESCRIPTION>'})
-    for parameter in added_sec:
-        config['parameters']['secret'].append({'name': parameter, 'description': '<DESCRIPTION>'})
-
-    #Удаляем старые параметры
-    for line in config['parameters']['configmap']:
-        if line.get('name') in removed_cfgm:
-            config['parameters']['configmap'].remove(line)
-    for line in config['parameters']['secret']:
-        if line.get('name') in removed_sec:
-            config['parameters']['secret'].remove(line)
-
+            return None
     return config
 
 
+def update_yaml(config: dict, changes: Dict[str, Tuple[list, list, List[Tuple[str, str]]]]) -> dict:
+    """
+        Вносим в существующий ямл изменения на основе added, removed и renamed параметров каждого раздела.
+        Описания оставшихся и переименованных параметров и их порядок сохраняются
+    """
+    logger.info('Обновляем ямл')
+    if not config:
+        logger.warning('Существующий README.yaml пуст, формируем его по шаблону')
+        config = prepare_yaml(ParameterIndex(settings.list_of_checked_paremeters))
+
+    stores = load_stores(config, changes)
+    for kind, (added, removed, renamed) in changes.items():
+        store = stores[kind]
+        #Переименовываем параметры на месте. Если старого имени нет в README.yaml или новое уже есть - удаляем и добавляем
+        for old_name, new_name in renamed:
+            if not store.rename(old_name, new_name):
+                store.remove(old_name)
+                store.add(new_name)
+        #Удаляем старые параметры
+        for parameter in removed:
+            store.remove(parameter)
+        #Добавляем новые параметры
+        for parameter in added:
+            store.add(parameter)
+
+    return dump_stores(config, stores)
+
+
 def save_yaml(parameters: dict):
     """
         Метод генерирует ямл на основе словаря и сохраняет в yaml_str
@@ -177,29 +183,83 @@ def save_yaml(parameters: dict):
     return yaml_str
 
 
-def gen_yaml(project:Project, mr:MergeRequest):
-    if not is_new_readme(project, mr.targer_brunch):
+def complete_yaml(config: dict, parameters: ParameterIndex, branch: str) -> Optional[Tuple[str, dict]]:
+    """
+        Метод дополняет README.yaml, уже созданный в ветке MR предыдущим запуском, недостающими параметрами.
+        Заполненные разработчиком описания и параметры, которых нет в values, не трогаются.
+        Возвращает None, если добавлять нечего
+    """
+    logger.info(f'README.yaml уже создан в ветке {branch}, дополняем его')
+    stores = load_stores(config, parameters.kinds)
+    changes = {
+        kind: ([name for name in parameters.keys(kind) if name not in stores[kind]], [], [])
+        for kind in parameters.kinds
+    }
+    if not any(added for added, _, _ in changes.values()):
+        return None
+    return 'update', update_yaml(config, changes)
+
+
+def build_yaml(ctx: MergeRequestContext) -> Optional[Tuple[str, dict]]:
+    """
+        Метод формирует README.yaml в памяти.
+        Возвращает действие для коммита (create/update) и словарь README.yaml или None, если изменений нет
+    """
+    project, mr = ctx.project, ctx.mr
+    readme_exists, edited = run_concurrently(
+        (is_new_readme, project, mr.target_branch),
+        (ctx.is_values_changed,),
+    )
+    if not readme_exists:
         logger.info("Файл README.yaml не найден, генерируем новый")
-        yaml_to_save = save_yaml(prepare_yaml(get_parameters(project, mr.targer_brunch)))
-        create_commit(project, mr.source_branch, 'README.yaml', 'create', yaml_to_save)
-    else:
-        logger.info("Файл README.yaml найден")
-        if is_edited(mr):
-            #Получаем параметры values-prod из dev и feature веток
-            dev_params = get_parameters(project, mr.targer_brunch)
-            feature_params = get_parameters(project, mr.source_branch)
-
-            #находим разницу для конфигов
-            configmap_added, configmap_removed = compare_configs(dev_params[0], feature_params[0])
-            secret_added, secret_removed = compare_configs(dev_params[1], feature_params[1])
-
-            #обновляем существующий ямл
-            config = update_yaml(project, mr.targer_brunch, configmap_added, configmap_removed, secret_added, secret_removed)
-
-            #коммитим
-            yaml_to_save = save_yaml(config)
-            create_commit(project, mr.source_branch, 'README.yaml', 'update', yaml_to_save)
-            logger.info('YAML успешно создан')
-        else:
-            logger.info("Изменения отсутствую")
-            exit(1)
+        parameters, source_config = run_concurrently(
+            (get_parameters, project, mr.target_branch),
+            (get_readme_yaml, project, mr.source_branch),
+        )
+        if parameters is None or source_config is None:
+            logger.error(f'Не удалось получить параметры ветки {mr.target_branch} или README.yaml ветки '
+                         f'{mr.source_branch}, README.yaml не сформирован')
+            return None
+        if not source_config:
+            return 'create', prepare_yaml(parameters)
+        return complete_yaml(source_config, parameters, mr.source_branch)
+
+    logger.info("Файл README.yaml найден")
+    if not edited:
+        return None
+
+    #Получаем параметры values-prod из dev и feature веток и ямл из основной ветки одновременно.
+    #Файлы values, не изменённые в MR, разбираются один раз на обе ветки
+    cache = ParseCache()
+    dev_params, feature_params, config = run_concurrently(
+        (get_parameters, project, mr.target_branch, True, cache),
+        (get_parameters, project, mr.source_branch, True, cache),
+        (get_readme_yaml, project, mr.target_branch),
+    )
+    # Неполные данные дали бы ложные удаления параметров и потерю описаний - такой README.yaml не коммитим
+    if dev_params is None or feature_params is None or config is None:
+        logger.error('Не удалось получить параметры values-prod.yaml или README.yaml, README.yaml не изменён')
+        return None
+
+    #находим разницу для конфигов
+    changes = compare_values(dev_params, feature_params)
+
+    #обновляем существующий ямл
+    return 'update', update_yaml(config, changes)
+
+
+def gen_yaml(ctx: MergeRequestContext) -> bool:
+    result = build_yaml(ctx)
+    if not result:
+        logger.info("Изменения отсутствую")
+        exit(1)
+
+    #коммитим
+    action, config = result
+    try:
+        create_commit(ctx.project, ctx.mr.source_branch, 'README.yaml', action, save_yaml(config))
+    except CommitConflictError as e:
+        logger.error(f'README.yaml не закоммичен: {e}')
+        return False
+    logger.info('YAML успешно создан')
+    return True
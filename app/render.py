@@ -0,0 +1,62 @@
+import datetime
+import os
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Tuple, TextIO
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template
+
+from config.settings import settings
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+README_TEMPLATE = 'README.md.j2'
+
+
+@lru_cache(maxsize=None)
+def get_environment() -> Environment:
+    """
+        Окружение jinja2 создаётся один раз на процесс, скомпилированные шаблоны кэшируются в нём.
+        Каталог из settings.readme_templates_dir проверяется раньше встроенного, так можно подменить разметку
+    """
+    search_path = [TEMPLATES_DIR]
+    if settings.readme_templates_dir:
+        search_path.insert(0, str(settings.readme_templates_dir))
+    return Environment(
+        loader=FileSystemLoader(search_path),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        keep_trailing_newline=True,
+        auto_reload=False,
+        undefined=StrictUndefined,
+    )
+
+
+def get_template(name: str = README_TEMPLATE) -> Template:
+    return get_environment().get_template(name)
+
+
+def _rows(params: List[Dict[str, Any]]) -> Iterator[Tuple[Any, Any]]:
+    # Строки таблицы отдаются по одной, чтобы не собирать промежуточные списки
+    for item in params:
+        if 'name' not in item or 'description' not in item:
+            raise ValueError("Словарь должен содержать ключи 'name' и 'description'")
+        yield item['name'], item['description']
+
+
+def get_context(yaml_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'date': datetime.date.today().isoformat(),
+        'team_name': yaml_data.get('team', {}).get('name', 'N/A'),
+        'link': yaml_data.get('link', 'N/A'),
+        'jira_project': yaml_data.get('jira-project', 'N/A'),
+        'description': yaml_data.get('description', 'N/A'),
+        'load_testing': yaml_data.get('load-testing', []),
+        'parameters': ((param_type, _rows(params)) for param_type, params in yaml_data.get('parameters', {}).items()),
+    }
+
+
+def render_markdown(yaml_data: Dict[str, Any], writer: TextIO):
+    """
+        Метод рендерит README.md по шаблону и пишет результат в writer по частям, не собирая документ в памяти
+    """
+    for chunk in get_template().generate(**get_context(yaml_data)):
+        writer.write(chunk)
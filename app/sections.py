@@ -0,0 +1,108 @@
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Весь сгенерированный документ: от '# Project Documentation' до '# End'
+DOCUMENT = 'document'
+DOCUMENT_START = re.compile(r'#\s*Project\s+Documentation')
+DOCUMENT_END = re.compile(r'#\s*End')
+
+# Именованные блоки внутри документа, например таблица одного раздела параметров
+BLOCK_START = re.compile(r'<!--\s*readme-generator:begin\s+(\S+)\s*-->')
+BLOCK_END = re.compile(r'<!--\s*readme-generator:end\s+(\S+)\s*-->')
+
+
+class Section(NamedTuple):
+    name: str
+    start: int  # смещение начала строки открывающего маркера
+    end: int  # смещение сразу после строки закрывающего маркера
+    depth: int
+
+
+def begin_marker(name: str) -> str:
+    return f'<!-- readme-generator:begin {name} -->'
+
+
+def end_marker(name: str) -> str:
+    return f'<!-- readme-generator:end {name} -->'
+
+
+def index_sections(text: str) -> Dict[str, Section]:
+    """
+        Метод за один проход по строкам находит все управляемые блоки и возвращает их смещения по имени.
+        Незакрытые блоки игнорируются, при повторе имени учитывается первый блок
+    """
+    sections: Dict[str, Section] = {}
+    stack: List[tuple] = []
+    pos = 0
+    length = len(text)
+    while pos < length:
+        newline = text.find('\n', pos)
+        line_end = length if newline == -1 else newline + 1
+        first = pos
+        # Пропускаем отступ, маркеры - только строки, начинающиеся с '#' или '<!--'
+        while first < line_end and text[first] in ' \t':
+            first += 1
+        char = text[first] if first < line_end else ''
+        if char in ('#', '<'):
+            line = text[first:line_end].rstrip()
+            name = None
+            opening = True
+            if char == '#':
+                if DOCUMENT_START.fullmatch(line):
+                    name = DOCUMENT
+                elif DOCUMENT_END.fullmatch(line):
+                    name, opening = DOCUMENT, False
+            else:
+                match = BLOCK_START.fullmatch(line) or BLOCK_END.fullmatch(line)
+                if match:
+                    name, opening = match.group(1), match.re is BLOCK_START
+
+            if name and opening:
+                stack.append((name, pos))
+            elif name:
+                # Закрываем ближайший открытый блок с тем же именем, вложенные незакрытые отбрасываем
+                for i in range(len(stack) - 1, -1, -1):
+                    if stack[i][0] == name:
+                        start = stack[i][1]
+                        del stack[i:]
+                        sections.setdefault(name, Section(name, start, line_end, i))
+                        break
+        pos = line_end
+    return sections
+
+
+def update_sections(old_text: str, new_text: str, names: Optional[Iterable[str]] = None) -> Tuple[str, List[str]]:
+    """
+        Метод заменяет блоки old_text одноимёнными блоками из new_text, не трогая текст вокруг.
+        Если names задан - обновляются только перечисленные блоки. Блок, вложенный в уже заменённый, отдельно не меняется.
+        Если в old_text нет ни одного подходящего блока, сгенерированный текст дописывается в конец.
+        Возвращает новый текст и имена заменённых блоков
+    """
+    new_sections = index_sections(new_text)
+    allowed = set(names) if names is not None else None
+    replaceable = sorted(
+        (section for name, section in index_sections(old_text).items()
+         if name in new_sections and (allowed is None or name in allowed)),
+        key=lambda section: section.start,
+    )
+
+    pieces = []
+    replaced = []
+    pos = 0
+    for section in replaceable:
+        if section.start < pos:
+            continue
+        new_section = new_sections[section.name]
+        pieces.append(old_text[pos:section.start])
+        pieces.append(new_text[new_section.start:new_section.end])
+        pos = section.end
+        replaced.append(section.name)
+
+    if not pieces:
+        if not old_text:
+            return new_text, replaced
+        separator = '\n' if old_text.endswith('\n') else '\n\n'
+        return old_text + separator + new_text, replaced
+
+    pieces.append(old_text[pos:])
+    return ''.join(pieces), replaced
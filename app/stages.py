@@ -0,0 +1,171 @@
+from importlib import import_module
+from typing import TYPE_CHECKING, Callable, Optional, Set
+
+from config.settings import logger
+from controller.ledger import Blobs, Ledger, fingerprint, get_ledger
+from controller.profiling import profile_stage
+from controller.tracing import span
+
+if TYPE_CHECKING:
+    from app.context import MergeRequestContext
+
+
+def prepare_and_generate(ctx: 'MergeRequestContext') -> bool:
+    """
+        Стадия prepare и generate за один запуск: README.yaml формируется в памяти, README.md рендерится из него,
+        оба файла уходят в исходную ветку одним коммитом.
+        Возвращает False, если README.md сформировать не удалось (закоммичен только README.yaml)
+        или коммит отменён из-за конфликта с содержимым ветки
+    """
+    from app.gen_readme import build_markdown
+    from app.prepare_readme import build_yaml, save_yaml
+    from controller.gitlab import CommitConflictError, create_commit_actions
+
+    result = build_yaml(ctx)
+    if not result:
+        logger.info("Изменения отсутствуют")
+        exit(1)
+
+    yaml_action, config = result
+    actions = [{'action': yaml_action, 'file_path': 'README.yaml', 'content': save_yaml(config)}]
+
+    markdown = build_markdown(ctx, config)
+    if markdown:
+        markdown_action, markdown_content = markdown
+        actions.append({'action': markdown_action, 'file_path': 'README.md', 'content': markdown_content})
+
+    try:
+        create_commit_actions(ctx.project, ctx.mr.source_branch, actions, "Обновлены файлы README.yaml и README.md")
+    except CommitConflictError as e:
+        logger.error(f'README.yaml и README.md не закоммичены: {e}')
+        return False
+    if not markdown:
+        logger.error('README.md не сформирован, закоммичен только README.yaml')
+        return False
+    logger.info('README.yaml и README.md успешно сформированы')
+    return True
+
+
+# Обработчики задаются строкой 'модуль:функция' и импортируются только для запускаемой стадии.
+# Обработчик возвращает True, только если стадия выполнена полностью: лишь такой запуск записывается в журнал
+STAGES = {
+    'prepare': 'app.prepare_readme:gen_yaml',
+    'generate': 'app.gen_readme:create_markdown_file',
+    'all': 'app.stages:prepare_and_generate',
+}
+
+
+# Все values-prod.yaml каталога .helm (основной и сабчартов), из которых собираются параметры
+VALUES_INPUT = '.helm/**/values-prod.yaml'
+
+# Файлы, от которых зависит результат стадии
+STAGE_INPUTS = {
+    'prepare': (VALUES_INPUT, 'README.yaml'),
+    'generate': ('README.yaml', 'README.md'),
+    'all': (VALUES_INPUT, 'README.yaml', 'README.md'),
+}
+
+
+def stage_paths(stage: str, blobs: Blobs) -> Set[str]:
+    """
+        Метод раскрывает входные файлы стадии в пути из blobs: VALUES_INPUT - в найденные values-prod.yaml
+    """
+    from app.context import is_values_path
+
+    inputs = STAGE_INPUTS[stage]
+    return {path for _, path in blobs if path in inputs or (VALUES_INPUT in inputs and is_values_path(path))}
+
+
+def get_input_blobs(ctx: 'MergeRequestContext') -> Optional[Blobs]:
+    """
+        Метод получает SHA blob входных файлов стадий в обеих ветках MR. values-prod.yaml берутся из дерева
+        каталога .helm: файл, которого нет в ветке, в отпечаток не попадает, поэтому новый или удалённый
+        файл сабчарта тоже меняет отпечаток.
+        Метаданные и дерево запоминаются, поэтому стадия потом эти файлы повторно не ищет.
+        Возвращает None, если SHA какого-то файла неизвестен
+    """
+    from app.context import HELM_DIR, is_values_path
+    from controller.async_gitlab import run_concurrently
+    from controller.gitlab import get_file_meta, get_repository_tree
+
+    paths = sorted({path for inputs in STAGE_INPUTS.values() for path in inputs if path != VALUES_INPUT})
+    branches = {'source': ctx.mr.source_branch, 'target': ctx.mr.target_branch}
+    keys = [(branch, path) for branch in branches for path in paths]
+    *metas, source_tree, target_tree = run_concurrently(
+        *[(get_file_meta, ctx.project, path, branches[branch]) for branch, path in keys],
+        *[(get_repository_tree, ctx.project, branches[branch], HELM_DIR) for branch in branches],
+    )
+    for branch, tree in zip(branches, (source_tree, target_tree)):
+        for item in tree or []:
+            if item.get('type') == 'blob' and is_values_path(item.get('path', '')):
+                keys.append((branch, item['path']))
+                metas.append(item)
+    if any(meta and not meta.get('id') for meta in metas):
+        return None
+    return {key: meta['id'] if meta else None for key, meta in zip(keys, metas)}
+
+
+def record_run(ledger: Ledger, ctx: 'MergeRequestContext', stage: str, head_sha: str, blobs: Blobs,
+               commit: Optional[tuple]):
+    """
+        Метод записывает в журнал выполненную стадию. Если стадия закоммитила в исходную ветку, записывается и
+        отпечаток состояния после коммита - пайплайн, запущенный этим коммитом, стадию уже не повторит.
+        Так же помечаются другие стадии, которые были выполнены для прежнего состояния и чьи входные файлы
+        коммит не затронул
+    """
+    project_id, mr_iid = ctx.project.id, ctx.mr.iid
+    commit_id, committed = commit or (None, {})
+    ledger.record(project_id, mr_iid, stage, fingerprint(stage, head_sha, blobs, stage_paths(stage, blobs)),
+                  head_sha, 'committed' if commit else 'unchanged', commit_id)
+    if not commit:
+        return
+
+    new_blobs = {**blobs, **{('source', path): blob for path, blob in committed.items()}}
+    for other in STAGE_INPUTS:
+        paths = stage_paths(other, new_blobs)
+        if other != stage and (paths & set(committed) or not ledger.seen(
+                project_id, mr_iid, other, fingerprint(other, head_sha, blobs, stage_paths(other, blobs)))):
+            continue
+        ledger.record(project_id, mr_iid, other, fingerprint(other, commit_id, new_blobs, paths), commit_id,
+                      'own-commit', commit_id)
+
+
+def get_handler(stage: str) -> Optional[Callable[['MergeRequestContext'], bool]]:
+    """
+        Метод возвращает обработчик стадии по её имени, импортируя модуль стадии при первом обращении
+    """
+    target = STAGES.get(stage)
+    if not target:
+        return None
+    module_name, attr = target.split(':')
+    return getattr(import_module(module_name), attr)
+
+
+def run_stage(stage: str, ctx: 'MergeRequestContext') -> bool:
+    """
+        Метод запускает стадию генерации по её имени из settings.stage.
+        Возвращает False, если стадия не выполнена: такой запуск не записывается в журнал и будет повторён
+    """
+    handler = get_handler(stage)
+    if not handler:
+        logger.error(f'Неизвестная стадия: {stage}. Доступные стадии: {", ".join(STAGES)}')
+        return False
+    from controller.gitlab import pop_last_commit
+
+    # Журнал: та же стадия для того же head SHA и тех же values-prod.yaml/README уже выполнялась - выходим
+    ledger = get_ledger() if stage in STAGE_INPUTS else None
+    head_sha = ctx.mr.attributes.get('sha')
+    blobs = get_input_blobs(ctx) if ledger and head_sha else None
+    if blobs is not None and ledger.seen(ctx.project.id, ctx.mr.iid, stage,
+                                         fingerprint(stage, head_sha, blobs, stage_paths(stage, blobs))):
+        logger.info(f'Стадия {stage} уже выполнена для {head_sha[:8]} с теми же входными файлами, пропускаем')
+        return True
+
+    pop_last_commit(ctx.project.id, ctx.mr.source_branch)
+    with span(f'stage.{stage}', project_id=ctx.project.id, merge_request_iid=ctx.mr.iid), \
+            profile_stage(stage, ctx.project.id, ctx.mr.iid):
+        succeeded = handler(ctx) is True
+    commit = pop_last_commit(ctx.project.id, ctx.mr.source_branch)
+    if succeeded and blobs is not None:
+        record_run(ledger, ctx, stage, head_sha, blobs, commit)
+    return succeeded
@@ -0,0 +1,103 @@
+from logging import DEBUG
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from app.values_parser import EMPTY_MAPPING, Node
+from config.settings import logger
+
+# Путь к значению в values: (раздел, ключ, вложенный ключ, ...)
+Path = Tuple[str, ...]
+
+
+class ValuesDiff(NamedTuple):
+    added: List[Path]  # новые ключи, вложенные в них не перечисляются
+    removed: List[Path]
+    changed: List[Path]  # самые глубокие изменившиеся значения: скаляры, списки или смена типа
+    renamed: List[Tuple[Path, Path]]  # ключ сменил имя, значение осталось прежним
+
+
+def dotted(path: Path) -> str:
+    return '.'.join(path)
+
+
+def match_renames(old: Dict[str, Node], new: Dict[str, Node], removed: List[str],
+                  added: List[str]) -> List[Tuple[str, str]]:
+    """
+        Метод находит среди удалённых и добавленных ключей одного отображения пары с одинаковым хэшем значения.
+        Пара считается переименованием, только если такой хэш ровно у одного удалённого и одного добавленного ключа:
+        одинаковые значения вроде true или пустых строк у нескольких ключей не сопоставляются наугад
+    """
+    removed_by_digest: Dict[bytes, List[str]] = {}
+    for key in removed:
+        removed_by_digest.setdefault(old[key].digest, []).append(key)
+    added_by_digest: Dict[bytes, List[str]] = {}
+    for key in added:
+        added_by_digest.setdefault(new[key].digest, []).append(key)
+    return [(keys[0], added_by_digest[digest][0]) for digest, keys in removed_by_digest.items()
+            if len(keys) == 1 and len(added_by_digest.get(digest, ())) == 1]
+
+
+def diff_nodes(old: Node, new: Node, path: Path, diff: ValuesDiff):
+    """
+        Метод сравнивает два поддерева и дописывает различия в diff. Совпадающие по хэшу поддеревья не обходятся,
+        поэтому время сравнения зависит от числа изменений, а не от размера файла
+    """
+    if old.digest == new.digest:
+        return
+    if old.children is None or new.children is None:
+        diff.changed.append(path)
+        return
+
+    removed = [key for key in old.children if key not in new.children]
+    added = [key for key in new.children if key not in old.children]
+    if removed and added:
+        renamed = match_renames(old.children, new.children, removed, added)
+        if renamed:
+            diff.renamed.extend((path + (old_key,), path + (new_key,)) for old_key, new_key in renamed)
+            old_keys, new_keys = {pair[0] for pair in renamed}, {pair[1] for pair in renamed}
+            removed = [key for key in removed if key not in old_keys]
+            added = [key for key in added if key not in new_keys]
+    diff.removed.extend(path + (key,) for key in removed)
+    diff.added.extend(path + (key,) for key in added)
+
+    for key, child in new.children.items():
+        previous = old.children.get(key)
+        if previous is not None and previous.digest != child.digest:
+            diff_nodes(previous, child, path + (key,), diff)
+
+
+def diff_services(old: Dict[str, Dict[str, Node]], new: Dict[str, Dict[str, Node]],
+                  kinds: Iterable[str]) -> Dict[str, ValuesDiff]:
+    """
+        Метод сравнивает хэш-деревья разделов (ParameterIndex.trees) двух веток по каждому сервису.
+        Возвращает различия только для изменившихся сервисов. Сервис, которого нет в одной из веток,
+        сравнивается с пустыми разделами
+    """
+    kinds = list(kinds)
+    result = {}
+    for service in dict.fromkeys([*old, *new]):
+        old_sections, new_sections = old.get(service, {}), new.get(service, {})
+        diff = ValuesDiff([], [], [], [])
+        for kind in kinds:
+            diff_nodes(old_sections.get(kind, EMPTY_MAPPING), new_sections.get(kind, EMPTY_MAPPING), (kind,), diff)
+        if any(diff):
+            result[service] = diff
+    return result
+
+
+def log_diff(diffs: Dict[str, ValuesDiff]):
+    """
+        Метод выводит сводку различий по сервисам, а с уровнем DEBUG - все изменившиеся пути
+    """
+    for service, diff in diffs.items():
+        logger.info(f'Сервис {service}: добавлено {len(diff.added)}, удалено {len(diff.removed)}, '
+                    f'изменено {len(diff.changed)}, переименовано {len(diff.renamed)}')
+        if not logger.isEnabledFor(DEBUG):
+            continue
+        for path in diff.added:
+            logger.debug(f'  + {dotted(path)}')
+        for path in diff.removed:
+            logger.debug(f'  - {dotted(path)}')
+        for path in diff.changed:
+            logger.debug(f'  ~ {dotted(path)}')
+        for old_path, new_path in diff.renamed:
+            logger.debug(f'  {dotted(old_path)} -> {dotted(new_path)}')
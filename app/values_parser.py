@@ -0,0 +1,349 @@
+from hashlib import blake2b
+from typing import Dict, IO, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from ruamel.yaml import YAML
+from ruamel.yaml.events import (
+    AliasEvent,
+    Event,
+    MappingEndEvent,
+    MappingStartEvent,
+    ScalarEvent,
+    SequenceEndEvent,
+    SequenceStartEvent,
+)
+
+MERGE_KEY = '<<'
+
+DIGEST_SIZE = 16
+
+
+class _KeyExtractor:
+    """
+        Обход потока событий YAML без построения документа.
+        Для каждого сервиса (ключа верхнего уровня) собираются ключи первого уровня под нужными разделами
+        (configmap, secret), остальные значения только пропускаются
+    """
+
+    def __init__(self, events: Iterator[Event], kinds: Iterable[str]):
+        self.events = events
+        self.kinds = list(kinds)
+        self.kind_set = set(self.kinds)
+        # Отображения с якорями - для раскрытия алиасов и merge-ключей '<<': (ключи, {раздел: имена параметров})
+        self.anchors: Dict[str, Tuple[List[str], Dict[str, List[str]]]] = {}
+
+    def read_node(self, event: Event, collect: bool = False) -> Optional[List[str]]:
+        """
+            Пропускает узел, начинающийся с event. Для отображения возвращает список его ключей, если collect=True
+            или у него есть якорь
+        """
+        if isinstance(event, AliasEvent):
+            return self.anchors.get(event.anchor, (None, {}))[0]
+        if isinstance(event, SequenceStartEvent):
+            for item in self.events:
+                if isinstance(item, SequenceEndEvent):
+                    break
+                self.read_node(item)
+            return None
+        if not isinstance(event, MappingStartEvent):
+            return None
+        if collect or event.anchor is not None:
+            return self.read_mapping(event)[0]
+
+        for key_event in self.events:
+            if isinstance(key_event, MappingEndEvent):
+                break
+            self.read_node(key_event)
+            self.read_node(next(self.events))
+        return None
+
+    def read_mapping(self, event: MappingStartEvent) -> Tuple[List[str], Dict[str, List[str]]]:
+        """
+            Читает отображение: возвращает его ключи и имена параметров разделов, если ключи отображения - разделы.
+            Ключи и разделы из '<<' не перекрывают явно заданные. Порядок ключей - как у загрузчика ruamel.yaml:
+            сначала ключи из '<<' (последний источник первым), затем остальные явные
+        """
+        keys = []
+        sections = {}
+        merged = []
+        for key_event in self.events:
+            if isinstance(key_event, MappingEndEvent):
+                break
+            value_event = next(self.events)
+            if not isinstance(key_event, ScalarEvent):
+                self.read_node(key_event)
+                self.read_node(value_event)
+            elif key_event.value == MERGE_KEY:
+                merged.extend(self.read_merge(value_event))
+            else:
+                keys.append(key_event.value)
+                if key_event.value in self.kind_set:
+                    sections[key_event.value] = self.read_node(value_event, collect=True) or []
+                else:
+                    self.read_node(value_event)
+
+        if merged:
+            keys = list(dict.fromkeys([*(key for merged_keys, _ in reversed(merged) for key in merged_keys), *keys]))
+            for _, merged_sections in merged:
+                for kind, names in merged_sections.items():
+                    sections.setdefault(kind, names)
+        if event.anchor is not None:
+            self.anchors[event.anchor] = keys, sections
+        return keys, sections
+
+    def read_merge(self, event: Event) -> List[Tuple[List[str], Dict[str, List[str]]]]:
+        # Значение '<<' - алиас, отображение или список алиасов
+        if isinstance(event, SequenceStartEvent):
+            merged = []
+            for item in self.events:
+                if isinstance(item, SequenceEndEvent):
+                    break
+                merged.extend(self.read_merge(item))
+            return merged
+        if isinstance(event, AliasEvent):
+            return [self.anchors.get(event.anchor, ([], {}))]
+        if isinstance(event, MappingStartEvent):
+            return [self.read_mapping(event)]
+        self.read_node(event)
+        return []
+
+    def read_service(self, event: Event) -> Dict[str, List[str]]:
+        if isinstance(event, AliasEvent):
+            return self.anchors.get(event.anchor, ([], {}))[1]
+        if not isinstance(event, MappingStartEvent):
+            self.read_node(event)
+            return {}
+        return self.read_mapping(event)[1]
+
+    def extract(self) -> Dict[str, Dict[str, List[str]]]:
+        result = {}
+        for event in self.events:
+            if not isinstance(event, MappingStartEvent):
+                continue
+            # Корневое отображение документа: ключи - сервисы
+            for key_event in self.events:
+                if isinstance(key_event, MappingEndEvent):
+                    break
+                value_event = next(self.events)
+                if not isinstance(key_event, ScalarEvent):
+                    self.read_node(key_event)
+                    self.read_node(value_event)
+                    continue
+                parameters = self.read_service(value_event)
+                if parameters:
+                    result[key_event.value] = {kind: parameters.get(kind, []) for kind in self.kinds}
+            break
+        return result
+
+
+def extract_parameters(stream: Union[str, IO], kinds: Iterable[str]) -> Dict[str, Dict[str, List[str]]]:
+    """
+        Метод собирает имена параметров из values-prod.yaml, проходя по событиям YAML без построения документа.
+        Возвращает словарь {сервис: {раздел: [имена параметров]}} для сервисов, в которых есть хотя бы один раздел.
+        Используется C-парсер ruamel.yaml, если он установлен
+    """
+    return _KeyExtractor(iter(YAML(typ='safe').parse(stream)), kinds).extract()
+
+
+def extract_file_parameters(path: str, kinds: Iterable[str]) -> Dict[str, Dict[str, List[str]]]:
+    """
+        Метод собирает имена параметров из файла values на диске, читая его по частям.
+        Нужен для разбора в пуле процессов: передаётся путь, а не содержимое файла
+    """
+    with open(path, 'rb') as stream:
+        return extract_parameters(stream, kinds)
+
+
+class Node(NamedTuple):
+    """
+        Узел дерева values: digest - хэш всего поддерева, children - дочерние узлы отображения по ключам.
+        У скаляров и списков children = None, их содержимое учитывается только в хэше.
+        Равные хэши означают равные поддеревья, поэтому сравнение деревьев не спускается в совпадающие ветки.
+        Кортеж, а не класс: листья без ссылок на изменяемые объекты сборщик мусора перестаёт отслеживать
+    """
+    digest: bytes
+    children: Optional[Dict[str, 'Node']] = None
+
+
+def scalar_node(tag: Optional[str], value: str, plain: bool = True) -> Node:
+    # Значение без кавычек может оказаться числом или булевым, в кавычках - всегда строка: "1" и 1 различаются.
+    # Остальные особенности записи (вид кавычек, блочные строки) в хэш не входят
+    marker = 'p' if plain else 'q'
+    return Node(blake2b(f'{marker}{tag or ""}\0{value}'.encode('utf-8'), digest_size=DIGEST_SIZE).digest())
+
+
+def sequence_node(items: Iterable[Node]) -> Node:
+    return Node(blake2b(b'l' + b''.join(item.digest for item in items), digest_size=DIGEST_SIZE).digest())
+
+
+def mapping_node(children: Dict[str, Node]) -> Node:
+    # Порядок ключей отображения не важен: хэш считается по отсортированным ключам
+    content = b''.join(f'{key}\0'.encode('utf-8') + children[key].digest for key in sorted(children))
+    return Node(blake2b(b'm' + content, digest_size=DIGEST_SIZE).digest(), children)
+
+
+EMPTY_MAPPING = mapping_node({})
+NULL = scalar_node(None, '')
+
+
+def node_names(node: Node) -> List[str]:
+    return list(node.children) if node.children is not None else []
+
+
+def merge_nodes(first: Node, second: Node) -> Node:
+    """
+        Метод объединяет раздел сервиса из двух файлов values: ключи второго дополняют и перекрывают ключи первого
+    """
+    if first.children is None or second.children is None:
+        return second if second.children is not None or first.children is None else first
+    return mapping_node({**first.children, **second.children})
+
+
+class _TreeBuilder:
+    """
+        Обход потока событий YAML с построением хэш-дерева только для нужных разделов сервисов (configmap, secret).
+        Остальные значения пропускаются, но узлы с якорями строятся: на них могут ссылаться алиасы и merge-ключи '<<'
+    """
+
+    def __init__(self, events: Iterator[Event], kinds: Iterable[str]):
+        self.events = events
+        self.kinds = list(kinds)
+        self.kind_set = set(self.kinds)
+        self.anchors: Dict[str, Node] = {}
+
+    def skip(self, event: Event):
+        if isinstance(event, (ScalarEvent, MappingStartEvent, SequenceStartEvent)) and event.anchor is not None:
+            self.read_node(event)
+            return
+        if isinstance(event, MappingStartEvent):
+            end = MappingEndEvent
+        elif isinstance(event, SequenceStartEvent):
+            end = SequenceEndEvent
+        else:
+            return
+        for item in self.events:
+            if isinstance(item, end):
+                break
+            self.skip(item)
+
+    def read_node(self, event: Event) -> Node:
+        if isinstance(event, AliasEvent):
+            return self.anchors.get(event.anchor, NULL)
+        if isinstance(event, ScalarEvent):
+            node = scalar_node(event.tag, event.value, event.implicit[0])
+        elif isinstance(event, SequenceStartEvent):
+            items = []
+            for item in self.events:
+                if isinstance(item, SequenceEndEvent):
+                    break
+                items.append(self.read_node(item))
+            node = sequence_node(items)
+        elif isinstance(event, MappingStartEvent):
+            node = mapping_node(self.read_mapping())
+        else:
+            return NULL
+        if event.anchor is not None:
+            self.anchors[event.anchor] = node
+        return node
+
+    def read_mapping(self) -> Dict[str, Node]:
+        children = {}
+        merged = []
+        for key_event in self.events:
+            if isinstance(key_event, MappingEndEvent):
+                break
+            value_event = next(self.events)
+            if not isinstance(key_event, ScalarEvent):
+                self.skip(key_event)
+                self.skip(value_event)
+            elif key_event.value == MERGE_KEY:
+                merged.extend(self.read_merge(value_event))
+            else:
+                children[key_event.value] = self.read_node(value_event)
+        if not merged:
+            return children
+        # Явные ключи перекрывают ключи из '<<', из нескольких источников побеждает первый.
+        # Порядок ключей - как у загрузчика ruamel.yaml: сначала из '<<' (последний источник первым), затем явные
+        values = dict(children)
+        order = {}
+        for node in merged:
+            for key, child in (node.children or {}).items():
+                values.setdefault(key, child)
+        for node in reversed(merged):
+            order.update(dict.fromkeys(node.children or {}))
+        order.update(dict.fromkeys(children))
+        return {key: values[key] for key in order}
+
+    def read_merge(self, event: Event) -> List[Node]:
+        if isinstance(event, SequenceStartEvent):
+            nodes = []
+            for item in self.events:
+                if isinstance(item, SequenceEndEvent):
+                    break
+                nodes.append(self.read_node(item))
+            return nodes
+        return [self.read_node(event)]
+
+    def sections(self, node: Node) -> Dict[str, Node]:
+        children = node.children or {}
+        return {kind: children[kind] for kind in self.kinds if kind in children}
+
+    def read_service(self, event: Event) -> Dict[str, Node]:
+        if isinstance(event, AliasEvent):
+            return self.sections(self.anchors.get(event.anchor, NULL))
+        if not isinstance(event, MappingStartEvent):
+            self.skip(event)
+            return {}
+        if event.anchor is not None:
+            # На сервис с якорем могут ссылаться алиасы и '<<' - строим его целиком
+            return self.sections(self.read_node(event))
+
+        sections = {}
+        merged = []
+        for key_event in self.events:
+            if isinstance(key_event, MappingEndEvent):
+                break
+            value_event = next(self.events)
+            if isinstance(key_event, ScalarEvent) and key_event.value in self.kind_set:
+                sections[key_event.value] = self.read_node(value_event)
+            elif isinstance(key_event, ScalarEvent) and key_event.value == MERGE_KEY:
+                merged.extend(self.read_merge(value_event))
+            else:
+                self.skip(key_event)
+                self.skip(value_event)
+        # Разделы из '<<' на уровне сервиса, как и в read_mapping, не перекрывают явно заданные
+        for node in merged:
+            for kind, child in self.sections(node).items():
+                sections.setdefault(kind, child)
+        return sections
+
+    def extract(self) -> Dict[str, Dict[str, Node]]:
+        result = {}
+        for event in self.events:
+            if not isinstance(event, MappingStartEvent):
+                continue
+            for key_event in self.events:
+                if isinstance(key_event, MappingEndEvent):
+                    break
+                value_event = next(self.events)
+                if not isinstance(key_event, ScalarEvent):
+                    self.skip(key_event)
+                    self.skip(value_event)
+                    continue
+                sections = self.read_service(value_event)
+                if sections:
+                    result[key_event.value] = {kind: sections.get(kind, EMPTY_MAPPING) for kind in self.kinds}
+            break
+        return result
+
+
+def extract_trees(stream: Union[str, IO], kinds: Iterable[str]) -> Dict[str, Dict[str, Node]]:
+    """
+        Метод строит хэш-деревья разделов values-prod.yaml: {сервис: {раздел: Node}}.
+        Ключи верхнего уровня разделов совпадают с именами, которые возвращает extract_parameters
+    """
+    return _TreeBuilder(iter(YAML(typ='safe').parse(stream)), kinds).extract()
+
+
+def extract_file_trees(path: str, kinds: Iterable[str]) -> Dict[str, Dict[str, Node]]:
+    with open(path, 'rb') as stream:
+        return extract_trees(stream, kinds)
@@ -0,0 +1,214 @@
+import hmac
+import json
+import signal
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set, Tuple
+
+from gitlab import Gitlab
+from gitlab.v4.objects import Project
+
+from app.context import load_context
+from app.stages import run_stage
+from config.settings import logger, settings
+from controller.gitlab import forget_refs
+
+Key = Tuple[int, int]
+
+# Действия MR, после которых нужно пересобрать README. update приходит и при смене заголовка или меток,
+# поэтому он учитывается, только если в MR появились новые коммиты (есть oldrev)
+HANDLED_ACTIONS = {'open', 'reopen', 'update'}
+
+
+class MergeRequestQueue:
+    """
+        Очередь MR на обработку. Для каждого MR хранится только последний head SHA: серия push'ей в один MR,
+        пришедшая пока он ждёт в очереди, схлопывается в одну задачу. Один и тот же MR не обрабатывается
+        одновременно в двух потоках, а уже обработанный SHA повторно в очередь не попадает
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending: Dict[Key, str] = {}
+        self.running: Set[Key] = set()
+        self.processed: Dict[Key, str] = {}
+        self.collapsed = 0
+        self.closed = False
+
+    def put(self, key: Key, sha: str) -> bool:
+        with self.condition:
+            if key not in self.pending and key not in self.running and self.processed.get(key) == sha:
+                return False
+            if key in self.pending:
+                self.collapsed += 1
+            # Позиция MR в очереди сохраняется, обновляется только SHA
+            self.pending[key] = sha
+            self.condition.notify()
+            return True
+
+    def get(self) -> Optional[Tuple[Key, str]]:
+        with self.condition:
+            while True:
+                key = next((key for key in self.pending if key not in self.running), None)
+                if key is not None:
+                    self.running.add(key)
+                    return key, self.pending.pop(key)
+                if self.closed:
+                    return None
+                self.condition.wait()
+
+    def done(self, key: Key, sha: Optional[str] = None):
+        with self.condition:
+            self.running.discard(key)
+            if sha:
+                self.processed[key] = sha
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {'pending': len(self.pending), 'running': len(self.running),
+                    'processed': len(self.processed), 'collapsed': self.collapsed}
+
+
+def parse_event(payload: dict) -> Optional[Tuple[Key, str, str, str]]:
+    """
+        Метод извлекает из события Merge Request Hook ключ MR, head SHA и ветки.
+        Возвращает None для событий, после которых README пересобирать не нужно
+    """
+    if payload.get('object_kind') != 'merge_request':
+        return None
+    attributes = payload.get('object_attributes') or {}
+    action = attributes.get('action')
+    if action not in HANDLED_ACTIONS or attributes.get('state') != 'opened':
+        return None
+    if action == 'update' and not attributes.get('oldrev'):
+        return None
+    try:
+        key = (int(payload['project']['id']), int(attributes['iid']))
+        sha = attributes['last_commit']['id']
+    except (KeyError, TypeError, ValueError):
+        return None
+    return key, sha, attributes.get('source_branch'), attributes.get('target_branch')
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    server: 'WebhookServer'
+
+    def log_message(self, format, *args):
+        logger.debug(f'{self.address_string()} {format % args}')
+
+    def reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/health':
+            return self.reply(404, {'message': 'Not Found'})
+        self.reply(200, self.server.queue.stats())
+
+    def do_POST(self):
+        secret = settings.webhook_secret
+        token = self.headers.get('X-Gitlab-Token', '')
+        if secret and not hmac.compare_digest(token.encode(), secret.get_secret_value().encode()):
+            return self.reply(401, {'message': 'Invalid token'})
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+        except ValueError:
+            return self.reply(400, {'message': 'Invalid JSON'})
+
+        event = parse_event(payload) if isinstance(payload, dict) else None
+        if not event:
+            return self.reply(200, {'status': 'ignored'})
+        key, sha, source_branch, target_branch = event
+        self.server.branches[key] = (source_branch, target_branch)
+        queued = self.server.queue.put(key, sha)
+        logger.info(f'MR {key[0]}:{key[1]} {sha[:8]}: {"в очереди" if queued else "уже обработан"}')
+        # GitLab ждёт ответ не дольше 10 секунд, поэтому стадия запускается в фоне
+        self.reply(202, {'status': 'queued' if queued else 'duplicate'})
+
+
+class WebhookServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], queue: MergeRequestQueue):
+        super().__init__(address, WebhookHandler)
+        self.queue = queue
+        # Ветки MR из последнего события - для GraphQL запроса файлов вместе с MR
+        self.branches: Dict[Key, Tuple[Optional[str], Optional[str]]] = {}
+
+
+def worker(gl: Gitlab, stage: str, server: WebhookServer):
+    """
+        Поток обработки очереди: стадия запускается для последнего SHA MR на общем клиенте GitLab
+    """
+
+    @lru_cache(maxsize=256)
+    def get_project(project_id: int) -> Project:
+        return gl.projects.get(project_id)
+
+    while True:
+        item = server.queue.get()
+        if item is None:
+            return
+        (project_id, mr_iid), sha = item
+        source_branch, target_branch = server.branches.get((project_id, mr_iid), (None, None))
+        processed = None
+        try:
+            # Ветки могли сдвинуться с прошлой обработки - результаты поиска файлов по ним больше не верны
+            forget_refs(project_id, [ref for ref in (source_branch, target_branch) if ref])
+            ctx = load_context(gl, project_id, mr_iid, source_branch, target_branch, get_project=get_project)
+            if ctx.mr.state != 'opened':
+                logger.info(f'MR {project_id}:{mr_iid} уже не открыт, пропускаем')
+                continue
+            logger.info(f'Запуск стадии {stage} для MR {project_id}:{mr_iid} ({sha[:8]})')
+            try:
+                succeeded = run_stage(stage, ctx)
+            except SystemExit:
+                # Стадии завершают процесс через exit(1), если изменений нет
+                succeeded = True
+            if succeeded:
+                processed = sha
+        except Exception as e:
+            logger.exception(f'Ошибка при обработке MR {project_id}:{mr_iid}: {e}')
+        finally:
+            server.queue.done((project_id, mr_iid), processed)
+
+
+def serve(gl: Gitlab, stage: str):
+    """
+        Метод запускает сервис приёма webhook'ов GitLab (Merge Request Hook): события ставятся в очередь
+        с дедупликацией по MR и обрабатываются webhook_workers потоками с общим клиентом GitLab и тёплыми кэшами
+    """
+    queue = MergeRequestQueue()
+    server = WebhookServer((settings.webhook_host, settings.webhook_port), queue)
+    workers = [threading.Thread(target=worker, args=(gl, stage, server), name=f'webhook-worker-{i}', daemon=True)
+               for i in range(settings.webhook_workers)]
+    for thread in workers:
+        thread.start()
+
+    if threading.current_thread() is threading.main_thread():
+        # SIGTERM при остановке контейнера: перестаём принимать события и дорабатываем очередь
+        signal.signal(signal.SIGTERM, lambda *args: threading.Thread(target=server.shutdown).start())
+
+    host, port = server.server_address[:2]
+    logger.info(f'Приём webhook на {host}:{port}, стадия {stage}, потоков: {settings.webhook_workers}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info('Остановка сервиса, дожидаемся обработки очереди')
+        server.server_close()
+        queue.close()
+        for thread in workers:
+            thread.join()
@@ -0,0 +1,406 @@
+"""
+    Локальная замена GitLab для бенчмарков: синтетические проекты с деревом, файлами, MR и коммитами,
+    настраиваемая задержка ответа и учёт запросов и переданных байт по эндпоинтам.
+
+    Поддерживаются только эндпоинты REST API v4, которые использует генератор, и пакетный GraphQL запрос
+    из controller/graphql.py. С graphql=False GraphQL отвечает 404, и клиент работает через REST.
+"""
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+
+def blob_sha(data: bytes) -> str:
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+class FakeProject:
+    """
+        Синтетический проект: содержимое веток {ветка: {путь: байты}} и merge request'ы
+    """
+
+    def __init__(self, project_id: int, name: str, branches: Dict[str, Dict[str, bytes]]):
+        self.id = project_id
+        self.name = name
+        self.branches = branches
+        self.merge_requests: Dict[int, dict] = {}
+        self.commits = 0
+
+    def add_merge_request(self, iid: int, source_branch: str, target_branch: str, extra_diffs: int = 0):
+        source, target = self.branches[source_branch], self.branches[target_branch]
+        changed = sorted(path for path in set(source) | set(target) if source.get(path) != target.get(path))
+        self.merge_requests[iid] = {
+            'iid': iid,
+            'source_branch': source_branch,
+            'target_branch': target_branch,
+            # Дополнительные изменённые пути только увеличивают размер ответа /diffs
+            'changed': changed + [f'src/changed/file_{i}.py' for i in range(extra_diffs)],
+        }
+
+    def head(self, branch: str) -> str:
+        files = self.branches[branch]
+        digest = hashlib.sha1(f'{branch}:{self.commits}'.encode())
+        for path in sorted(files):
+            digest.update(path.encode() + blob_sha(files[path]).encode())
+        return digest.hexdigest()
+
+    def files(self, ref: str) -> Dict[str, bytes]:
+        """
+            Файлы ветки по её имени или по head SHA (как ref=<sha> в GitLab)
+        """
+        if ref in self.branches:
+            return self.branches[ref]
+        branch = next((branch for branch in self.branches if self.head(branch) == ref), None)
+        if branch is None:
+            raise KeyError(ref)
+        return self.branches[branch]
+
+    def tree(self, branch: str, path: str, recursive: bool) -> List[dict]:
+        prefix = f'{path.strip("/")}/' if path else ''
+        entries = {}
+        for file_path, data in self.files(branch).items():
+            if not file_path.startswith(prefix):
+                continue
+            parts = file_path[len(prefix):].split('/')
+            # Промежуточные каталоги попадают в дерево как записи типа tree
+            for depth in range(1, len(parts)):
+                if not recursive and depth > 1:
+                    break
+                tree_path = prefix + '/'.join(parts[:depth])
+                entries.setdefault(tree_path, {'id': hashlib.sha1(tree_path.encode()).hexdigest(),
+                                               'name': parts[depth - 1], 'type': 'tree',
+                                               'path': tree_path, 'mode': '040000'})
+            if recursive or len(parts) == 1:
+                entries[file_path] = {'id': blob_sha(data), 'name': parts[-1], 'type': 'blob',
+                                      'path': file_path, 'mode': '100644'}
+        return [entries[key] for key in sorted(entries)]
+
+    def find_blob(self, sha: str) -> Optional[bytes]:
+        for files in self.branches.values():
+            for data in files.values():
+                if blob_sha(data) == sha:
+                    return data
+        return None
+
+    def commit(self, branch: str, actions: List[dict]) -> dict:
+        files = self.branches[branch]
+        for action in actions:
+            if action['action'] == 'delete':
+                files.pop(action['file_path'], None)
+            else:
+                files[action['file_path']] = action['content'].encode('utf-8')
+        self.commits += 1
+        sha = self.head(branch)
+        return {'id': sha, 'short_id': sha[:8]}
+
+
+class FakeGitlabHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'FakeGitlabServer'
+
+    ROUTES = [
+        ('GET', 'group', r'/api/v4/groups/(?P<group>[^/]+)'),
+        ('GET', 'group_projects', r'/api/v4/groups/(?P<group>[^/]+)/projects'),
+        ('GET', 'project', r'/api/v4/projects/(?P<project>\d+)'),
+        ('GET', 'branch', r'/api/v4/projects/(?P<project>\d+)/repository/branches/(?P<branch>.+)'),
+        ('GET', 'tree', r'/api/v4/projects/(?P<project>\d+)/repository/tree'),
+        ('GET', 'raw_blob', r'/api/v4/projects/(?P<project>\d+)/repository/blobs/(?P<sha>[0-9a-f]{40})/raw'),
+        ('GET', 'raw_file', r'/api/v4/projects/(?P<project>\d+)/repository/files/(?P<path>.+)/raw'),
+        ('GET', 'file', r'/api/v4/projects/(?P<project>\d+)/repository/files/(?P<path>.+)'),
+        ('HEAD', 'file_head', r'/api/v4/projects/(?P<project>\d+)/repository/files/(?P<path>.+)'),
+        ('GET', 'merge_request', r'/api/v4/projects/(?P<project>\d+)/merge_requests/(?P<iid>\d+)'),
+        ('GET', 'diffs', r'/api/v4/projects/(?P<project>\d+)/merge_requests/(?P<iid>\d+)/diffs'),
+        ('GET', 'changes', r'/api/v4/projects/(?P<project>\d+)/merge_requests/(?P<iid>\d+)/changes'),
+        ('POST', 'commit', r'/api/v4/projects/(?P<project>\d+)/repository/commits'),
+        ('POST', 'graphql', r'/api/graphql'),
+    ]
+
+    # Выборка файлов веток в пакетном запросе: <алиас>: repository [@include(if: $withBlobs)] {
+    #   blobs(ref: $<ветка>, paths: $<пути>) { nodes { <поля> } } }
+    BLOBS_PATTERN = re.compile(r'(\w+): repository(?P<include> @include\(if: \$withBlobs\))? \{\s*'
+                               r'blobs\(ref: \$(\w+), paths: \$(\w+)\) \{ nodes \{ ([\w ]+) \} \}')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_HEAD(self):
+        self.dispatch('HEAD')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method: str):
+        url = urlsplit(self.path)
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+        time.sleep(self.server.latency)
+
+        self.extra_headers = {}
+        rejected = self.server.admit(self.extra_headers)
+        if rejected:
+            return self.send('rate_limited' if rejected == 429 else 'server_error', rejected,
+                             {'message': 'Retry later' if rejected == 429 else '502 Bad Gateway'})
+
+        for route_method, name, pattern in self.ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                params = {key: unquote(value) for key, value in match.groupdict().items()}
+                if 'project' not in params:
+                    return getattr(self, f'handle_{name}')(name, **params)
+                project = self.server.projects.get(int(params.pop('project')))
+                if project is None:
+                    return self.send(name, 404, {'message': '404 Project Not Found'})
+                try:
+                    return getattr(self, f'handle_{name}')(name, project, **params)
+                except KeyError:
+                    return self.send(name, 404, {'message': '404 Not Found'})
+        self.send('unknown', 404, {'message': '404 Not Found'})
+
+    def send(self, endpoint: str, status: int, payload=None, raw: Optional[bytes] = None,
+             headers: Optional[Dict[str, str]] = None):
+        body = raw if raw is not None else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream' if raw is not None else 'application/json')
+        for key, value in {**self.extra_headers, **(headers or {})}.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        self.server.account(endpoint, len(self.body), 0 if self.command == 'HEAD' else len(body))
+
+    def paginate(self, endpoint: str, items: List[dict]):
+        per_page = min(int(self.query.get('per_page') or DEFAULT_PER_PAGE), MAX_PER_PAGE)
+        page = int(self.query.get('page') or 1)
+        total_pages = max(1, -(-len(items) // per_page))
+        headers = {'X-Page': str(page), 'X-Per-Page': str(per_page), 'X-Total': str(len(items)),
+                   'X-Total-Pages': str(total_pages)}
+        if page < total_pages:
+            query = urlencode({**self.query, 'page': page + 1, 'per_page': per_page})
+            next_url = f'http://{self.headers["Host"]}{urlsplit(self.path).path}?{query}'
+            headers.update({'X-Next-Page': str(page + 1), 'Link': f'<{next_url}>; rel="next"'})
+        self.send(endpoint, 200, items[(page - 1) * per_page:page * per_page], headers=headers)
+
+    def handle_project(self, endpoint: str, project: FakeProject):
+        self.send(endpoint, 200, {'id': project.id, 'name': project.name, 'path': project.name,
+                                  'path_with_namespace': f'bench/{project.name}', 'default_branch': 'dev',
+                                  'web_url': f'http://{self.headers["Host"]}/bench/{project.name}'})
+
+    def handle_group(self, endpoint: str, group: str):
+        self.send(endpoint, 200, {'id': 1, 'name': group, 'path': group, 'full_path': group})
+
+    def handle_group_projects(self, endpoint: str, group: str):
+        # Все проекты сервера считаются проектами одной группы
+        self.paginate(endpoint, [{'id': project.id, 'name': project.name, 'path': project.name,
+                                  'path_with_namespace': f'bench/{project.name}', 'default_branch': 'dev'}
+                                 for project in self.server.projects.values()])
+
+    def handle_branch(self, endpoint: str, project: FakeProject, branch: str):
+        self.send(endpoint, 200, {'name': branch, 'commit': {'id': project.head(branch)}})
+
+    def handle_tree(self, endpoint: str, project: FakeProject):
+        ref = self.query.get('ref', 'dev')
+        recursive = self.query.get('recursive', '').lower() in ('true', '1')
+        items = project.tree(ref, self.query.get('path', ''), recursive)
+        if not items and self.query.get('path'):
+            return self.send(endpoint, 404, {'message': '404 Tree Not Found'})
+        self.paginate(endpoint, items)
+
+    def handle_raw_blob(self, endpoint: str, project: FakeProject, sha: str):
+        data = project.find_blob(sha)
+        if data is None:
+            return self.send(endpoint, 404, {'message': '404 Blob Not Found'})
+        self.send(endpoint, 200, raw=data)
+
+    def file_headers(self, project: FakeProject, path: str) -> Tuple[bytes, Dict[str, str]]:
+        ref = self.query.get('ref', 'dev')
+        data = project.files(ref)[path]
+        return data, {'X-Gitlab-Blob-Id': blob_sha(data), 'X-Gitlab-File-Name': path.rsplit('/', 1)[-1],
+                      'X-Gitlab-File-Path': path, 'X-Gitlab-Size': str(len(data)), 'X-Gitlab-Ref': ref,
+                      'X-Gitlab-Commit-Id': project.head(ref) if ref in project.branches else ref}
+
+    def handle_raw_file(self, endpoint: str, project: FakeProject, path: str):
+        data, headers = self.file_headers(project, path)
+        self.send(endpoint, 200, raw=data, headers=headers)
+
+    def handle_file(self, endpoint: str, project: FakeProject, path: str):
+        data, headers = self.file_headers(project, path)
+        self.send(endpoint, 200, {
+            'file_name': headers['X-Gitlab-File-Name'], 'file_path': path, 'size': len(data),
+            'encoding': 'base64', 'content': base64.b64encode(data).decode('ascii'), 'ref': headers['X-Gitlab-Ref'],
+            'blob_id': headers['X-Gitlab-Blob-Id'], 'commit_id': headers['X-Gitlab-Commit-Id'],
+            'last_commit_id': headers['X-Gitlab-Commit-Id'],
+        }, headers=headers)
+
+    def handle_file_head(self, endpoint: str, project: FakeProject, path: str):
+        _, headers = self.file_headers(project, path)
+        self.send(endpoint, 200, {}, headers=headers)
+
+    def merge_request(self, project: FakeProject, iid: str) -> dict:
+        mr = project.merge_requests[int(iid)]
+        return {'id': project.id * 1000 + mr['iid'], 'iid': mr['iid'], 'project_id': project.id,
+                'title': f'Bench MR {mr["iid"]}', 'state': 'opened', 'source_branch': mr['source_branch'],
+                'target_branch': mr['target_branch'], 'sha': project.head(mr['source_branch'])}
+
+    def diffs(self, project: FakeProject, iid: str) -> List[dict]:
+        return [{'old_path': path, 'new_path': path, 'a_mode': '100644', 'b_mode': '100644',
+                 'new_file': False, 'renamed_file': False, 'deleted_file': False,
+                 'diff': f'@@ -1 +1 @@\n-old {path}\n+new {path}\n'}
+                for path in project.merge_requests[int(iid)]['changed']]
+
+    def handle_merge_request(self, endpoint: str, project: FakeProject, iid: str):
+        self.send(endpoint, 200, self.merge_request(project, iid))
+
+    def handle_diffs(self, endpoint: str, project: FakeProject, iid: str):
+        if not self.server.diffs_endpoint:
+            return self.send(endpoint, 404, {'message': '404 Not Found'})
+        self.paginate(endpoint, self.diffs(project, iid))
+
+    def handle_changes(self, endpoint: str, project: FakeProject, iid: str):
+        self.send(endpoint, 200, {**self.merge_request(project, iid), 'changes': self.diffs(project, iid)})
+
+    def graphql_blobs(self, project: FakeProject, ref: str, paths: List[str], fields: List[str]) -> dict:
+        try:
+            files = project.files(ref)
+        except KeyError:
+            files = {}
+        nodes = []
+        for path in paths:
+            if path not in files:
+                continue
+            data = files[path]
+            # size в GraphQL GitLab имеет тип BigInt и приходит строкой
+            values = {'path': path, 'oid': blob_sha(data), 'size': str(len(data)),
+                      'rawBlob': data.decode('utf-8', errors='replace')}
+            nodes.append({field: values[field] for field in fields})
+        return {'blobs': {'nodes': nodes}}
+
+    def handle_graphql(self, endpoint: str):
+        """
+            Пакетный запрос ReadmeBundle: проект, MR, изменённые пути и файлы веток с запрошенными полями
+        """
+        if not self.server.graphql:
+            return self.send(endpoint, 404, {'message': '404 Not Found'})
+        data = json.loads(self.body or b'{}')
+        query, variables = data.get('query', ''), data.get('variables') or {}
+        nodes = []
+        for gid in variables.get('ids') or []:
+            project = self.server.projects.get(int(gid.rsplit('/', 1)[-1]))
+            if project is None:
+                continue
+            node = {'id': gid, 'name': project.name, 'fullPath': f'bench/{project.name}',
+                    'webUrl': f'http://{self.headers["Host"]}/bench/{project.name}', 'mergeRequest': None}
+            mr = project.merge_requests.get(int(variables.get('iid') or 0))
+            if mr:
+                node['mergeRequest'] = {
+                    'iid': str(mr['iid']), 'title': f'Bench MR {mr["iid"]}', 'state': 'opened',
+                    'webUrl': f'http://{self.headers["Host"]}/bench/{project.name}/-/merge_requests/{mr["iid"]}',
+                    'sourceBranch': mr['source_branch'], 'targetBranch': mr['target_branch'],
+                    'diffHeadSha': project.head(mr['source_branch']),
+                    'diffStats': [{'path': path} for path in mr['changed']],
+                }
+            for alias, include, ref, paths, fields in self.BLOBS_PATTERN.findall(query):
+                if include and not variables.get('withBlobs'):
+                    continue
+                node[alias] = self.graphql_blobs(project, variables.get(ref) or '', variables.get(paths) or [],
+                                                 fields.split())
+            nodes.append(node)
+        self.send(endpoint, 200, {'data': {'projects': {'nodes': nodes}}})
+
+    def handle_commit(self, endpoint: str, project: FakeProject):
+        data = json.loads(self.body or b'{}')
+        commit = project.commit(data['branch'], data.get('actions', []))
+        self.send(endpoint, 201, {**commit, 'title': data.get('commit_message', ''),
+                                  'message': data.get('commit_message', ''),
+                                  'web_url': f'http://{self.headers["Host"]}/bench/{project.name}/-/commit/{commit["id"]}'})
+
+
+class FakeGitlabServer(ThreadingHTTPServer):
+    """
+        HTTP сервер с синтетическими проектами. Счётчики запросов и байт сбрасываются через reset()
+    """
+    daemon_threads = True
+
+    def __init__(self, projects: List[FakeProject], latency: float = 0.0, diffs_endpoint: bool = True,
+                 rate_limit: int = 0, error_rate: float = 0.0, address: Tuple[str, int] = ('127.0.0.1', 0),
+                 graphql: bool = True):
+        super().__init__(address, FakeGitlabHandler)
+        self.projects = {project.id: project for project in projects}
+        self.latency = latency
+        self.diffs_endpoint = diffs_endpoint
+        self.graphql = graphql
+        # Лимит запросов в секунду с заголовками RateLimit-* как у GitLab и доля ответов 502
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.random = random.Random(0)
+        self.window = (0, 0)
+        self.lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.reset()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def admit(self, headers: Dict[str, str]) -> Optional[int]:
+        """
+            Учёт лимита запросов: заполняет заголовки RateLimit-* и возвращает 429 или 502 для отклонённого запроса
+        """
+        with self.lock:
+            if self.error_rate and self.random.random() < self.error_rate:
+                return 502
+            if not self.rate_limit:
+                return None
+            now = time.time()
+            window, count = self.window
+            if window != int(now):
+                window, count = int(now), 0
+            count += 1
+            self.window = (window, count)
+            headers.update({'RateLimit-Limit': str(self.rate_limit),
+                            'RateLimit-Remaining': str(max(0, self.rate_limit - count)),
+                            'RateLimit-Reset': str(window + 1)})
+            if count > self.rate_limit:
+                headers['Retry-After'] = str(max(1, math.ceil(window + 1 - now)))
+                return 429
+            return None
+
+    def account(self, endpoint: str, bytes_in: int, bytes_out: int):
+        with self.lock:
+            stats = self.stats[endpoint]
+            stats['requests'] += 1
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+
+    def reset(self, projects: Optional[List[FakeProject]] = None):
+        with self.lock:
+            if projects is not None:
+                self.projects = {project.id: project for project in projects}
+            self.stats = defaultdict(lambda: {'requests': 0, 'bytes_in': 0, 'bytes_out': 0})
+
+    def totals(self) -> Dict[str, int]:
+        with self.lock:
+            return {key: sum(stats[key] for stats in self.stats.values())
+                    for key in ('requests', 'bytes_in', 'bytes_out')}
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name='fake-gitlab', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,241 @@
+"""
+    Бенчмарк стадий генерации против локального fake GitLab (bench/fake_gitlab.py).
+    Каждая стадия запускается через main.py в отдельном процессе на свежем состоянии сервера и холодном кэше,
+    по каждой стадии сохраняются время, число запросов, переданные байты и пиковая память.
+
+    python -m bench.gitlab_bench --values-files 10 --parameters 300 --latency 20 --output bench/results/head.json
+    python -m bench.gitlab_bench --values-files 10 --parameters 300 --latency 20 --compare bench/results/base.json
+    python -m bench.gitlab_bench --values-files 1 --parameters 100 --value-size 120000 --tree-size 0 --diff-size 0
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from ruamel.yaml import YAML, StringIO
+
+from bench.fake_gitlab import FakeGitlabServer, FakeProject
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_ID = 1
+MR_IID = 1
+STAGES = ['prepare', 'generate', 'all']
+
+
+def make_values(service: str, parameters: int, added: int = 0, removed: int = 0, value_size: int = 0) -> bytes:
+    lines = [f'{service}:', '  replicas: 2', '  configmap:']
+    lines += [f'    CONFIG_{i}: "value-{i}{"x" * value_size}"' for i in range(removed, parameters + added)]
+    lines.append('  secret:')
+    lines += [f'    SECRET_{i}: "secret-{i}"' for i in range(removed, parameters // 10 + 1 + added)]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def make_readme_yaml(names: Dict[str, List[str]]) -> bytes:
+    config = {
+        'team': {'name': 'bench'},
+        'link': 'http://example.com/bench',
+        'jira-project': 'http://jira.example.com/BENCH',
+        'description': 'Synthetic project',
+        'load-testing': [{'date': '2024-01-01', 'link': 'http://example.com/lt'}],
+        'parameters': {kind: [{'name': name, 'description': f'Описание {name}'} for name in kind_names]
+                       for kind, kind_names in names.items()},
+    }
+    stream = StringIO()
+    YAML().dump(config, stream)
+    return stream.getvalue().encode('utf-8')
+
+
+def make_project(args) -> FakeProject:
+    """
+        Ветка dev с README.yaml, README.md и values-prod.yaml сервисов, ветка feature - та же, но в основном
+        values-prod.yaml часть параметров добавлена и часть удалена
+    """
+    from app.gen_readme import yaml_to_markdown
+
+    dev = {}
+    names = {'configmap': [], 'secret': []}
+    for i in range(args.values_files):
+        path = '.helm/values-prod.yaml' if i == 0 else f'.helm/charts/service-{i}/values-prod.yaml'
+        dev[path] = make_values(f'service-{i}', args.parameters, value_size=args.value_size if i == 0 else 0)
+        names['configmap'] += [f'CONFIG_{j}' for j in range(args.parameters)]
+        names['secret'] += [f'SECRET_{j}' for j in range(args.parameters // 10 + 1)]
+        dev[path.replace('values-prod.yaml', 'values-dev.yaml')] = make_values(f'service-{i}', 5)
+    for i in range(args.tree_size):
+        dev[f'src/module_{i // 50}/file_{i}.py'] = f'# file {i}\n'.encode('utf-8')
+    for kind in names:
+        names[kind] = list(dict.fromkeys(names[kind]))
+    dev['README.yaml'] = make_readme_yaml(names)
+    yaml_data = YAML(typ='safe').load(dev['README.yaml'])
+    dev['README.md'] = yaml_to_markdown(yaml_data).encode('utf-8')
+
+    feature = dict(dev)
+    feature['.helm/values-prod.yaml'] = make_values('service-0', args.parameters, added=args.changed,
+                                                    removed=args.changed, value_size=args.value_size)
+    project = FakeProject(PROJECT_ID, 'bench', {'dev': dev, 'feature': feature})
+    project.add_merge_request(MR_IID, 'feature', 'dev', extra_diffs=args.diff_size)
+    return project
+
+
+def run_child(stage: str):
+    """
+        Запуск стадии в дочернем процессе через main.py. Время и память печатаются в stdout одной строкой JSON
+    """
+    start = time.perf_counter()
+    import main
+
+    exit_code = 0
+    try:
+        main.main()
+    except SystemExit as e:
+        exit_code = e.code or 0
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'stage': stage, 'wall_s': elapsed, 'max_rss_kib': peak_rss(), 'exit_code': exit_code}))
+
+
+def peak_rss() -> Optional[int]:
+    """
+        Пиковый RSS процесса в КиБ. На Linux берётся VmHWM: ru_maxrss после exec сохраняет пик родителя,
+        и большой проект в памяти бенчмарка попал бы в результат каждой стадии
+    """
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+        # ru_maxrss: в КиБ на Linux, в байтах на macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform != 'darwin' else max_rss // 1024
+    except ImportError:
+        return None
+
+
+def run_stage(server: FakeGitlabServer, args, stage: str) -> dict:
+    server.reset([make_project(args)])
+    env = {
+        **os.environ,
+        'GITLAB_URL': server.url,
+        'GITLAB_TOKEN': 'bench',
+        'CI_JOB_ID': '1',
+        'SOURCE_PROJECT_ID': str(PROJECT_ID),
+        'MERGE_REQUEST_IID': str(MR_IID),
+        # Ветки MR известны в CI заранее, поэтому пакетный GraphQL запрос получает файлы вместе с MR
+        'SOURCE_BRANCH': 'feature',
+        'TARGET_BRANCH': 'dev',
+        'STAGE': stage,
+        'BLOB_CACHE_SIZE': '0',
+        'LOCAL_REPOSITORY': 'false',
+        'FLEET': 'false',
+        # Журнал стадий пропустил бы повторные запуски того же сценария
+        'LEDGER_FILE': '',
+        'GRAPHQL': 'false' if args.rest else 'true',
+    }
+    result = subprocess.run([sys.executable, '-m', 'bench.gitlab_bench', '--child', stage], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f'Стадия {stage} завершилась с ошибкой:\n{result.stderr}')
+    metrics = json.loads(result.stdout.strip().splitlines()[-1])
+    with server.lock:
+        metrics['endpoints'] = {name: dict(stats) for name, stats in sorted(server.stats.items())}
+    metrics.update(server.totals())
+    return metrics
+
+
+def summarize(runs: List[dict]) -> dict:
+    # Время - медиана, счётчики запросов от запуска к запуску не меняются
+    summary = dict(runs[-1])
+    summary['wall_s'] = statistics.median(run['wall_s'] for run in runs)
+    rss = [run['max_rss_kib'] for run in runs if run['max_rss_kib'] is not None]
+    summary['max_rss_kib'] = max(rss) if rss else None
+    summary['runs'] = len(runs)
+    return summary
+
+
+def git_revision() -> str:
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or 'unknown'
+
+
+def print_results(results: dict, baseline: dict = None):
+    columns = [('wall_s', 'время, с', '.3f'), ('requests', 'запросов', 'd'),
+               ('bytes_out', 'получено, Б', 'd'), ('bytes_in', 'отправлено, Б', 'd'),
+               ('max_rss_kib', 'RSS, КиБ', 'd')]
+    print(f'{"стадия":<10}' + ''.join(f'{title:>16}' for _, title, _ in columns))
+    for stage, metrics in results['stages'].items():
+        cells = []
+        for key, _, fmt in columns:
+            value = metrics.get(key)
+            cell = '-' if value is None else format(value, fmt)
+            old = (baseline or {}).get('stages', {}).get(stage, {}).get(key)
+            if value is not None and old:
+                cell += f' ({(value - old) / old * 100:+.0f}%)'
+            cells.append(f'{cell:>16}')
+        print(f'{stage:<10}' + ''.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', default=','.join(STAGES))
+    parser.add_argument('--values-files', type=int, default=5, help='Число файлов values-prod.yaml')
+    parser.add_argument('--parameters', type=int, default=200, help='Параметров configmap в каждом файле')
+    parser.add_argument('--value-size', type=int, default=0,
+                        help='Дополнительных байт в каждом значении основного values-prod.yaml (большой файл)')
+    parser.add_argument('--changed', type=int, default=10, help='Добавленных и удалённых параметров в MR')
+    parser.add_argument('--tree-size', type=int, default=500, help='Число прочих файлов в репозитории')
+    parser.add_argument('--diff-size', type=int, default=50, help='Число прочих изменённых файлов в MR')
+    parser.add_argument('--latency', type=float, default=10, help='Задержка ответа сервера, мс')
+    parser.add_argument('--rate-limit', type=int, default=0, help='Лимит запросов в секунду, 0 - без лимита')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 502')
+    parser.add_argument('--rest', action='store_true', help='Контекст MR и файлы через REST API, без GraphQL')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Файл для сохранения результатов в JSON')
+    parser.add_argument('--compare', help='JSON с результатами предыдущего запуска для сравнения')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.child)
+
+    # README.md для ветки dev рендерится самим генератором, поэтому настройкам нужен токен
+    os.environ.setdefault('GITLAB_TOKEN', 'bench')
+    server = FakeGitlabServer([], latency=args.latency / 1000, rate_limit=args.rate_limit,
+                              error_rate=args.error_rate)
+    server.start()
+    try:
+        stages = {stage: summarize([run_stage(server, args, stage) for _ in range(args.repeat)])
+                  for stage in args.stages.split(',')}
+    finally:
+        server.shutdown()
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'scenario': {key: value for key, value in vars(args).items()
+                     if key not in ('output', 'compare', 'child', 'stages')},
+        'stages': stages,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('scenario') != results['scenario']:
+            print(f'Внимание: сценарий {args.compare} отличается от текущего')
+        print(f'Сравнение с {baseline.get("revision")} ({args.compare})')
+    print_results(results, baseline)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+    Проверка времени старта: `python -X importtime` для точки входа и для импорта каждой стадии.
+    Скрипт завершается с кодом 1, если время импорта превышает бюджет или на пути стадии загружен
+    модуль, который ей не нужен.
+
+    python -m bench.import_time --budget 250 --repeat 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Сценарий: код, модули, которых не должно быть после его выполнения, и множитель бюджета
+SCENARIOS = {
+    'main': ('import main', ('gitlab', 'requests', 'jinja2', 'ruamel.yaml'), 1),
+    'prepare': ("import main; from app.stages import get_handler; get_handler('prepare')", ('jinja2',), 3),
+    'generate': ("import main; from app.stages import get_handler; get_handler('generate')", (), 3),
+}
+
+
+def import_time(code: str, forbidden: Tuple[str, ...]) -> Tuple[float, List[Tuple[float, str]], List[str]]:
+    """
+        Запускает код в отдельном интерпретаторе с -X importtime.
+        Возвращает суммарное время импорта в мс, самые долгие модули верхнего уровня и загруженные лишние модули
+    """
+    check = f'{code}; import sys; print(",".join(m for m in {forbidden!r} if m in sys.modules))'
+    # Для бюджета не важны настройки окружения: Settings создаётся лениво и при импорте не проверяется
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', check], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    total = 0.0
+    top = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Модули верхнего уровня записаны без отступа - их cumulative не пересекаются
+        if not name.startswith('  '):
+            elapsed = int(cumulative) / 1000
+            total += elapsed
+            top.append((elapsed, name.strip()))
+    loaded = [name for name in result.stdout.strip().split(',') if name]
+    return total, sorted(top, reverse=True)[:5], loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=250, help='Бюджет импорта точки входа, мс')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for name, (code, forbidden, factor) in SCENARIOS.items():
+        runs = [import_time(code, forbidden) for _ in range(args.repeat)]
+        # Минимум по запускам отсекает шум от холодного кэша файловой системы
+        total, top, loaded = min(runs, key=lambda run: run[0])
+        budget = args.budget * factor
+        status = 'OK' if total <= budget and not loaded else 'FAIL'
+        failed = failed or status == 'FAIL'
+        print(f'{name:<10}{total:>10.1f} мс  бюджет {budget:.0f} мс  {status}')
+        for elapsed, module in top:
+            print(f'{"":<10}{elapsed:>10.1f} мс  {module}')
+        if loaded:
+            print(f'{"":<10}лишние модули: {", ".join(loaded)}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
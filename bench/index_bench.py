@@ -0,0 +1,119 @@
+"""
+    Бенчмарк индекса параметров namespace (INDEX=true) против локального fake GitLab (bench/fake_gitlab.py).
+    Три запуска main.py в режиме индекса: полная сборка на пустом индексе, повтор без изменений и повтор после
+    изменения values-prod.yaml в --changed проектах. Затем замеряется время поиска по готовому индексу.
+
+    python -m bench.index_bench --projects 200 --changed 10
+    python -m bench.index_bench --projects 50 --workers 1
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.fake_gitlab import FakeGitlabServer, FakeProject
+from bench.gitlab_bench import ROOT, make_readme_yaml, make_values
+
+NAMESPACE = 'bench'
+
+
+def make_namespace(args) -> list:
+    projects = []
+    for project_id in range(1, args.projects + 1):
+        files = {}
+        names = {'configmap': [], 'secret': []}
+        for i in range(args.values_files):
+            path = '.helm/values-prod.yaml' if i == 0 else f'.helm/charts/service-{i}/values-prod.yaml'
+            # Имена параметров частично совпадают между проектами, как общие настройки у реальных сервисов
+            files[path] = make_values(f'service-{project_id}-{i}', args.parameters, added=project_id % 50)
+            names['configmap'] += [f'CONFIG_{j}' for j in range(args.parameters + project_id % 50)]
+            names['secret'] += [f'SECRET_{j}' for j in range(args.parameters // 10 + 1 + project_id % 50)]
+        files['README.yaml'] = make_readme_yaml({kind: list(dict.fromkeys(values)) for kind, values in names.items()})
+        projects.append(FakeProject(project_id, f'project-{project_id}', {'dev': files}))
+    return projects
+
+
+def run_index(server: FakeGitlabServer, args, index_file: str) -> dict:
+    server.reset()
+    env = {
+        **os.environ,
+        'GITLAB_URL': server.url,
+        'GITLAB_TOKEN': 'bench',
+        'CI_JOB_ID': '1',
+        'CI_PROJECT_ROOT_NAMESPACE': NAMESPACE,
+        'INDEX': 'true',
+        'INDEX_FILE': index_file,
+        'INDEX_WORKERS': str(args.workers),
+        'BLOB_CACHE_SIZE': '0',
+        'LOCAL_REPOSITORY': 'false',
+    }
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, 'main.py'], cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        raise RuntimeError(f'Индексация завершилась с ошибкой:\n{result.stderr}')
+    return {'wall_s': elapsed, **server.totals()}
+
+
+def measure_lookups(index_file: str, names: list, count: int) -> list:
+    from controller.parameter_db import ParameterDatabase
+
+    db = ParameterDatabase(index_file)
+    timings = []
+    for name in random.Random(0).choices(names, k=count):
+        start = time.perf_counter()
+        db.search(name)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--projects', type=int, default=100, help='Число проектов в namespace')
+    parser.add_argument('--values-files', type=int, default=2, help='Файлов values-prod.yaml в проекте')
+    parser.add_argument('--parameters', type=int, default=200, help='Параметров configmap в каждом файле')
+    parser.add_argument('--changed', type=int, default=5, help='Проектов, изменённых перед повторной индексацией')
+    parser.add_argument('--workers', type=int, default=8, help='INDEX_WORKERS')
+    parser.add_argument('--latency', type=float, default=10, help='Задержка ответа сервера, мс')
+    parser.add_argument('--lookups', type=int, default=10000, help='Число замеряемых поисков')
+    args = parser.parse_args()
+
+    # README.yaml проектов строится генератором, поэтому настройкам нужен токен
+    os.environ.setdefault('GITLAB_TOKEN', 'bench')
+    projects = make_namespace(args)
+    server = FakeGitlabServer(projects, latency=args.latency / 1000)
+    server.start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            index_file = os.path.join(directory, 'parameters.sqlite3')
+            runs = {'полная': run_index(server, args, index_file),
+                    'без изменений': run_index(server, args, index_file)}
+            for project in projects[:args.changed]:
+                files = project.branches['dev']
+                files['.helm/values-prod.yaml'] = make_values(f'service-{project.id}-0', args.parameters,
+                                                              added=project.id % 50 + 1)
+            runs[f'изменено {args.changed}'] = run_index(server, args, index_file)
+
+            exact = measure_lookups(index_file, [f'CONFIG_{i}' for i in range(args.parameters + 50)] + ['MISSING'],
+                                    args.lookups)
+            prefix = measure_lookups(index_file, ['CONFIG_1*', 'SECRET_2*'], max(1, args.lookups // 100))
+            size = os.path.getsize(index_file)
+    finally:
+        server.shutdown()
+
+    print(f'{"запуск":<16}{"время, с":>12}{"запросов":>12}{"получено, Б":>16}')
+    for name, metrics in runs.items():
+        print(f'{name:<16}{metrics["wall_s"]:>12.2f}{metrics["requests"]:>12}{metrics["bytes_out"]:>16}')
+    print(f'Размер индекса: {size / 1024:.0f} КиБ')
+    for name, timings in (('по имени', exact), ('по префиксу', prefix)):
+        timings.sort()
+        print(f'Поиск {name}: медиана {statistics.median(timings) * 1e6:.0f} мкс, '
+              f'p99 {timings[int(len(timings) * 0.99)] * 1e6:.0f} мкс')
+
+
+if __name__ == '__main__':
+    main()
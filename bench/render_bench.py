@@ -0,0 +1,179 @@
+"""
+    Сравнение рендеринга README.md: прежняя сборка строкой через `markdown +=` против шаблона jinja2 с потоковой записью.
+
+    python -m bench.render_bench --parameters 20000
+"""
+import argparse
+import datetime
+import io
+import time
+import tracemalloc
+
+from app.gen_readme import yaml_to_markdown
+from app.render import render_markdown
+
+
+def create_markdown_table(headers, rows, alignments=None):
+    """
+        Генерирует Markdown-таблицу.
+
+        Аргументы:
+            headers (list): Заголовки столбцов (например, ["Name", "Age"])
+            rows (list of lists): Данные таблицы (например, [["Alice", 25], ["Bob", 30]])
+            alignments (list): Выравнивание для каждого столбца (None = по умолчанию,
+                              варианты: "left", "center", "right")
+
+        Возвращает:
+            str: Готовая таблица в формате Markdown
+    """
+    # Проверка совпадения количества колонок
+    num_columns = len(headers)
+    for row in rows:
+        if len(row) != num_columns:
+            raise ValueError("Количество элементов в строке не совпадает с заголовками")
+
+    # Определение выравнивания
+    align_map = {
+        "left": ":---",
+        "center": ":---:",
+        "right": "---:"
+    }
+
+    if not alignments:
+        alignments = ["left"] * num_columns
+    elif len(alignments) != num_columns:
+        raise ValueError("Количество значений выравнивания должно совпадать с количеством колонок")
+
+    # Создание разделителя выравнивания
+    separator = "|".join([align_map.get(align, "---") for align in alignments])
+
+    # Сборка таблицы
+    table = []
+    # Заголовки
+    table.append("|".join(headers))
+    # Разделитель
+    table.append(f"|{separator}|")
+    # Данные
+    for row in rows:
+        table.append("|".join(map(str, row)))
+
+    return "\n".join(table)
+
+
+def generate_md_table_from_dicts(data_dicts, alignments=None):
+    """
+    Генерирует Markdown-таблицу из списка словарей
+
+    :param data_dicts: Список словарей с ключами 'name' и 'description'
+    :param alignments: Список выравниваний для колонок (по умолчанию: left)
+    :return: Готовая таблица в формате Markdown
+    """
+    # Проверка наличия обязательных ключей
+    required_keys = ['name', 'description']
+    for item in data_dicts:
+        if not all(key in item for key in required_keys):
+            raise ValueError("Словарь должен содержать ключи 'name' и 'description'")
+
+    # Формируем заголовки и данные
+    headers = ["Name", "Description"]
+    rows = [
+        [item['name'], item['description']]
+        for item in data_dicts
+    ]
+
+    # Настройки выравнивания по умолчанию
+    if not alignments:
+        alignments = ["left", "left"]
+
+    # Создаем таблицу
+    return create_markdown_table(headers, rows, alignments)
+
+
+def legacy_yaml_to_markdown(yaml_data: dict) -> str:
+    # Реализация до перехода на шаблон, оставлена для сравнения
+    markdown = "# Project Documentation\n"
+    markdown += f"### Дата формирования: {datetime.date.today().isoformat()}\n\n"
+    markdown += "## Team\n"
+    markdown += f"- **Name:** {yaml_data.get('team', {}).get('name', 'N/A')}\n\n"
+    markdown += "## Links\n"
+    markdown += f"- **Project Link:** [{yaml_data.get('link', 'N/A')}]({yaml_data.get('link', 'N/A')})\n"
+    markdown += f"- **Jira Project:** [{yaml_data.get('jira-project', 'N/A')}]({yaml_data.get('jira-project', 'N/A')})\n\n"
+    markdown += "## Description\n"
+    markdown += f"{yaml_data.get('description', 'N/A')}\n\n"
+    markdown += "## Load Testing\n"
+    for test in yaml_data.get('load-testing', []):
+        markdown += f"- **Date:** {test.get('date', 'N/A')}\n"
+        markdown += f"- **Link:** [{test.get('link', 'N/A')}]({test.get('link', 'N/A')})\n"
+    markdown += "\n"
+    markdown += "## Parameters\n"
+    for param_type, params in yaml_data.get('parameters', {}).items():
+        markdown += f"### {param_type.capitalize()}\n"
+        markdown += generate_md_table_from_dicts(params)
+        markdown += "\n"
+    markdown += '# End\n'
+    return markdown
+
+
+class NullWriter:
+    """
+        Writer, который только считает байты: показывает память самого рендеринга без итогового документа
+    """
+    size = 0
+
+    def write(self, chunk: str):
+        self.size += len(chunk)
+
+
+def make_yaml(parameters: int) -> dict:
+    return {
+        'team': {'name': 'platform'},
+        'link': 'https://example.com/project',
+        'jira-project': 'https://jira.example.com/PRJ',
+        'description': 'Synthetic project',
+        'load-testing': [{'date': '2024-01-01', 'link': 'https://example.com/lt'}],
+        'parameters': {
+            'configmap': [{'name': f'CONFIG_{i}', 'description': f'Описание параметра {i}'} for i in range(parameters)],
+            'secret': [{'name': f'SECRET_{i}', 'description': f'Описание секрета {i}'} for i in range(parameters // 10)],
+        },
+    }
+
+
+def measure(func, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--parameters', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    yaml_data = make_yaml(args.parameters)
+    rendered = ''.join(line for line in yaml_to_markdown(yaml_data).splitlines(keepends=True)
+                       if not line.startswith('<!-- readme-generator:'))
+    assert legacy_yaml_to_markdown(yaml_data) == rendered, 'Результаты рендеринга не совпадают'
+
+    rows = [
+        ('legacy +=', lambda: legacy_yaml_to_markdown(yaml_data)),
+        ('jinja2 -> str', lambda: yaml_to_markdown(yaml_data)),
+        ('jinja2 -> writer', lambda: render_markdown(yaml_data, NullWriter())),
+        ('jinja2 -> file', lambda: render_markdown(yaml_data, io.TextIOWrapper(io.BytesIO(), encoding='utf-8'))),
+    ]
+    print(f'Параметров: {args.parameters}')
+    print(f'{"":<20}{"время, с":>12}{"пик памяти, MiB":>18}')
+    for name, func in rows:
+        elapsed, peak = measure(func, args.repeat)
+        print(f'{name:<20}{elapsed:>12.4f}{peak / 1024 / 1024:>18.2f}')
+
+
+if __name__ == '__main__':
+    main()
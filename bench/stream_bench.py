@@ -0,0 +1,132 @@
+"""
+    Пиковая память при чтении и разборе большого values-prod.yaml из GitLab (bench/fake_gitlab.py).
+    Каждый способ запускается в отдельном процессе на холодном кэше:
+      base64   - JSON ответ /repository/files с содержимым в base64, декодирование в строку;
+      buffered - сырой blob целиком в памяти, декодирование в строку (поведение до потокового чтения);
+      streamed - open_file: файл больше stream_threshold скачивается на диск по частям и разбирается потоком.
+    Показывается пиковый RSS процесса и его прирост относительно состояния до чтения файла.
+
+    python -m bench.stream_bench --size-mb 50
+    python -m bench.stream_bench --size-mb 50 --modes buffered,streamed --cache
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.fake_gitlab import FakeGitlabServer, FakeProject
+from bench.gitlab_bench import PROJECT_ID, ROOT
+
+MODES = ['base64', 'buffered', 'streamed']
+VALUES_PATH = '.helm/values-prod.yaml'
+
+
+def make_large_values(size: int, value_size: int) -> bytes:
+    # Длинные значения: размер файла растёт, а число имён параметров в результате разбора остаётся небольшим
+    lines = ['service-0:', '  replicas: 2', '  configmap:']
+    total = sum(len(line) + 1 for line in lines)
+    i = 0
+    while total < size:
+        line = f'    CONFIG_{i}: "{"x" * value_size}"'
+        lines.append(line)
+        total += len(line) + 1
+        i += 1
+    lines += ['  secret:', '    SECRET_0: "secret"']
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def max_rss_kib() -> int:
+    # ru_maxrss на Linux наследуется через exec от родителя, у которого в памяти весь файл, а VmHWM - нет
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        pass
+    import resource
+    # ru_maxrss: в КиБ на Linux, в байтах на macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform != 'darwin' else max_rss // 1024
+
+
+def run_child(mode: str):
+    """
+        Чтение и разбор файла в дочернем процессе. Результат печатается в stdout одной строкой JSON
+    """
+    from app.parameters import load_values
+    from app.values_parser import extract_parameters
+    from config.settings import settings
+    from controller.gitlab import get_file, get_file_meta, get_gitlab
+
+    kinds = settings.list_of_checked_paremeters
+    project = get_gitlab().projects.get(PROJECT_ID, lazy=True)
+    blob_id = get_file_meta(project, VALUES_PATH, 'dev')['id']
+    before = max_rss_kib()
+
+    start = time.perf_counter()
+    if mode == 'base64':
+        file = project.files.get(file_path=VALUES_PATH, ref='dev')
+        parsed = extract_parameters(base64.b64decode(file.content).decode('utf-8'), kinds)
+    elif mode == 'buffered':
+        parsed = extract_parameters(get_file(project, VALUES_PATH, 'dev', blob_id), kinds)
+    else:
+        parsed = load_values(project, VALUES_PATH, 'dev', blob_id, kinds, parallel=False)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({'mode': mode, 'wall_s': elapsed, 'rss_before_kib': before, 'max_rss_kib': max_rss_kib(),
+                      'parameters': len(parsed['service-0']['configmap'])}))
+
+
+def run_mode(server: FakeGitlabServer, args, mode: str, cache_dir: str) -> dict:
+    env = {
+        **os.environ,
+        'GITLAB_URL': server.url,
+        'GITLAB_TOKEN': 'bench',
+        'CI_JOB_ID': '1',
+        'LOCAL_REPOSITORY': 'false',
+        'BLOB_CACHE_DIR': cache_dir,
+        'BLOB_CACHE_SIZE': str(args.size_mb * 4 * 1024 * 1024) if args.cache else '0',
+        # buffered - всё в памяти, как до появления порога
+        'STREAM_THRESHOLD': str(2 ** 62) if mode == 'buffered' else str(args.threshold_mb * 1024 * 1024),
+    }
+    result = subprocess.run([sys.executable, '-m', 'bench.stream_bench', '--child', mode], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f'Режим {mode} завершился с ошибкой:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=50, help='Размер values-prod.yaml, МиБ')
+    parser.add_argument('--value-size', type=int, default=1024, help='Длина значения параметра, символов')
+    parser.add_argument('--threshold-mb', type=int, default=8, help='STREAM_THRESHOLD для режима streamed, МиБ')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--cache', action='store_true', help='Включить дисковый кэш blob (по умолчанию выключен)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.child)
+
+    values = make_large_values(args.size_mb * 1024 * 1024, args.value_size)
+    project = FakeProject(PROJECT_ID, 'bench', {'dev': {VALUES_PATH: values}})
+    server = FakeGitlabServer([project])
+    server.start()
+    try:
+        print(f'values-prod.yaml: {len(values) / 1024 / 1024:.1f} МиБ')
+        print(f'{"режим":<10}{"время, с":>12}{"RSS до, МиБ":>16}{"пик RSS, МиБ":>16}{"прирост, МиБ":>16}')
+        for mode in args.modes.split(','):
+            with tempfile.TemporaryDirectory() as cache_dir:
+                metrics = run_mode(server, args, mode, cache_dir)
+            before, peak = metrics['rss_before_kib'] / 1024, metrics['max_rss_kib'] / 1024
+            print(f'{mode:<10}{metrics["wall_s"]:>12.2f}{before:>16.1f}{peak:>16.1f}{peak - before:>16.1f}')
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+    Сравнение values-prod.yaml двух веток на больших файлах: хэш-деревья (extract_trees + diff_services)
+    против полной загрузки YAML и сравнения словарей всех путей до листьев.
+    Во второй ветке меняется --changed значений и переименовывается --renamed параметров.
+
+    python -m bench.values_diff_bench --services 10 --parameters 100 --depth 3 --fanout 4
+"""
+import argparse
+import random
+import time
+
+from ruamel.yaml import YAML
+
+from app.values_diff import diff_services
+from app.values_parser import extract_parameters, extract_trees
+
+KINDS = ['configmap', 'secret']
+
+
+def make_nested(prefix: str, depth: int, fanout: int, lines: list, indent: int, values: dict):
+    for i in range(fanout):
+        key = f'{prefix}_{i}'
+        if depth == 0:
+            lines.append(f'{" " * indent}{key}: "{values.get(key, key)}"')
+        else:
+            lines.append(f'{" " * indent}{key}:')
+            make_nested(key, depth - 1, fanout, lines, indent + 2, values)
+
+
+def make_values(args, values: dict, names: dict) -> str:
+    """
+        Синтетический values-prod.yaml: у каждого параметра configmap вложенное дерево глубины --depth,
+        values - заменённые значения листьев, names - переименованные параметры
+    """
+    lines = []
+    for s in range(args.services):
+        lines += [f'service-{s}:', '  replicas: 2', '  configmap:']
+        for p in range(args.parameters):
+            name = f'S{s}_P{p}'
+            lines.append(f'    {names.get(name, name)}:')
+            make_nested(name, args.depth - 1, args.fanout, lines, 6, values)
+        lines.append('  secret:')
+        lines += [f'    SECRET_{i}: "secret-{s}-{i}"' for i in range(args.parameters // 10 + 1)]
+    return '\n'.join(lines) + '\n'
+
+
+def flatten(node, path: tuple, result: dict):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            flatten(value, path + (key,), result)
+    else:
+        result[path] = node
+
+
+def full_diff(old_raw: str, new_raw: str) -> int:
+    paths = []
+    for raw in (old_raw, new_raw):
+        result = {}
+        for service, values in YAML(typ='safe').load(raw).items():
+            for kind in KINDS:
+                flatten(values.get(kind) or {}, (service, kind), result)
+        paths.append(result)
+    old, new = paths
+    return sum(1 for path in old.keys() | new.keys() if old.get(path) != new.get(path))
+
+
+def best_of(func, repeat: int):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--services', type=int, default=10, help='Число сервисов в файле')
+    parser.add_argument('--parameters', type=int, default=100, help='Параметров configmap в сервисе')
+    parser.add_argument('--depth', type=int, default=3, help='Глубина вложенности значения параметра')
+    parser.add_argument('--fanout', type=int, default=4, help='Ключей на каждом уровне вложенности')
+    parser.add_argument('--changed', type=int, default=20, help='Изменённых значений во второй ветке')
+    parser.add_argument('--renamed', type=int, default=5, help='Переименованных параметров во второй ветке')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    old_raw = make_values(args, {}, {})
+    leaves = [f'S{rng.randrange(args.services)}_P{rng.randrange(args.parameters)}' + '_0' * args.depth
+              for _ in range(args.changed)]
+    renamed = {f'S{s}_P{p}': f'S{s}_RENAMED_{p}'
+               for s, p in ((rng.randrange(args.services), rng.randrange(args.parameters)) for _ in range(args.renamed))}
+    new_raw = make_values(args, {leaf: 'changed' for leaf in leaves}, renamed)
+    leaf_count = args.services * args.parameters * args.fanout ** args.depth
+    print(f'Листьев configmap: {leaf_count}, размер файла: {len(old_raw) / 1024 / 1024:.1f} МиБ')
+
+    _, names = best_of(lambda: [extract_parameters(raw, KINDS) for raw in (old_raw, new_raw)], args.repeat)
+    trees, build = best_of(lambda: [extract_trees(raw, KINDS) for raw in (old_raw, new_raw)], args.repeat)
+    diffs, diff = best_of(lambda: diff_services(*trees, KINDS), args.repeat)
+    changed, full = best_of(lambda: full_diff(old_raw, new_raw), args.repeat)
+
+    print(f'{"способ":<36}{"время, с":>12}')
+    print(f'{"только имена (extract_parameters)":<36}{names:>12.3f}')
+    print(f'{"хэш-деревья (extract_trees)":<36}{build:>12.3f}')
+    print(f'{"сравнение деревьев (diff_services)":<36}{diff:>12.4f}')
+    print(f'{"полная загрузка и сравнение путей":<36}{full:>12.3f}')
+    total = {field: sum(len(getattr(d, field)) for d in diffs.values())
+             for field in ('added', 'removed', 'changed', 'renamed')}
+    print(f'Хэш-деревья: {total}; полное сравнение: различающихся путей {changed}')
+
+
+if __name__ == '__main__':
+    main()
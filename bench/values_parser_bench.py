@@ -0,0 +1,84 @@
+"""
+    Сравнение извлечения имён параметров из values-prod.yaml:
+    полная загрузка YAML(typ='safe', pure=True) против потокового extract_parameters.
+
+    python -m bench.values_parser_bench --services 20 --parameters 500 --blob-size 200000
+"""
+import argparse
+import time
+import tracemalloc
+
+from ruamel.yaml import YAML
+
+from app.values_parser import extract_parameters
+
+KINDS = ['configmap', 'secret']
+
+
+def make_values(services: int, parameters: int, blob_size: int) -> str:
+    """
+        Синтетический values-prod.yaml: у каждого сервиса configmap, secret с большими многострочными значениями
+        и раздел с вложенной конфигурацией, который генератору не нужен
+    """
+    blob = '\n'.join('      ' + 'A' * 76 for _ in range(max(1, blob_size // 77)))
+    lines = []
+    for s in range(services):
+        lines.append(f'service-{s}:')
+        lines.append('  resources:')
+        for i in range(parameters // 10 + 1):
+            lines.append(f'    limit-{i}: {{cpu: {i}m, memory: {i}Mi, tags: [a, b, c]}}')
+        lines.append('  configmap:')
+        for i in range(parameters):
+            lines.append(f'    CONFIG_{i}: "value-{i}"')
+        lines.append('  secret:')
+        for i in range(parameters // 10 + 1):
+            lines.append(f'    SECRET_{i}: |')
+            lines.append(blob)
+    return '\n'.join(lines) + '\n'
+
+
+def full_load(raw: str) -> dict:
+    config = YAML(typ='safe', pure=True).load(raw)
+    return {service: {kind: list(values[kind].keys()) for kind in KINDS} for service, values in config.items()}
+
+
+def streaming(raw: str) -> dict:
+    return extract_parameters(raw, KINDS)
+
+
+def measure(func, raw: str, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(raw)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--services', type=int, default=10)
+    parser.add_argument('--parameters', type=int, default=300)
+    parser.add_argument('--blob-size', type=int, default=50_000, help='размер одного значения секрета в байтах')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    raw = make_values(args.services, args.parameters, args.blob_size)
+    print(f'values-prod.yaml: {len(raw) / 1024 / 1024:.1f} MiB')
+
+    baseline, base_time, base_peak = measure(full_load, raw, args.repeat)
+    result, new_time, new_peak = measure(streaming, raw, args.repeat)
+    assert baseline == result, 'Результаты загрузчиков не совпадают'
+
+    print(f'{"":<24}{"время, с":>12}{"пик памяти, MiB":>18}')
+    print(f'{"YAML safe pure load":<24}{base_time:>12.3f}{base_peak / 1024 / 1024:>18.1f}')
+    print(f'{"extract_parameters":<24}{new_time:>12.3f}{new_peak / 1024 / 1024:>18.1f}')
+    print(f'Ускорение: x{base_time / new_time:.1f}')
+
+
+if __name__ == '__main__':
+    main()
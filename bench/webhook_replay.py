@@ -0,0 +1,142 @@
+"""
+    Проверка режима сервиса (SERVE=true): отправка серии синтетических событий Merge Request Hook.
+    По умолчанию поднимает fake GitLab (bench/fake_gitlab.py) и main.py в режиме сервиса, отправляет по --pushes
+    push-событий в каждый из --mrs MR и ждёт, пока очередь опустеет. Показывает, сколько событий схлопнулось
+    и сколько раз реально запускалась стадия.
+
+    python -m bench.webhook_replay --mrs 5 --pushes 10
+    python -m bench.webhook_replay --url http://127.0.0.1:8080 --project 42 --mrs 1 --pushes 3 --token secret
+"""
+import argparse
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Optional
+
+from bench.fake_gitlab import FakeGitlabServer
+from bench.gitlab_bench import PROJECT_ID, ROOT, make_project
+
+
+def make_event(project_id: int, mr_iid: int, push: int, action: str = 'update') -> dict:
+    sha = hashlib.sha1(f'{project_id}:{mr_iid}:{push}'.encode()).hexdigest()
+    oldrev = hashlib.sha1(f'{project_id}:{mr_iid}:{push - 1}'.encode()).hexdigest()
+    return {
+        'object_kind': 'merge_request',
+        'event_type': 'merge_request',
+        'project': {'id': project_id},
+        'object_attributes': {
+            'iid': mr_iid,
+            'action': action,
+            'state': 'opened',
+            'source_branch': 'feature',
+            'target_branch': 'dev',
+            'last_commit': {'id': sha},
+            **({'oldrev': oldrev} if action == 'update' else {}),
+        },
+    }
+
+
+def request(url: str, payload: Optional[dict] = None, token: Optional[str] = None) -> dict:
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    headers = {'Content-Type': 'application/json', 'X-Gitlab-Event': 'Merge Request Hook'}
+    if token:
+        headers['X-Gitlab-Token'] = token
+    with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=10) as response:
+        return json.loads(response.read() or b'{}')
+
+
+def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return request(f'{url}/health')
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    raise TimeoutError(f'Сервис {url} не запустился за {timeout} с')
+
+
+def wait_idle(url: str, timeout: float = 300.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = request(f'{url}/health')
+        if not stats['pending'] and not stats['running']:
+            return stats
+        time.sleep(0.1)
+    raise TimeoutError('Очередь не опустела')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Адрес уже запущенного сервиса. Если не задан, сервис и fake GitLab '
+                                      'запускаются локально')
+    parser.add_argument('--project', type=int, default=PROJECT_ID)
+    parser.add_argument('--mrs', type=int, default=3)
+    parser.add_argument('--pushes', type=int, default=10, help='Событий push на каждый MR')
+    parser.add_argument('--token', default='bench')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=20, help='Задержка ответа fake GitLab, мс')
+    args = parser.parse_args()
+
+    fake = service = None
+    url = args.url
+    if not url:
+        os.environ.setdefault('GITLAB_TOKEN', 'bench')
+        project = make_project(argparse.Namespace(values_files=3, parameters=100, changed=5, tree_size=100,
+                                                  diff_size=10, value_size=0))
+        for mr_iid in range(2, args.mrs + 1):
+            project.add_merge_request(mr_iid, 'feature', 'dev')
+        fake = FakeGitlabServer([project], latency=args.latency / 1000)
+        fake.start()
+        port = free_port()
+        url = f'http://127.0.0.1:{port}'
+        env = {**os.environ, 'GITLAB_URL': fake.url, 'CI_JOB_ID': '1', 'SERVE': 'true', 'STAGE': 'all',
+               'WEBHOOK_HOST': '127.0.0.1', 'WEBHOOK_PORT': str(port), 'WEBHOOK_SECRET': args.token,
+               'WEBHOOK_WORKERS': str(args.workers), 'BLOB_CACHE_SIZE': '0', 'LOCAL_REPOSITORY': 'false',
+               'LEDGER_FILE': ''}
+        service = subprocess.Popen([sys.executable, 'main.py'], cwd=ROOT, env=env)
+
+    try:
+        wait_ready(url)
+        start = time.perf_counter()
+        statuses = {}
+        # События идут вперемешку: push'и разных MR чередуются, как при пачке одновременных пайплайнов
+        for push in range(args.pushes):
+            for mr_iid in range(1, args.mrs + 1):
+                action = 'open' if push == 0 else 'update'
+                status = request(url, make_event(args.project, mr_iid, push, action), args.token)['status']
+                statuses[status] = statuses.get(status, 0) + 1
+        stats = wait_idle(url)
+        elapsed = time.perf_counter() - start
+
+        print(f'Отправлено событий: {args.mrs * args.pushes} ({statuses})')
+        print(f'Схлопнуто в очереди: {stats["collapsed"]}, обработано MR: {stats["processed"]}')
+        if fake:
+            requests = {endpoint: stats['requests'] for endpoint, stats in fake.stats.items()}
+            # Каждый запуск стадии один раз строит контекст MR: пакетным GraphQL запросом или через REST /diffs
+            print(f'Запусков стадии: {requests.get("graphql", 0) + requests.get("diffs", 0)}, '
+                  f'чтений MR: {requests.get("graphql", 0) + requests.get("merge_request", 0)}, '
+                  f'коммитов: {requests.get("commit", 0)}')
+            print(f'Запросов к GitLab: {fake.totals()["requests"]}')
+        print(f'Время: {elapsed:.2f} с')
+    finally:
+        if service:
+            service.terminate()
+            service.wait(timeout=60)
+        if fake:
+            fake.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,14 @@
 import os
-from functools import cached_property
+from functools import cached_property, lru_cache
 from typing import List, Dict, Optional
 
-from jinja2.compiler import F
 from pydantic import (
     Field,
     FilePath,
     HttpUrl,
     NonNegativeInt,
+    PositiveInt,
+    PositiveFloat,
     BaseModel,
     ValidationError,
     computed_field,
@@ -70,6 +71,7 @@ class Settings(BaseSettings):
     ci_job_url: Optional[HttpUrl] = Field(default=None, frozen=True, )
     merge_request_iid: Optional[NonNegativeInt] = Field(default=None, frozen=True, )
     source_branch: Optional[str] = Field(default=None, frozen=True, )
+    target_branch: Optional[str] = Field(default=None, frozen=True, )
     source_project_id: Optional[NonNegativeInt] = Field(default=None, frozen=True, )
     current_project_id: Optional[NonNegativeInt] = Field(default=None, frozen=True, alias='CI_PROJECT_ID')
     stage: Optional[str] = Field(default=None, frozen=True, )
@@ -77,9 +79,98 @@ class Settings(BaseSettings):
     gitlab_url: HttpUrl = Field('https://git.edu-infra.ru', frozen=True,
                                 description='URL для доступа к GitLab. При запуске в локальном окружении будет использован URL полученный от Teleport после авторизации')
 
+    tsh_path: str = Field(default='C:\\utils\\tsh', frozen=True,
+                          description='Путь к tsh для авторизации в teleport в локальном режиме')
+    teleport_cache_file: str = Field(
+        default=os.path.join(os.path.expanduser('~'), '.cache', 'readme-generator', 'teleport.json'),
+        frozen=True,
+        description='Файл с сохранёнными кредами teleport (пути к сертификату и ключу, URL GitLab, срок действия)', )
+    teleport_refresh_margin: NonNegativeInt = Field(default=600, frozen=True,
+                                                    description='За сколько секунд до окончания действия сертификата '
+                                                                'выполнять повторную авторизацию в teleport')
+    teleport_ttl: PositiveInt = Field(default=3600, frozen=True,
+                                      description='Срок действия кредов teleport в секундах, если его не удалось '
+                                                  'прочитать из сертификата')
+
+    graphql: bool = Field(default=True, frozen=True,
+                          description='Получать MR, изменённые пути и файлы README/values одним GraphQL запросом. '
+                                      'При ошибке используется REST API')
+    gitlab_concurrency: PositiveInt = Field(default=8, frozen=True,
+                                            description='Максимальное число одновременных запросов к GitLab и размер пула соединений')
+
+    gitlab_max_retries: NonNegativeInt = Field(default=5, frozen=True,
+                                               description='Число повторов запроса к GitLab при 429, 502, 503, 504 '
+                                                           'и обрыве соединения')
+    gitlab_backoff: PositiveFloat = Field(default=0.5, frozen=True,
+                                          description='Базовая задержка перед повтором запроса, с. '
+                                                      'Удваивается с каждым повтором')
+    gitlab_backoff_max: PositiveFloat = Field(default=60.0, frozen=True,
+                                              description='Максимальная задержка перед повтором запроса, с')
+
+    ledger_file: str = Field(
+        default=os.path.join(os.path.expanduser('~'), '.cache', 'readme-generator', 'ledger.sqlite3'),
+        frozen=True,
+        description='Файл SQLite с журналом выполненных стадий. Стадия не запускается повторно, если head SHA MR '
+                    'и SHA blob values-prod.yaml, README.yaml и README.md не изменились. Пустая строка - журнал отключен')
+
+    trace_file: Optional[str] = Field(default=None, frozen=True,
+                                      description='Файл JSON с журналом запросов к GitLab и длительностью стадий')
+    metrics_file: Optional[str] = Field(default=None, frozen=True,
+                                        description='Файл с метриками запросов к GitLab в формате textfile Prometheus')
+
+    profile: bool = Field(default=False, frozen=True,
+                          description='Профилирование стадий: cProfile и tracemalloc, отчёты сохраняются в profile_dir')
+    profile_dir: str = Field(default='profile', frozen=True,
+                             description='Каталог для отчётов профилирования (артефакты CI job)')
+    profile_top: PositiveInt = Field(default=40, frozen=True,
+                                     description='Число строк в текстовых отчётах профилирования')
+    profile_memory: bool = Field(default=True, frozen=True,
+                                 description='Отслеживать выделения памяти через tracemalloc. Замедляет код на Python '
+                                             'в разы и искажает время в отчёте cProfile, для замеров времени - false')
+    profile_frames: PositiveInt = Field(default=1, frozen=True,
+                                        description='Глубина стека, сохраняемая tracemalloc для каждого выделения '
+                                                    'памяти. Каждый кадр заметно замедляет стадию под профилированием')
+
+    parse_workers: PositiveInt = Field(default=os.cpu_count() or 1, frozen=True,
+                                       description='Число процессов для разбора больших файлов values-prod.yaml')
+
+    fleet: bool = Field(default=False, frozen=True,
+                        description='Пакетный режим: запуск стадии для множества проектов и MR за один запуск')
+    fleet_targets: List[str] = Field(default=[], frozen=True,
+                                     description='Цели пакетного режима: "<project_id>:<mr_iid>" или "<project_id>" '
+                                                 '(все открытые MR). Если пусто - все проекты namespace')
+    fleet_workers: PositiveInt = Field(default=4, frozen=True, description='Число потоков пакетного режима')
+    fleet_checkpoint: str = Field(default='.readme-fleet.json', frozen=True,
+                                  description='Файл с прогрессом пакетного режима для продолжения прерванного запуска')
+
+    serve: bool = Field(default=False, frozen=True,
+                        description='Режим сервиса: приём webhook Merge Request Hook от GitLab и запуск стадии '
+                                    'для последнего коммита каждого MR')
+    webhook_host: str = Field(default='0.0.0.0', frozen=True, description='Адрес для приёма webhook')
+    webhook_port: NonNegativeInt = Field(default=8080, frozen=True, description='Порт для приёма webhook')
+    webhook_secret: Optional[SecretStr] = Field(default=None, frozen=True,
+                                                description='Secret token webhook, сверяется с заголовком X-Gitlab-Token')
+    webhook_workers: PositiveInt = Field(default=2, frozen=True, description='Число потоков обработки очереди MR')
+
+    index: bool = Field(default=False, frozen=True,
+                        description='Режим индекса: обновление индекса параметров configmap/secret всех проектов '
+                                    'namespace. Перечитываются только проекты, у которых сдвинулась ветка по умолчанию')
+    index_file: str = Field(
+        default=os.path.join(os.path.expanduser('~'), '.cache', 'readme-generator', 'parameters.sqlite3'),
+        frozen=True,
+        description='Файл SQLite с индексом параметров namespace', )
+    index_workers: PositiveInt = Field(default=8, frozen=True,
+                                       description='Число проектов, индексируемых одновременно')
+    lookup: Optional[str] = Field(default=None, frozen=True,
+                                  description='Поиск по индексу параметров: имя параметра или префикс с "*" на конце. '
+                                              'Выводит проекты и сервисы, в которых он используется')
+
     product: Optional[str] = Field(default=None, frozen=True, )
     namespace: str = Field(default='', frozen=True, alias='CI_PROJECT_ROOT_NAMESPACE')
     project_dir: DirectoryPath = Field(default=os.getcwd(), frozen=True)
+    local_repository: bool = Field(default=True, frozen=True,
+                                   description='Читать файлы из локальной копии project_dir, если джоба запущена в CI '
+                                               'того же проекта. Недоступные локально ветки читаются через API')
 
     readme_pattern: dict = Field(default={
         'team': {'name': '<Name>'},
@@ -98,11 +189,30 @@ class Settings(BaseSettings):
         }
     }, frozen=True, description='Шаблон YAML файла для генерации Readme')
 
+    readme_templates_dir: Optional[DirectoryPath] = Field(
+        default=None,
+        frozen=True,
+        description='Каталог с пользовательским шаблоном README.md.j2. По умолчанию используется встроенный шаблон', )
+
     list_of_checked_paremeters: List[str] = Field(
         default=['configmap', 'secret'],
         frozen=True,
         description='Ключи по которым находятся параметры, необходимые для генерации Readme', )
 
+    blob_cache_dir: str = Field(
+        default=os.path.join(os.path.expanduser('~'), '.cache', 'readme-generator', 'blobs'),
+        frozen=True,
+        description='Каталог локального кэша содержимого файлов. Файлы хранятся по SHA blob из GitLab', )
+    blob_cache_size: NonNegativeInt = Field(
+        default=256 * 1024 * 1024,
+        frozen=True,
+        description='Максимальный размер кэша файлов в байтах. 0 - кэш отключен', )
+    stream_threshold: NonNegativeInt = Field(
+        default=8 * 1024 * 1024,
+        frozen=True,
+        description='Размер файла в байтах, начиная с которого он скачивается потоком на диск и разбирается '
+                    'оттуда, а не загружается в память целиком', )
+
     @computed_field
     @cached_property
     def local_mode(self) -> bool:
@@ -119,8 +229,26 @@ class Settings(BaseSettings):
 
 logger = logger_config(INFO)
 
-try:
-    settings = Settings()
 
-except ValidationError as e:
-    logger.error(f'Exception:{e.json(indent=4)}')
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """
+        Метод читает и проверяет настройки один раз - при первом обращении
+    """
+    try:
+        return Settings()
+    except ValidationError as e:
+        logger.error(f'Exception:{e.json(indent=4)}')
+        exit(1)
+
+
+class LazySettings:
+    """
+        Прокси к Settings: переменные окружения читаются не при импорте модуля, а при первом обращении к атрибуту
+    """
+
+    def __getattr__(self, name: str):
+        return getattr(get_settings(), name)
+
+
+settings = LazySettings()
@@ -0,0 +1,35 @@
+import asyncio
+from typing import Any, Callable, List, Optional, Tuple
+
+from config.settings import settings
+from controller.profiling import profile_call
+
+
+class AsyncGitlab:
+    """
+        Асинхронный запуск методов controller.gitlab.
+        Блокирующие вызовы python-gitlab выполняются в пуле потоков поверх общей keep-alive сессии из get_gitlab,
+        число одновременных запросов ограничено семафором
+    """
+
+    def __init__(self, concurrency: Optional[int] = None):
+        self.concurrency = concurrency or settings.gitlab_concurrency
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def call(self, func: Callable, *args, **kwargs) -> Any:
+        async with self._semaphore:
+            return await asyncio.to_thread(profile_call, func, *args, **kwargs)
+
+    async def gather(self, *calls: Tuple) -> List[Any]:
+        """
+            Выполняет независимые вызовы одновременно. Каждый вызов задаётся кортежем (функция, *аргументы),
+            результаты возвращаются в том же порядке
+        """
+        return await asyncio.gather(*(self.call(*call) for call in calls))
+
+
+def run_concurrently(*calls: Tuple, concurrency: Optional[int] = None) -> List[Any]:
+    """
+        Синхронная обёртка над AsyncGitlab.gather для кода стадий
+    """
+    return asyncio.run(AsyncGitlab(concurrency).gather(*calls))
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import tempfile
+import threading
+from typing import BinaryIO, Optional
+
+from config.settings import logger, settings
+from controller.filelock import file_lock
+
+# Размер части при потоковом чтении и записи blob
+CHUNK_SIZE = 1024 * 1024
+
+# Размер кэша по оценке этого процесса: каталог обходится при первой записи и затем только когда оценка
+# превышает лимит. Записи других процессов учитываются при следующем обходе
+_cache_size: Optional[int] = None
+_cache_size_lock = threading.Lock()
+
+# Вытеснение освобождает кэш с запасом, до этой доли лимита: иначе после заполнения кэша каждая запись
+# снова превышала бы лимит и обходила весь каталог
+EVICT_TARGET = 0.9
+
+
+def git_blob_sha(data: bytes) -> str:
+    """
+        Метод вычисляет SHA blob так же, как git (sha1 от заголовка 'blob <size>\\0' и содержимого)
+    """
+    sha = hashlib.sha1(b'blob %d\0' % len(data))
+    sha.update(data)
+    return sha.hexdigest()
+
+
+def is_enabled() -> bool:
+    return settings.blob_cache_size > 0
+
+
+def blob_path(blob_id: str) -> str:
+    return os.path.join(settings.blob_cache_dir, blob_id[:2], blob_id[2:])
+
+
+def open_blob(blob_id: str) -> Optional[BinaryIO]:
+    """
+        Метод открывает blob из кэша на чтение, не загружая его в память, или возвращает None, если его там нет
+    """
+    if not is_enabled():
+        return None
+    path = blob_path(blob_id)
+    try:
+        stream = open(path, 'rb')
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.debug(f'Не удалось открыть blob {blob_id} из кэша: {e}')
+        return None
+
+    logger.debug(f'Blob {blob_id} взят из кэша')
+    return stream
+
+
+def file_blob_sha(path: str) -> str:
+    """
+        Метод вычисляет SHA blob файла на диске, читая его по частям
+    """
+    sha = hashlib.sha1(b'blob %d\0' % os.path.getsize(path))
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def store_blob_file(blob_id: str, tmp_path: str) -> Optional[BinaryIO]:
+    """
+        Метод переносит в кэш blob, скачанный во временный файл в каталоге кэша, и открывает его на чтение.
+        Возвращает None, если файл в кэш не попал: кэш отключен, файл больше кэша или содержимое не совпадает с SHA
+    """
+    if not is_enabled():
+        return None
+    try:
+        if os.path.getsize(tmp_path) > settings.blob_cache_size:
+            return None
+        if file_blob_sha(tmp_path) != blob_id:
+            logger.warning(f'Содержимое не совпадает с SHA {blob_id}, в кэш не сохраняем')
+            return None
+        path = blob_path(blob_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        # Файл открывается до вытеснения, чтобы его не удалил параллельный процесс
+        stream = open(path, 'rb')
+    except OSError as e:
+        logger.debug(f'Не удалось сохранить blob {blob_id} в кэш: {e}')
+        return None
+
+    account(os.fstat(stream.fileno()).st_size)
+    return stream
+
+
+def write_blob(blob_id: str, data: bytes):
+    """
+        Метод сохраняет blob в кэш. Запись идёт во временный файл с последующим атомарным переименованием,
+        поэтому параллельные джобы на одном раннере никогда не увидят недописанный файл
+    """
+    if not is_enabled():
+        return
+    if git_blob_sha(data) != blob_id:
+        logger.warning(f'Содержимое не совпадает с SHA {blob_id}, в кэш не сохраняем')
+        return
+
+    path = blob_path(blob_id)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError as e:
+        logger.debug(f'Не удалось сохранить blob {blob_id} в кэш: {e}')
+        return
+
+    account(len(data))
+
+
+def account(size: int):
+    """
+        Метод учитывает записанный в кэш blob и запускает вытеснение, только если оценка размера кэша превысила лимит
+    """
+    global _cache_size
+    with _cache_size_lock:
+        if _cache_size is not None:
+            _cache_size += size
+            if _cache_size <= settings.blob_cache_size:
+                return
+    evict()
+
+
+def evict():
+    """
+        Метод вытесняет давно неиспользуемые blob, если кэш превысил лимит, пока его размер не станет меньше
+        EVICT_TARGET от лимита.
+        Если вытеснение уже выполняет другой процесс - ничего не делает.
+        Blob, который не удалось удалить (на Windows - открытый другим процессом), остаётся до следующего раза
+    """
+    global _cache_size
+    root = settings.blob_cache_dir
+    with file_lock(os.path.join(root, '.evict.lock'), blocking=False) as acquired:
+        if not acquired:
+            return
+
+        entries = []
+        total = 0
+        for directory, _, files in os.walk(root):
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total > settings.blob_cache_size:
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.debug(f'Не удалось удалить blob {path} из кэша: {e}')
+                    continue
+                total -= size
+                if total <= settings.blob_cache_size * EVICT_TARGET:
+                    break
+            logger.debug(f'Кэш blob очищен до {total} байт')
+
+        with _cache_size_lock:
+            _cache_size = total
@@ -0,0 +1,42 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = 30.0, stale: float = 120.0, blocking: bool = True) -> Iterator[bool]:
+    """
+        Межпроцессная блокировка на lock-файле (O_CREAT | O_EXCL), работает и на CI раннере, и в локальном режиме на Windows.
+        Lock-файл старше stale секунд считается брошенным упавшим процессом и удаляется.
+        При blocking=False не ждёт освобождения и отдаёт False, если блокировка занята
+    """
+    deadline = time.monotonic() + timeout
+    acquired = False
+    while not acquired:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            acquired = True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if not blocking:
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'Не удалось получить блокировку {path} за {timeout} с')
+            time.sleep(0.05)
+
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -1,42 +1,66 @@
-import base64
+import io
+import os
 import re
-import subprocess
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from gitlab.utils import EncodedId
 from gitlab.v4.objects import Project, MergeRequest
 from requests import Session
 
 from config.settings import logger, settings
-from gitlab import Gitlab, GitlabGetError, GitlabCreateError
+from controller.blob_cache import CHUNK_SIZE, git_blob_sha, is_enabled, open_blob, store_blob_file, write_blob
+from controller.local_repo import LocalRefError, LocalRepository, open_repository
+from controller.ratelimit import AdaptiveLimiter, RetryAdapter
+from controller.teleport import get_credentials as get_teleport_credentials
+from controller.tracing import install as install_tracing
+from gitlab import Gitlab, GitlabGetError, GitlabCreateError, GitlabHeadError, GitlabHttpError
 
-from logging import INFO
-from ruamel.yaml import YAML
 
-def get_credentials() -> ():
+class CommitConflictError(Exception):
     """
-        Метод для получения кредов для подключения к gitlab через телепорт
+        Действие коммита противоречит содержимому ветки: создаётся файл, который в ветке уже есть
     """
-    output = None
-    logger.info('Авторизация в teleport')
-    try:
-        output = subprocess.getoutput('C:\\utils\\tsh app login gitlab')
-    except Exception as e:
-        logger.exception(f'Ошибка при авторизации в teleport: {e}')
 
-    cert_regex = r'(?<=cert\s").+(?="\s\\)'
-    key_regex = r'(?<=key\s").+(?="\s\\)'
-    url_regex = r'https.+'
 
-    cert_list = re.findall(cert_regex, output)
-    key_list = re.findall(key_regex, output)
-    url_list = re.findall(url_regex, output)
+def get_credentials() -> Tuple[str, str, str]:
+    """
+        Метод для получения кредов для подключения к gitlab через телепорт.
+        Креды кэшируются локально до окончания действия сертификата
+    """
+    return get_teleport_credentials()
+
+
+class GitlabClient(Gitlab):
+    """
+        Gitlab без собственных повторов python-gitlab при 429 (obey_rate_limit, до 10 повторов на запрос).
+        Повторы выполняет RetryAdapter сессии, а двойной слой повторов умножал бы их: каждый повтор python-gitlab
+        снова проходил бы все повторы адаптера. retry_transient_errors остаётся выключенным по умолчанию
+    """
+
+    def http_request(self, *args, obey_rate_limit: bool = False, **kwargs):
+        return super().http_request(*args, obey_rate_limit=obey_rate_limit, **kwargs)
 
-    if len(cert_list) != 1:
-        raise ValueError(f'Не удаётся распознать путь к сертификату. Найдено путей: {len(cert_list)}')
-    if len(key_list) != 1:
-        raise ValueError(f'Не удаётся распознать путь к ключу. Найдено путей: {len(key_list)}')
-    if len(key_list) != 1:
-        raise ValueError(f'Не удаётся распознать URL. Найдено URL: {len(url_list)}')
 
-    return cert_list[0], key_list[0], url_list[0]
+def get_session() -> Session:
+    """
+        Метод создаёт HTTP сессию с пулом keep-alive соединений на gitlab_concurrency одновременных запросов.
+        Запросы повторяются при 429/5xx с учётом Retry-After и RateLimit-*, а число одновременных запросов
+        снижается при ответах 429/5xx и постепенно возвращается к gitlab_concurrency
+    """
+    session = Session()
+    adapter = RetryAdapter(
+        AdaptiveLimiter(settings.gitlab_concurrency),
+        max_retries=settings.gitlab_max_retries,
+        backoff=settings.gitlab_backoff,
+        backoff_max=settings.gitlab_backoff_max,
+        pool_connections=settings.gitlab_concurrency,
+        pool_maxsize=settings.gitlab_concurrency,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    install_tracing(session)
+    return session
 
 
 def get_gitlab() -> Gitlab:
@@ -45,16 +69,17 @@ def get_gitlab() -> Gitlab:
     """
     logger.info('Подключение к GitLab')
     try:
+        session = get_session()
         if settings.local_mode:
             cert, key, url = get_credentials()
             if cert and key:
-                session = Session()
                 session.cert = (cert, key)
-                gl = Gitlab(url=url, session=session, private_token=settings.gitlab_token.get_secret_value())
+                gl = GitlabClient(url=url, session=session, private_token=settings.gitlab_token.get_secret_value())
             else:
                 raise ValueError('Сертификат или ключ, для подключения к GitLab не получены')
         else:
-            gl = Gitlab(url=str(settings.gitlab_url), private_token=settings.gitlab_token.get_secret_value())
+            gl = GitlabClient(url=str(settings.gitlab_url), session=session,
+                              private_token=settings.gitlab_token.get_secret_value())
     except Exception as e:
         logger.exception(f'Ошибка при подключении к GitLab: {e}')
         raise Exception(e)
@@ -63,12 +88,64 @@ def get_gitlab() -> Gitlab:
     return gl
 
 
+# Головы веток, которые есть в локальной копии: (проект, ref) -> sha или None, если читать нужно из GitLab
+_local_heads: Dict[Tuple[int, str], Optional[str]] = {}
+
+
+def get_local_repository(project: Project) -> Optional[LocalRepository]:
+    """
+        Метод возвращает локальную копию, если джоба запущена в CI того же проекта и чтение из неё разрешено
+    """
+    if not settings.local_repository or project.id != settings.current_project_id:
+        return None
+    return open_repository(str(settings.project_dir))
+
+
+def get_local_commit(project: Project, ref: str) -> Optional[Tuple[LocalRepository, str]]:
+    """
+        Метод возвращает локальную копию и коммит, из которых можно читать ref.
+        Голова ветки всегда берётся из GitLab (один запрос на ветку), поэтому устаревшая локальная копия
+        или ветка, в которую уже закоммитили, не подменят данные - в этом случае чтение идёт через API
+    """
+    repository = get_local_repository(project)
+    if not repository:
+        return None
+
+    key = (project.id, ref)
+    if key not in _local_heads:
+        try:
+            sha = ref if re.fullmatch(r'[0-9a-f]{40}', ref) else project.branches.get(ref).commit['id']
+        except GitlabGetError:
+            sha = None
+        _local_heads[key] = sha if sha and repository.has_commit(sha) else None
+        if sha and not _local_heads[key]:
+            logger.debug(f'Коммит {sha} ветки {ref} отсутствует в локальной копии, читаем из GitLab')
+
+    commit = _local_heads[key]
+    return (repository, commit) if commit else None
+
+
+# Полные деревья каталогов по ключу (проект, ref, путь, recursive): дерево .helm нужно и журналу стадий,
+# и сбору параметров
+_tree_cache: Dict[Tuple[int, str, Optional[str], bool], list] = {}
+
+
 def get_repository_tree(project: Project, ref, path=None, all=True, recursive=True):
     """
-        Метод для получения дерева репозитория из GitLab
+        Метод для получения дерева репозитория из GitLab. Полное дерево (all=True) запоминается для ветки
     """
+    local = get_local_commit(project, ref)
+    if local:
+        repository, commit = local
+        return repository.tree(commit, path, recursive)
+
+    key = (project.id, ref, path, recursive)
+    if all and key in _tree_cache:
+        return _tree_cache[key]
     try:
         items = project.repository_tree(path=path, ref=ref, all=all, recursive=recursive)
+        if all:
+            _tree_cache[key] = items
         return items
 
     except GitlabGetError:
@@ -78,22 +155,320 @@ def get_repository_tree(project: Project, ref, path=None, all=True, recursive=Tr
         raise Exception(e)
 
 
-def get_file(project: Project, file_path: str, branch: str) -> str:
+def iter_repository_tree(project: Project, ref, path=None, recursive=True) -> Iterator[dict]:
     """
-        Метод для получения содержимого файла, из GitLab
+        Метод лениво обходит дерево репозитория: следующая страница запрашивается только когда закончилась предыдущая
     """
+    local = get_local_commit(project, ref)
+    if local:
+        repository, commit = local
+        yield from repository.tree(commit, path, recursive)
+        return
+
     try:
-        file = project.files.get(file_path=file_path, ref=branch)
-        raw_file = base64.b64decode(file.content).decode('utf-8')
-        return raw_file
+        yield from project.repository_tree(path=path, ref=ref, recursive=recursive, iterator=True)
 
     except GitlabGetError:
+        logger.debug(f'Дерево для пути {path} в проекте {project.id}, ветки {ref} не найдено')
+
+
+# Результаты поиска файлов по ключу (проект, ref, путь/имя). None - файл не найден
+_file_meta_cache: Dict[Tuple[int, str, str], Optional[dict]] = {}
+_file_lookup_cache: Dict[Tuple[int, str, str], Optional[dict]] = {}
+
+
+def get_file_meta(project: Project, file_path: str, ref: str) -> Optional[dict]:
+    """
+        Метод получает метаданные файла по точному пути (HEAD запрос, без скачивания содержимого).
+        Возвращает запись в формате дерева репозитория или None, если файла нет
+    """
+    key = (project.id, ref, file_path)
+    if key in _file_meta_cache:
+        return _file_meta_cache[key]
+
+    local = get_local_commit(project, ref)
+    if local:
+        repository, commit = local
+        _file_meta_cache[key] = repository.file_meta(commit, file_path)
+        return _file_meta_cache[key]
+
+    try:
+        headers = project.files.head(file_path, ref=ref)
+        meta = {
+            'id': headers.get('X-Gitlab-Blob-Id'),
+            'name': headers.get('X-Gitlab-File-Name', file_path.rsplit('/', 1)[-1]),
+            'path': headers.get('X-Gitlab-File-Path', file_path),
+            'type': 'blob',
+            'size': int(headers.get('X-Gitlab-Size', 0)),
+        }
+    except GitlabHeadError as e:
+        if e.response_code != 404:
+            raise
+        meta = None
+
+    _file_meta_cache[key] = meta
+    return meta
+
+
+def find_file(project: Project, ref: str, file_name: str, paths: Optional[List[str]] = None,
+              fallback: bool = True) -> Optional[dict]:
+    """
+        Метод ищет файл в репозитории. Сначала проверяются известные пути (по умолчанию - корень репозитория),
+        затем, если fallback=True, дерево обходится лениво до первого файла с подходящим именем.
+        Результат запоминается для пары (проект, ref)
+    """
+    key = (project.id, ref, file_name)
+    if key in _file_lookup_cache:
+        return _file_lookup_cache[key]
+
+    found = None
+    for path in paths or [file_name]:
+        found = get_file_meta(project, path, ref)
+        if found:
+            break
+
+    if not found and fallback:
+        logger.debug(f'Файл {file_name} не найден по известным путям, ищем в дереве ветки {ref}')
+        found = next((item for item in iter_repository_tree(project, ref)
+                      if item.get('type') == 'blob' and item.get('name') == file_name), None)
+
+    _file_lookup_cache[key] = found
+    return found
+
+
+# Содержимое файлов, полученное пакетными запросами, по SHA blob
+_primed_blobs: Dict[str, bytes] = {}
+
+
+def prime_file(project: Project, ref: str, file_path: str, blob: Optional[dict]):
+    """
+        Метод запоминает файл, полученный другим способом (например, пакетным GraphQL запросом),
+        чтобы get_file_meta и get_file для него не ходили в GitLab. blob=None - файла в ветке нет.
+        Если в blob нет rawBlob, запоминаются только метаданные: содержимое скачивается get_file по SHA blob
+    """
+    key = (project.id, ref, file_path)
+    if not blob:
+        _file_meta_cache[key] = None
+        return
+
+    if blob.get('rawBlob') is None:
+        _file_meta_cache[key] = {
+            'id': blob['oid'],
+            'name': file_path.rsplit('/', 1)[-1],
+            'path': file_path,
+            'type': 'blob',
+            'size': int(blob.get('size') or 0),
+        }
+        return
+
+    data = blob['rawBlob'].encode('utf-8')
+    if git_blob_sha(data) != blob['oid']:
+        logger.debug(f'Содержимое {file_path} из пакетного запроса не совпадает с SHA blob, не используем его')
+        return
+    _file_meta_cache[key] = {
+        'id': blob['oid'],
+        'name': file_path.rsplit('/', 1)[-1],
+        'path': file_path,
+        'type': 'blob',
+        'size': len(data),
+    }
+    _primed_blobs[blob['oid']] = data
+    write_blob(blob['oid'], data)
+
+
+def forget_file(project: Project, ref: str, file_path: str):
+    """
+        Метод сбрасывает запомненные результаты поиска файла после его изменения в ветке
+    """
+    _file_meta_cache.pop((project.id, ref, file_path), None)
+    _file_lookup_cache.pop((project.id, ref, file_path.rsplit('/', 1)[-1]), None)
+    for key in [key for key in list(_tree_cache) if key[:2] == (project.id, ref)]:
+        _tree_cache.pop(key, None)
+    _local_heads.pop((project.id, ref), None)
+
+
+def forget_refs(project_id: int, refs: List[str]):
+    """
+        Метод сбрасывает все запомненные результаты по веткам проекта. Нужен долгоживущему процессу:
+        ветки двигаются, а файлы и метаданные кэшируются по имени ветки.
+        Содержимое по SHA blob не меняется, поэтому дисковый кэш остаётся
+    """
+    refs = set(refs)
+    for cache in (_file_meta_cache, _file_lookup_cache, _tree_cache):
+        for key in [key for key in list(cache) if key[0] == project_id and key[1] in refs]:
+            cache.pop(key, None)
+    for ref in refs:
+        _local_heads.pop((project_id, ref), None)
+    _primed_blobs.clear()
+
+
+def read_local_blob(repository: LocalRepository, blob_id: str) -> Optional[bytes]:
+    # SHA blob в GitLab и в локальной копии совпадают, поэтому любой известный blob можно прочитать локально
+    try:
+        return repository.read_blob(blob_id)
+    except LocalRefError:
+        return None
+
+
+def download_file(project: Project, file_path: str, branch: str,
+                  blob_id: Optional[str]) -> Tuple[BinaryIO, Optional[str]]:
+    """
+        Метод скачивает файл из GitLab без JSON и base64: по SHA blob, а если он неизвестен - по пути в ветке.
+        Файл меньше stream_threshold читается в память. Файл больше порога или неизвестного размера пишется
+        на диск по частям и открывается оттуда - в кэш, если он помещается, иначе во временный файл.
+        Возвращает поток и путь временного файла, который нужно удалить после чтения
+    """
+    if blob_id:
+        url = f'/projects/{project.id}/repository/blobs/{blob_id}/raw'
+        query = {}
+    else:
+        url = f'/projects/{project.id}/repository/files/{EncodedId(file_path)}/raw'
+        query = {'ref': branch}
+
+    response = project.manager.gitlab.http_get(url, query_data=query, streamed=True, raw=True)
+    try:
+        length = response.headers.get('Content-Length')
+        if length and int(length) < settings.stream_threshold:
+            data = response.content
+            if blob_id:
+                write_blob(blob_id, data)
+            return io.BytesIO(data), None
+
+        logger.debug(f'Файл {file_path} ({length or "?"} байт) скачивается потоком')
+        # Временный файл создаётся в каталоге кэша, чтобы перенести его туда без копирования
+        directory = settings.blob_cache_dir if is_enabled() else None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    finally:
+        response.close()
+
+    stream = store_blob_file(blob_id, tmp_path) if blob_id else None
+    if stream:
+        return stream, None
+    return open(tmp_path, 'rb'), tmp_path
+
+
+def get_file_stream(project: Project, file_path: str, branch: str,
+                    blob_id: Optional[str] = None) -> Tuple[Optional[BinaryIO], Optional[str]]:
+    """
+        Метод находит содержимое файла: пакетный запрос, локальная копия, дисковый кэш по SHA blob и только затем GitLab.
+        Возвращает поток (None, если файла нет) и путь временного файла, который нужно удалить после чтения
+    """
+    try:
+        if not blob_id:
+            meta = get_file_meta(project, file_path, branch)
+            if not meta:
+                logger.debug(f'Файл {file_path} в проекте {project.id} не найден')
+                return None, None
+            blob_id = meta.get('id')
+
+        if blob_id:
+            data = _primed_blobs.get(blob_id)
+            repository = get_local_repository(project) if data is None else None
+            if repository:
+                data = read_local_blob(repository, blob_id)
+            if data is not None:
+                return io.BytesIO(data), None
+            stream = open_blob(blob_id)
+            if stream:
+                return stream, None
+
+        return download_file(project, file_path, branch, blob_id)
+
+    except (GitlabGetError, GitlabHeadError, GitlabHttpError):
         logger.debug(f'Файл {file_path} в проекте {project.id} не найден')
+        return None, None
 
 
-def create_commit(project: Project, target_branch: str, file_path: str, action: str, content: str):
+@contextmanager
+def open_file(project: Project, file_path: str, branch: str,
+              blob_id: Optional[str] = None) -> Iterator[Optional[BinaryIO]]:
     """
-        Метод создаёт и пушит коммит в целевую ветку проекта
+        Метод открывает файл на чтение как бинарный поток, не загружая большие файлы в память целиком.
+        Если файл не найден, возвращается None
+    """
+    stream, tmp_path = get_file_stream(project, file_path, branch, blob_id)
+    try:
+        yield stream
+    finally:
+        if stream:
+            stream.close()
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+def get_file(project: Project, file_path: str, branch: str, blob_id: Optional[str] = None) -> str:
+    """
+        Метод для получения содержимого файла, из GitLab.
+        Содержимое кэшируется на диске по SHA blob: если blob_id уже известен (например, из дерева репозитория),
+        то при попадании в кэш запросов к GitLab нет вовсе, иначе достаточно одного HEAD запроса за метаданными
+    """
+    with open_file(project, file_path, branch, blob_id) as stream:
+        return stream.read().decode('utf-8') if stream else None
+
+
+def create_commit(project: Project, target_branch: str, file_path: str, action: str, content: str,
+                  commit_message: str = "Создан новый файл README.yaml, который необходимо заполнить"):
+    """
+        Метод создаёт и пушит коммит с одним файлом в целевую ветку проекта
+    """
+    return create_commit_actions(project, target_branch, [{
+        'action': action,  # create или 'update' для существующих файлов
+        'file_path': file_path,
+        'content': content
+    }], commit_message)
+
+
+def skip_unchanged(project: Project, target_branch: str, actions: List[dict]) -> List[dict]:
+    """
+        Метод убирает из коммита файлы, содержимое которых совпадает с уже лежащим в ветке.
+        Сравнивается SHA blob, вычисленный локально, с blob_id файла в GitLab, поэтому содержимое не скачивается.
+        create для файла, который уже есть в ветке, не превращается в update: содержимое собрано без учёта этого файла
+        и затёрло бы его. В этом случае коммит не создаётся вовсе и выбрасывается CommitConflictError
+    """
+    result = []
+    for action in actions:
+        if action['action'] not in ('create', 'update'):
+            result.append(action)
+            continue
+
+        meta = get_file_meta(project, action['file_path'], target_branch)
+        if meta and meta.get('id') == git_blob_sha(action['content'].encode('utf-8')):
+            logger.info(f"Файл {action['file_path']} в ветке {target_branch} не изменился, пропускаем")
+            continue
+
+        if meta and action['action'] == 'create':
+            raise CommitConflictError(f"Файл {action['file_path']} уже есть в ветке {target_branch}, "
+                                      f"создание отменено")
+        if not meta and action['action'] == 'update':
+            logger.warning(f"Файла {action['file_path']} нет в ветке {target_branch}, он будет создан")
+            action = {**action, 'action': 'create'}
+        result.append(action)
+    return result
+
+
+# Последний коммит генератора в ветку: (проект, ветка) -> (id коммита, {путь: SHA blob или None для удалённых})
+_last_commits: Dict[Tuple[int, str], Tuple[str, Dict[str, Optional[str]]]] = {}
+
+
+def pop_last_commit(project_id: int, branch: str) -> Optional[Tuple[str, Dict[str, Optional[str]]]]:
+    """
+        Метод возвращает и забывает последний коммит, сделанный генератором в ветку в этом процессе
+    """
+    return _last_commits.pop((project_id, branch), None)
+
+
+def create_commit_actions(project: Project, target_branch: str, actions: List[dict], commit_message: str):
+    """
+        Метод создаёт и пушит в целевую ветку проекта один коммит с несколькими действиями над файлами
     """
     logger.info(f"Коммитим в ветку {target_branch} проекта {project.name}")
 
@@ -109,23 +484,31 @@ def create_commit(project: Project, target_branch: str, file_path: str, action:
         })
     """
 
-    # Создаем или обновляем файл
+    actions = skip_unchanged(project, target_branch, actions)
+    if not actions:
+        logger.info(f"Содержимое файлов в ветке {target_branch} не изменилось, коммит пропущен")
+        return None
+
+    # Создаем или обновляем файлы
     commit_data = {
         'branch': target_branch,
-        'commit_message': "Создан новый файл README.yaml, который необходимо заполнить",
-        'actions': [{
-            'action': action,  # create или 'update' для существующих файлов
-            'file_path': file_path,
-            'content': content
-        }]
+        'commit_message': commit_message,
+        'actions': actions
     }
 
     # Создаем коммит
     try:
         commit = project.commits.create(commit_data)
+        for action in actions:
+            forget_file(project, target_branch, action['file_path'])
+        _last_commits[(project.id, target_branch)] = (commit.id, {
+            action['file_path']: git_blob_sha(action['content'].encode('utf-8')) if 'content' in action else None
+            for action in actions
+        })
 
         logger.info(f"Коммит создан успешно! ID: {commit.id}")
         logger.info(f"Ссылка: {commit.web_url}")
+        return commit
 
     except Exception as e:
         print(f"Ошибка: {str(e)}")
@@ -0,0 +1,109 @@
+from typing import Dict, List, Optional
+
+from gitlab import Gitlab
+
+from config.settings import logger
+
+# Файлы, которые нужны стадиям на обеих ветках MR. Содержимое приходит в ответе GraphQL целиком, поэтому
+# запрашивается только для небольших README. Для values-prod.yaml, который может быть сколь угодно большим,
+# запрашиваются только SHA blob и размер: содержимое скачивается отдельно, из кэша или потоком (stream_threshold)
+BUNDLE_PATHS = ['README.yaml', 'README.md']
+BUNDLE_META_PATHS = ['.helm/values-prod.yaml']
+
+MERGE_REQUEST_QUERY = """
+query ReadmeBundle($ids: [ID!], $iid: String!, $paths: [String!]!, $metaPaths: [String!]!,
+                   $source: String!, $target: String!, $withBlobs: Boolean!) {
+  projects(ids: $ids) {
+    nodes {
+      id
+      name
+      fullPath
+      webUrl
+      mergeRequest(iid: $iid) {
+        iid
+        title
+        state
+        webUrl
+        sourceBranch
+        targetBranch
+        diffHeadSha
+        diffStats { path }
+      }
+      source: repository @include(if: $withBlobs) {
+        blobs(ref: $source, paths: $paths) { nodes { path oid size rawBlob } }
+      }
+      target: repository @include(if: $withBlobs) {
+        blobs(ref: $target, paths: $paths) { nodes { path oid size rawBlob } }
+      }
+      sourceMeta: repository @include(if: $withBlobs) {
+        blobs(ref: $source, paths: $metaPaths) { nodes { path oid size } }
+      }
+      targetMeta: repository @include(if: $withBlobs) {
+        blobs(ref: $target, paths: $metaPaths) { nodes { path oid size } }
+      }
+    }
+  }
+}
+"""
+
+
+class GraphQLError(Exception):
+    pass
+
+
+def graphql_query(gl: Gitlab, query: str, variables: dict) -> dict:
+    """
+        Метод выполняет запрос к GraphQL API GitLab через ту же сессию и авторизацию, что и REST
+    """
+    response = gl.http_post(f'{gl.url}/api/graphql', post_data={'query': query, 'variables': variables})
+    if response.get('errors'):
+        raise GraphQLError('; '.join(error.get('message', str(error)) for error in response['errors']))
+    return response['data']
+
+
+def _blobs(*repositories: Optional[dict]) -> Dict[str, dict]:
+    return {blob['path']: blob for repository in repositories if repository
+            for blob in repository['blobs']['nodes']}
+
+
+def fetch_merge_request_bundle(gl: Gitlab, project_id: int, mr_iid: int, source_branch: Optional[str] = None,
+                               target_branch: Optional[str] = None, paths: List[str] = BUNDLE_PATHS,
+                               meta_paths: List[str] = BUNDLE_META_PATHS) -> dict:
+    """
+        Метод одним запросом получает проект, MR, изменённые пути, содержимое README.yaml и README.md и
+        метаданные values-prod.yaml (без содержимого) на обеих ветках.
+        Если ветки заранее неизвестны - нужен ещё один запрос за файлами.
+        Возвращает {'project', 'merge_request', 'changed_paths', 'files': {ветка: {путь: blob или None}}},
+        у blob файлов из meta_paths нет rawBlob
+    """
+    variables = {
+        'ids': [f'gid://gitlab/Project/{project_id}'],
+        'iid': str(mr_iid),
+        'paths': paths,
+        'metaPaths': meta_paths,
+        'source': source_branch or '',
+        'target': target_branch or '',
+        'withBlobs': bool(source_branch and target_branch),
+    }
+    nodes = graphql_query(gl, MERGE_REQUEST_QUERY, variables)['projects']['nodes']
+    if not nodes or not nodes[0].get('mergeRequest'):
+        raise GraphQLError(f'Проект {project_id} или merge request {mr_iid} не найден')
+    project = nodes[0]
+    mr = project['mergeRequest']
+
+    if (mr['sourceBranch'], mr['targetBranch']) != (variables['source'], variables['target']):
+        logger.debug('Ветки MR не были известны заранее, запрашиваем файлы вторым запросом')
+        variables.update(source=mr['sourceBranch'], target=mr['targetBranch'], withBlobs=True)
+        project = graphql_query(gl, MERGE_REQUEST_QUERY, variables)['projects']['nodes'][0]
+
+    source_blobs = _blobs(project.get('source'), project.get('sourceMeta'))
+    target_blobs = _blobs(project.get('target'), project.get('targetMeta'))
+    return {
+        'project': project,
+        'merge_request': mr,
+        'changed_paths': {diff['path'] for diff in mr.get('diffStats') or []},
+        'files': {
+            mr['sourceBranch']: {path: source_blobs.get(path) for path in [*paths, *meta_paths]},
+            mr['targetBranch']: {path: target_blobs.get(path) for path in [*paths, *meta_paths]},
+        },
+    }
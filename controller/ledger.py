@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+from config.settings import logger, settings
+
+# Записи старше этого срока удаляются: MR столько не живут, а файл журнала не должен расти бесконечно
+RETENTION = 30 * 24 * 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    project_id INTEGER NOT NULL,
+    merge_request_iid INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    head_sha TEXT,
+    result TEXT NOT NULL,
+    commit_id TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (project_id, merge_request_iid, stage, fingerprint)
+)
+'''
+
+# Состояние входных данных: head SHA исходной ветки и SHA blob файлов по ключу (ветка MR, путь),
+# ветка - 'source' или 'target'. None - файла нет
+Blobs = Dict[Tuple[str, str], Optional[str]]
+
+
+def fingerprint(stage: str, head_sha: str, blobs: Blobs, paths: Iterable[str]) -> str:
+    """
+        Метод вычисляет отпечаток входных данных стадии: head SHA и SHA blob нужных стадии файлов в обеих ветках
+    """
+    paths = set(paths)
+    data = {
+        'stage': stage,
+        'head': head_sha,
+        'blobs': sorted([branch, path, blob] for (branch, path), blob in blobs.items() if path in paths),
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Ledger:
+    """
+        Журнал выполненных стадий в SQLite: (проект, MR, стадия, отпечаток входных данных) -> результат.
+        WAL и busy_timeout позволяют параллельным джобам и потокам сервиса читать и писать один файл
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.connection() as connection:
+            connection.execute(SCHEMA)
+            connection.execute('DELETE FROM runs WHERE created_at < ?', (time.time() - RETENTION,))
+
+    def connection(self) -> sqlite3.Connection:
+        # Соединение sqlite3 нельзя использовать из разных потоков, поэтому у каждого потока своё
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA busy_timeout=30000')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    def seen(self, project_id: int, mr_iid: int, stage: str, fingerprint: str) -> bool:
+        row = self.connection().execute(
+            'SELECT 1 FROM runs WHERE project_id = ? AND merge_request_iid = ? AND stage = ? AND fingerprint = ?',
+            (project_id, mr_iid, stage, fingerprint),
+        ).fetchone()
+        return row is not None
+
+    def record(self, project_id: int, mr_iid: int, stage: str, fingerprint: str, head_sha: str, result: str,
+               commit_id: Optional[str] = None):
+        self.connection().execute(
+            'INSERT OR REPLACE INTO runs (project_id, merge_request_iid, stage, fingerprint, head_sha, result, '
+            'commit_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (project_id, mr_iid, stage, fingerprint, head_sha, result, commit_id, time.time()),
+        )
+
+
+@lru_cache(maxsize=None)
+def get_ledger() -> Optional[Ledger]:
+    """
+        Метод возвращает журнал стадий или None, если он отключён (пустой ledger_file) или файл недоступен
+    """
+    if not settings.ledger_file:
+        return None
+    try:
+        return Ledger(settings.ledger_file)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f'Журнал стадий {settings.ledger_file} недоступен, работаем без него: {e}')
+        return None
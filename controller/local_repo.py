@@ -0,0 +1,123 @@
+import os
+import subprocess
+import threading
+from functools import lru_cache
+from typing import List, Optional, Set
+
+from config.settings import logger
+
+
+class LocalRefError(Exception):
+    """
+        Коммит или путь недоступен в локальной копии, нужно идти в GitLab
+    """
+
+
+class LocalRepository:
+    """
+        Чтение деревьев и blob из рабочей копии репозитория (settings.project_dir) без обращения к GitLab.
+        Содержимое и метаданные читаются через долгоживущие процессы git cat-file --batch / --batch-check
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._batch: Optional[subprocess.Popen] = None
+        self._batch_check: Optional[subprocess.Popen] = None
+
+    def _git(self, *args: str) -> bytes:
+        result = subprocess.run(['git', '-C', self.path, *args], capture_output=True)
+        if result.returncode != 0:
+            raise LocalRefError(result.stderr.decode('utf-8', 'replace').strip())
+        return result.stdout
+
+    def _start(self, mode: str) -> subprocess.Popen:
+        return subprocess.Popen(['git', '-C', self.path, 'cat-file', mode],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def _check(self, spec: str) -> Optional[tuple]:
+        # Ответ --batch-check: '<sha> <type> <size>' или '<spec> missing'
+        with self._lock:
+            if self._batch_check is None:
+                self._batch_check = self._start('--batch-check')
+            self._batch_check.stdin.write(spec.encode('utf-8') + b'\n')
+            self._batch_check.stdin.flush()
+            header = self._batch_check.stdout.readline().decode('utf-8').split()
+        if len(header) != 3:
+            return None
+        return header[0], header[1], int(header[2])
+
+    def has_commit(self, sha: str) -> bool:
+        found = self._check(sha)
+        return bool(found) and found[1] == 'commit'
+
+    def read_blob(self, sha: str) -> bytes:
+        with self._lock:
+            if self._batch is None:
+                self._batch = self._start('--batch')
+            self._batch.stdin.write(sha.encode('utf-8') + b'\n')
+            self._batch.stdin.flush()
+            header = self._batch.stdout.readline().split()
+            if len(header) != 3:
+                raise LocalRefError(f'Объект {sha} не найден в локальной копии')
+            data = self._batch.stdout.read(int(header[2]))
+            self._batch.stdout.read(1)  # перевод строки после содержимого
+        return data
+
+    def file_meta(self, commit: str, file_path: str) -> Optional[dict]:
+        found = self._check(f'{commit}:{file_path}')
+        if not found or found[1] != 'blob':
+            return None
+        return {
+            'id': found[0],
+            'name': file_path.rsplit('/', 1)[-1],
+            'path': file_path,
+            'type': 'blob',
+            'size': found[2],
+        }
+
+    def tree(self, commit: str, path: Optional[str] = None, recursive: bool = True) -> List[dict]:
+        """
+            Метод возвращает дерево в том же формате, что и GitLab API (id, name, path, type, mode)
+        """
+        path = (path or '').strip('/')
+        if path in ('', '.'):
+            path = ''
+        treeish = f'{commit}:{path}' if path else commit
+        if not self._check(treeish):
+            return []
+
+        args = ['ls-tree', '-z', '-t'] + (['-r'] if recursive else []) + [treeish]
+        items = []
+        for record in self._git(*args).decode('utf-8').split('\0'):
+            if not record:
+                continue
+            info, name = record.split('\t', 1)
+            mode, kind, sha = info.split()
+            full_path = f'{path}/{name}' if path else name
+            items.append({'id': sha, 'name': full_path.rsplit('/', 1)[-1], 'path': full_path, 'type': kind, 'mode': mode})
+        return items
+
+    def changed_paths(self, target_commit: str, source_commit: str) -> Set[str]:
+        """
+            Метод возвращает пути, изменённые в source относительно общего предка с target (как в MR)
+        """
+        output = self._git('diff', '--name-only', '-z', '--no-renames', f'{target_commit}...{source_commit}')
+        return {path for path in output.decode('utf-8').split('\0') if path}
+
+
+@lru_cache(maxsize=None)
+def open_repository(path: str) -> Optional[LocalRepository]:
+    """
+        Метод открывает локальную копию, если path - рабочая копия git
+    """
+    if not os.path.isdir(path):
+        return None
+    try:
+        repository = LocalRepository(path)
+        repository._git('rev-parse', '--git-dir')
+    except (LocalRefError, OSError) as e:
+        logger.debug(f'Каталог {path} не является репозиторием git: {e}')
+        return None
+    logger.info(f'Файлы проекта читаются из локальной копии {path}')
+    return repository
@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.settings import logger, settings
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS projects (
+    project_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    head_sha TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS parameters (
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    project_id INTEGER NOT NULL,
+    service TEXT NOT NULL,
+    description TEXT,
+    PRIMARY KEY (name, kind, project_id, service)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS parameters_project ON parameters (project_id);
+'''
+
+# Параметр сервиса: (сервис, раздел, имя, описание или None)
+Row = Tuple[str, str, str, Optional[str]]
+
+
+class ParameterDatabase:
+    """
+        Индекс параметров configmap/secret всех проектов namespace в SQLite.
+        Для каждого проекта хранится head SHA ветки по умолчанию, по которому он был проиндексирован:
+        проект перечитывается, только если SHA изменился. Таблица параметров упорядочена по имени (WITHOUT ROWID,
+        имя - первое поле ключа): все вхождения параметра лежат рядом и читаются одним проходом по B-дереву
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection().executescript(SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        # Соединение sqlite3 нельзя использовать из разных потоков, поэтому у каждого потока своё
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA busy_timeout=30000')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    def heads(self) -> Dict[int, Optional[str]]:
+        """
+            Метод возвращает head SHA, по которому проиндексирован каждый проект
+        """
+        return dict(self.connection().execute('SELECT project_id, head_sha FROM projects'))
+
+    def replace_project(self, project_id: int, path: str, head_sha: Optional[str], rows: Iterable[Row]):
+        """
+            Метод заменяет параметры проекта одной транзакцией: поиск никогда не видит проект наполовину обновлённым
+        """
+        connection = self.connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM parameters WHERE project_id = ?', (project_id,))
+            connection.executemany(
+                'INSERT OR REPLACE INTO parameters (service, kind, name, description, project_id) VALUES (?, ?, ?, ?, ?)',
+                ((*row, project_id) for row in rows),
+            )
+            connection.execute('INSERT OR REPLACE INTO projects (project_id, path, head_sha, indexed_at) '
+                               'VALUES (?, ?, ?, ?)', (project_id, path, head_sha, time.time()))
+
+    def remove_projects(self, project_ids: Iterable[int]):
+        connection = self.connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            for project_id in project_ids:
+                connection.execute('DELETE FROM parameters WHERE project_id = ?', (project_id,))
+                connection.execute('DELETE FROM projects WHERE project_id = ?', (project_id,))
+
+    def search(self, name: str, kind: Optional[str] = None) -> List[sqlite3.Row]:
+        """
+            Метод ищет параметр по точному имени, а если имя оканчивается на '*' - по префиксу.
+            Префикс ищется диапазоном по ключу, а не через LIKE, которому ключ не помогает.
+            Строки отдаются в порядке ключа таблицы, без сортировки и без построения словарей
+        """
+        if name.endswith('*'):
+            prefix = name[:-1]
+            condition, args = 'r.name >= ? AND r.name < ?', [prefix, prefix + '\U0010ffff']
+        else:
+            condition, args = 'r.name = ?', [name]
+        if kind:
+            condition += ' AND r.kind = ?'
+            args.append(kind)
+        cursor = self.connection().cursor()
+        cursor.row_factory = sqlite3.Row
+        return cursor.execute(
+            'SELECT p.project_id, p.path AS project, r.service, r.kind, r.name, r.description '
+            f'FROM parameters r JOIN projects p ON p.project_id = r.project_id WHERE {condition} '
+            'ORDER BY r.name, r.kind, r.project_id, r.service', args,
+        ).fetchall()
+
+
+@lru_cache(maxsize=None)
+def get_parameter_db() -> Optional[ParameterDatabase]:
+    """
+        Метод возвращает индекс параметров namespace или None, если файл индекса недоступен
+    """
+    try:
+        return ParameterDatabase(settings.index_file)
+    except sqlite3.Error as e:
+        logger.error(f'Индекс параметров {settings.index_file} недоступен: {e}')
+        return None
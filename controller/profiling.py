@@ -0,0 +1,141 @@
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, List, Optional
+
+from config.settings import logger, settings
+
+# cProfile и tracemalloc глобальны для процесса, поэтому в пакетном режиме и режиме сервиса
+# профилируемые стадии выполняются по очереди
+_profile_lock = threading.Lock()
+
+# Профили вызовов, выполненных в пуле потоков AsyncGitlab для профилируемой стадии. asyncio.to_thread копирует
+# контекст, поэтому сюда попадают и вложенные run_concurrently, а вызовы других стадий сервиса - нет
+_worker_profiles: ContextVar[Optional[List[Any]]] = ContextVar('worker_profiles', default=None)
+
+# Служебные кадры, которые не интересны в отчёте о памяти
+IGNORED_FRAMES = ('<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>')
+
+
+def report_path(name: str, suffix: str) -> str:
+    return os.path.join(settings.profile_dir, f'{name}{suffix}')
+
+
+def profile_call(func: Callable, *args, **kwargs) -> Any:
+    """
+        Метод выполняет вызов в потоке пула. cProfile видит только поток, в котором включён, поэтому
+        для профилируемой стадии вызов профилируется отдельно, а его статистика добавляется к отчёту стадии
+    """
+    profiles = _worker_profiles.get()
+    if profiles is None:
+        return func(*args, **kwargs)
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+: cProfile работает через sys.monitoring и уже видит все потоки, второй профилировщик не нужен
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profiles.append(profiler)
+
+
+def write_cpu_report(profiler, workers: List[Any], name: str):
+    """
+        Метод сохраняет статистику cProfile потока стадии вместе с вызовами из пула потоков в .pstats
+        (для snakeviz, gprof2dot, pstats) и текстовый отчёт с функциями по накопленному и собственному времени
+    """
+    import pstats
+
+    stats = pstats.Stats(profiler)
+    for worker in workers:
+        stats.add(worker)
+    stats.dump_stats(report_path(name, '.pstats'))
+    with open(report_path(name, '-cpu.txt'), 'w', encoding='utf-8') as f:
+        stats.stream = f
+        stats.strip_dirs()
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(settings.profile_top)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(settings.profile_top)
+
+
+def write_memory_report(start, end, peak: int, name: str):
+    """
+        Метод сохраняет отчёт tracemalloc: пик памяти за стадию и места, где выделено больше всего памяти,
+        оставшейся занятой к концу стадии
+    """
+    import tracemalloc
+
+    filters = [tracemalloc.Filter(False, pattern) for pattern in (tracemalloc.__file__, *IGNORED_FRAMES)]
+    start, end = start.filter_traces(filters), end.filter_traces(filters)
+    with open(report_path(name, '-memory.txt'), 'w', encoding='utf-8') as f:
+        total = sum(stat.size for stat in end.statistics('filename'))
+        f.write(f'Пик выделенной памяти: {peak / 1024 / 1024:.1f} МиБ, '
+                f'занято в конце стадии: {total / 1024 / 1024:.1f} МиБ\n\n')
+        f.write('Прирост по строкам:\n')
+        for stat in end.compare_to(start, 'lineno')[:settings.profile_top]:
+            f.write(f'{stat}\n')
+        if settings.profile_frames == 1:
+            return
+        f.write('\nПрирост по стекам вызовов:\n')
+        for stat in end.compare_to(start, 'traceback')[:min(10, settings.profile_top)]:
+            f.write(f'{stat}\n')
+            for line in stat.traceback.format(limit=settings.profile_frames):
+                f.write(f'{line}\n')
+            f.write('\n')
+
+
+@contextmanager
+def _profile(name: str):
+    import cProfile
+    import tracemalloc
+
+    with _profile_lock:
+        # Если tracemalloc уже запущен (PYTHONTRACEMALLOC), он не останавливается после стадии
+        started = settings.profile_memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(settings.profile_frames)
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            start = tracemalloc.take_snapshot()
+        workers = []
+        token = _worker_profiles.set(workers)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            _worker_profiles.reset(token)
+            memory = None
+            if tracemalloc.is_tracing():
+                memory = start, tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[1]
+            if started:
+                tracemalloc.stop()
+            try:
+                os.makedirs(settings.profile_dir, exist_ok=True)
+                write_cpu_report(profiler, workers, name)
+                if memory:
+                    write_memory_report(*memory, name)
+                logger.info(f'Отчёты профилирования сохранены в {report_path(name, "*")}')
+            except OSError as e:
+                logger.error(f'Не удалось сохранить отчёты профилирования: {e}')
+
+
+def profile_stage(stage: str, project_id: int, merge_request_iid: int):
+    """
+        Контекстный менеджер профилирования стадии (settings.profile): время CPU по функциям через cProfile
+        и выделения памяти через tracemalloc (profile_memory). Отчёты <стадия>-<проект>-<MR>.pstats, -cpu.txt и -memory.txt
+        сохраняются в profile_dir. Вызовы из пула потоков run_concurrently (получение и разбор values, запросы
+        к GitLab) профилируются в своих потоках и входят в тот же отчёт; накопленное время run_concurrently
+        в потоке стадии их перекрывает, собственное время функций не дублируется.
+        Когда профилирование выключено - ничего не делает и ничего не импортирует
+    """
+    if not settings.profile:
+        return nullcontext()
+    return _profile(f'{stage}-{project_id}-{merge_request_iid}')
@@ -0,0 +1,163 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+from requests import PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+
+from config.settings import logger
+
+# Повторять можно только запросы, повтор которых не создаст второй коммит. 429 означает, что запрос
+# не был обработан, поэтому он повторяется для любого метода
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+# При остатке RateLimit-Remaining меньше этой доли лимита новые запросы ждут RateLimit-Reset
+REMAINING_THRESHOLD = 0.05
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """
+        Метод возвращает задержку в секундах из Retry-After (секунды или HTTP дата) или RateLimit-Reset (unix время)
+    """
+    value = headers.get('Retry-After')
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset = headers.get('RateLimit-Reset')
+    if reset:
+        try:
+            return max(0.0, float(reset) - time.time())
+        except ValueError:
+            pass
+    return None
+
+
+class AdaptiveLimiter:
+    """
+        Ограничение числа одновременных запросов к GitLab по схеме AIMD: успешный ответ увеличивает лимит
+        на 1/лимит, ответ 429 или 5xx уменьшает его вдвое (не чаще раза в секунду). Ответ 429 и исчерпанный
+        RateLimit-Remaining приостанавливают новые запросы до момента, указанного GitLab
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                self.condition.wait(timeout=wait if wait > 0 else None)
+            self.in_flight += 1
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        with self.condition:
+            if self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.condition.notify_all()
+
+    def on_throttle(self, pause: float = 0.0):
+        with self.condition:
+            now = time.monotonic()
+            if now - self.last_decrease >= 1.0:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.last_decrease = now
+                logger.debug(f'Лимит одновременных запросов к GitLab снижен до {int(self.limit)}')
+            if pause:
+                self.paused_until = max(self.paused_until, now + pause)
+
+    def observe(self, headers: Mapping[str, str]):
+        # Заголовки RateLimit-* приходят и в успешных ответах: притормаживаем до того, как получим 429
+        try:
+            limit = int(headers['RateLimit-Limit'])
+            remaining = int(headers['RateLimit-Remaining'])
+        except (KeyError, ValueError):
+            return
+        if remaining <= max(1, int(limit * REMAINING_THRESHOLD)):
+            self.on_throttle(parse_retry_after({'RateLimit-Reset': headers.get('RateLimit-Reset', '')}) or 0.0)
+
+
+class RetryAdapter(HTTPAdapter):
+    """
+        HTTPAdapter с повтором запросов при 429/502/503/504 и обрывах соединения.
+        Задержка берётся из Retry-After/RateLimit-Reset, иначе - экспоненциальная со случайным разбросом (full jitter),
+        чтобы одновременно запущенные пайплайны не повторяли запросы синхронно
+    """
+
+    def __init__(self, limiter: AdaptiveLimiter, max_retries: int = 5, backoff: float = 0.5,
+                 backoff_max: float = 60.0, **kwargs):
+        super().__init__(**kwargs)
+        self.limiter = limiter
+        self.retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+    def delay(self, attempt: int, response: Optional[Response]) -> float:
+        explicit = parse_retry_after(response.headers) if response is not None else None
+        if explicit is not None:
+            return min(self.backoff_max, explicit) + random.uniform(0, self.backoff)
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        idempotent = request.method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            error = None
+            response = None
+            self.limiter.acquire()
+            try:
+                response = super().send(request, **kwargs)
+                if not kwargs.get('stream'):
+                    # Тело читается до освобождения слота: соединение занято, пока ответ не дочитан
+                    response.content
+            except (ConnectionError, Timeout) as e:
+                error = e
+                response = None
+            finally:
+                self.limiter.release()
+
+            if response is not None:
+                self.limiter.observe(response.headers)
+                if response.status_code not in RETRY_STATUSES or (response.status_code != 429 and not idempotent):
+                    if response.status_code < 500:
+                        self.limiter.on_success()
+                    response.retries = attempt
+                    return response
+            elif not idempotent:
+                raise error
+
+            if attempt >= self.retries:
+                if error:
+                    raise error
+                response.retries = attempt
+                return response
+
+            delay = self.delay(attempt, response)
+            self.limiter.on_throttle(delay if response is not None and response.status_code == 429 else 0.0)
+            reason = error if error else f'HTTP {response.status_code}'
+            logger.warning(f'{request.method} {request.path_url.split("?")[0]}: {reason}, '
+                           f'повтор {attempt + 1}/{self.retries} через {delay:.1f} с')
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+            attempt += 1
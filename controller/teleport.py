@@ -0,0 +1,129 @@
+import json
+import os
+import re
+import ssl
+import subprocess
+import tempfile
+import time
+from typing import Optional, Tuple
+
+from config.settings import logger, settings
+from controller.filelock import file_lock
+
+Credentials = Tuple[str, str, str]
+
+CERT_REGEX = r'(?<=cert\s").+(?="\s\\)'
+KEY_REGEX = r'(?<=key\s").+(?="\s\\)'
+URL_REGEX = r'https.+'
+
+
+def parse_login_output(output: str) -> Credentials:
+    """
+        Метод разбирает вывод `tsh app login gitlab`: пути к сертификату и ключу и URL GitLab
+    """
+    cert_list = re.findall(CERT_REGEX, output)
+    key_list = re.findall(KEY_REGEX, output)
+    url_list = re.findall(URL_REGEX, output)
+
+    if len(cert_list) != 1:
+        raise ValueError(f'Не удаётся распознать путь к сертификату. Найдено путей: {len(cert_list)}')
+    if len(key_list) != 1:
+        raise ValueError(f'Не удаётся распознать путь к ключу. Найдено путей: {len(key_list)}')
+    if len(url_list) != 1:
+        raise ValueError(f'Не удаётся распознать URL. Найдено URL: {len(url_list)}')
+
+    return cert_list[0], key_list[0], url_list[0].strip()
+
+
+def login() -> Credentials:
+    """
+        Метод выполняет авторизацию в teleport через tsh
+    """
+    logger.info('Авторизация в teleport')
+    try:
+        result = subprocess.run([settings.tsh_path, 'app', 'login', 'gitlab'], capture_output=True, text=True)
+        output = result.stdout + result.stderr
+    except OSError as e:
+        logger.exception(f'Ошибка при авторизации в teleport: {e}')
+        output = ''
+    return parse_login_output(output)
+
+
+def cert_expiry(cert_path: str) -> Optional[float]:
+    """
+        Метод возвращает время окончания действия сертификата (unix время) или None, если его не удалось прочитать.
+        Сертификат разбирается внутренней функцией CPython _ssl._test_decode_cert, отдельная библиотека для x509
+        не нужна. Функция не входит в публичный API и может отсутствовать - тогда срок берётся из teleport_ttl
+    """
+    decode_cert = getattr(getattr(ssl, '_ssl', None), '_test_decode_cert', None)
+    if decode_cert is None:
+        logger.debug('Разбор сертификата недоступен в этой версии Python, срок действия берём из teleport_ttl')
+        return None
+    try:
+        decoded = decode_cert(cert_path)
+        return ssl.cert_time_to_seconds(decoded['notAfter'])
+    except (KeyError, OSError, TypeError, ValueError, ssl.SSLError) as e:
+        logger.debug(f'Не удалось прочитать срок действия сертификата {cert_path}: {e}')
+        return None
+
+
+def read_cache() -> Optional[Credentials]:
+    """
+        Метод возвращает креды из кэша, если до окончания действия сертификата больше teleport_refresh_margin секунд
+    """
+    try:
+        with open(settings.teleport_cache_file, encoding='utf-8') as f:
+            cached = json.load(f)
+        credentials = cached['cert'], cached['key'], cached['url']
+        expires = float(cached['expires'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+    if expires - time.time() <= settings.teleport_refresh_margin:
+        logger.debug('Сертификат teleport скоро истекает, нужна повторная авторизация')
+        return None
+    if not os.path.isfile(credentials[0]) or not os.path.isfile(credentials[1]):
+        return None
+    return credentials
+
+
+def write_cache(credentials: Credentials, expires: float):
+    cache_file = settings.teleport_cache_file
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    cert, key, url = credentials
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'cert': cert, 'key': key, 'url': url, 'expires': expires}, f)
+        os.replace(tmp_path, cache_file)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def get_credentials() -> Credentials:
+    """
+        Метод возвращает креды teleport из локального кэша, а авторизуется через tsh, только если сертификата нет
+        или он истекает в ближайшие teleport_refresh_margin секунд. Срок действия берётся из самого сертификата,
+        а если его прочитать не удалось - teleport_ttl от момента авторизации.
+        Одновременно запущенные процессы авторизуются один раз: остальные ждут блокировку и читают обновлённый кэш
+    """
+    credentials = read_cache()
+    if credentials:
+        logger.debug('Используем сохранённые креды teleport')
+        return credentials
+
+    # Lock-файл лежит рядом с кэшем, поэтому каталог кэша нужен до блокировки
+    os.makedirs(os.path.dirname(os.path.abspath(settings.teleport_cache_file)), exist_ok=True)
+    # tsh может ждать подтверждения входа в браузере, поэтому таймаут блокировки большой
+    with file_lock(f'{settings.teleport_cache_file}.lock', timeout=300, stale=600):
+        credentials = read_cache()
+        if credentials:
+            return credentials
+
+        started = time.time()
+        credentials = login()
+        expires = cert_expiry(credentials[0]) or started + settings.teleport_ttl
+        write_cache(credentials, expires)
+        logger.info(f'Сертификат teleport действителен до {time.strftime("%d-%m-%Y %H:%M:%S", time.localtime(expires))}')
+        return credentials
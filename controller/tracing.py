@@ -0,0 +1,260 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from requests import Response, Session
+
+from config.settings import logger, settings
+
+# Путь запроса приводится к шаблону эндпоинта, чтобы метрики не дробились по id, путям файлов и SHA
+ENDPOINT_PATTERNS = [
+    (re.compile(r'/repository/files/[^/]+'), '/repository/files/:path'),
+    (re.compile(r'/repository/blobs/[^/]+'), '/repository/blobs/:sha'),
+    (re.compile(r'/repository/branches/.+'), '/repository/branches/:branch'),
+    (re.compile(r'/repository/commits/[^/]+'), '/repository/commits/:sha'),
+    (re.compile(r'/merge_requests/\d+'), '/merge_requests/:iid'),
+    (re.compile(r'/(projects|groups)/[^/]+'), r'/\1/:id'),
+]
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Имя текущего отрезка (стадии). asyncio.to_thread копирует контекст, поэтому запросы из пула потоков
+# run_concurrently тоже попадают в отрезок, из которого их запустили
+_current_span: ContextVar[Optional[str]] = ContextVar('readme_span', default=None)
+
+
+def endpoint_name(url: str) -> str:
+    path = urlsplit(url).path
+    path = path[len('/api/v4'):] if path.startswith('/api/v4') else path
+    for pattern, replacement in ENDPOINT_PATTERNS:
+        path = pattern.sub(replacement, path)
+    return path
+
+
+class Tracer:
+    """
+        Журнал запросов к GitLab и отрезков времени выполнения.
+        Запросы записываются response hook'ом сессии requests, отрезки - контекстным менеджером span()
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.clock = time.perf_counter()
+        self.lock = threading.Lock()
+        self.requests: List[dict] = []
+        self.spans: List[dict] = []
+
+    def on_response(self, response: Response, *args, **kwargs) -> Response:
+        # Для потокового ответа тело ещё не прочитано, размер берётся из заголовка
+        if kwargs.get('stream'):
+            size = int(response.headers.get('Content-Length') or 0)
+        else:
+            size = len(response.content or b'')
+        record = {
+            'at': round(time.perf_counter() - self.clock - response.elapsed.total_seconds(), 6),
+            'method': response.request.method,
+            'endpoint': endpoint_name(response.request.url),
+            'status': response.status_code,
+            'latency': response.elapsed.total_seconds(),
+            'size': size,
+            'page': int(response.headers['X-Page']) if response.headers.get('X-Page', '').isdigit() else None,
+            # Число повторов запроса в RetryAdapter
+            'retries': getattr(response, 'retries', 0),
+            'span': _current_span.get(),
+        }
+        with self.lock:
+            self.requests.append(record)
+        return response
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[None]:
+        token = _current_span.set(name)
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            yield
+        except BaseException as e:
+            status = 'exit' if isinstance(e, SystemExit) else 'error'
+            raise
+        finally:
+            _current_span.reset(token)
+            with self.lock:
+                self.spans.append({
+                    'name': name,
+                    'at': round(start - self.clock, 6),
+                    'duration': time.perf_counter() - start,
+                    'status': status,
+                    'attributes': attributes,
+                })
+
+    def summary(self) -> Dict[Tuple[str, str], dict]:
+        """
+            Агрегаты по (метод, эндпоинт): число запросов, статусы, суммарное время, байты, страницы, гистограмма
+        """
+        result = {}
+        with self.lock:
+            requests = list(self.requests)
+        for record in requests:
+            stats = result.setdefault((record['method'], record['endpoint']), {
+                'requests': 0, 'statuses': {}, 'latency': 0.0, 'bytes': 0, 'pages': 0, 'retries': 0,
+                'buckets': [0] * len(LATENCY_BUCKETS),
+            })
+            stats['requests'] += 1
+            stats['statuses'][record['status']] = stats['statuses'].get(record['status'], 0) + 1
+            stats['latency'] += record['latency']
+            stats['bytes'] += record['size']
+            stats['pages'] += 1 if record['page'] else 0
+            stats['retries'] += record['retries']
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if record['latency'] <= bound:
+                    stats['buckets'][i] += 1
+        return result
+
+    def to_json(self) -> dict:
+        with self.lock:
+            return {
+                'started': self.started,
+                'duration': time.perf_counter() - self.clock,
+                'stage': settings.stage,
+                'project_id': settings.source_project_id,
+                'merge_request_iid': settings.merge_request_iid,
+                'ci_job_id': settings.ci_job_id,
+                'requests': list(self.requests),
+                'spans': list(self.spans),
+            }
+
+    def to_prometheus(self) -> str:
+        stage = _label(settings.stage or '')
+        lines = []
+
+        def metric(name: str, kind: str, description: str):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        summary = self.summary()
+        metric('readme_gitlab_requests_total', 'counter', 'Число запросов к GitLab по эндпоинтам и статусам')
+        for (method, endpoint), stats in summary.items():
+            for status, count in sorted(stats['statuses'].items()):
+                lines.append(f'readme_gitlab_requests_total{{stage="{stage}",method="{method}",'
+                             f'endpoint="{_label(endpoint)}",status="{status}"}} {count}')
+
+        metric('readme_gitlab_request_duration_seconds', 'histogram', 'Время ответа GitLab')
+        for (method, endpoint), stats in summary.items():
+            labels = f'stage="{stage}",method="{method}",endpoint="{_label(endpoint)}"'
+            for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+                lines.append(f'readme_gitlab_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'readme_gitlab_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["requests"]}')
+            lines.append(f'readme_gitlab_request_duration_seconds_sum{{{labels}}} {stats["latency"]:.6f}')
+            lines.append(f'readme_gitlab_request_duration_seconds_count{{{labels}}} {stats["requests"]}')
+
+        metric('readme_gitlab_response_bytes_total', 'counter', 'Размер ответов GitLab в байтах')
+        for (method, endpoint), stats in summary.items():
+            lines.append(f'readme_gitlab_response_bytes_total{{stage="{stage}",method="{method}",'
+                         f'endpoint="{_label(endpoint)}"}} {stats["bytes"]}')
+
+        metric('readme_gitlab_pages_total', 'counter', 'Число страниц, полученных из постраничных списков')
+        for (method, endpoint), stats in summary.items():
+            if stats['pages']:
+                lines.append(f'readme_gitlab_pages_total{{stage="{stage}",method="{method}",'
+                             f'endpoint="{_label(endpoint)}"}} {stats["pages"]}')
+
+        metric('readme_gitlab_retries_total', 'counter', 'Число повторов запросов к GitLab после 429, 5xx и обрывов')
+        for (method, endpoint), stats in summary.items():
+            if stats['retries']:
+                lines.append(f'readme_gitlab_retries_total{{stage="{stage}",method="{method}",'
+                             f'endpoint="{_label(endpoint)}"}} {stats["retries"]}')
+
+        metric('readme_span_duration_seconds', 'gauge', 'Длительность стадий и других отрезков выполнения')
+        durations: Dict[str, float] = {}
+        with self.lock:
+            for span in self.spans:
+                durations[span['name']] = durations.get(span['name'], 0.0) + span['duration']
+        for name, duration in durations.items():
+            lines.append(f'readme_span_duration_seconds{{stage="{stage}",span="{_label(name)}"}} {duration:.6f}')
+
+        metric('readme_run_timestamp_seconds', 'gauge', 'Время запуска генератора')
+        lines.append(f'readme_run_timestamp_seconds{{stage="{stage}"}} {self.started:.3f}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write_atomic(path: str, content: str):
+    # node_exporter textfile collector не должен увидеть файл наполовину записанным
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Optional[Tracer]:
+    """
+        Метод возвращает общий журнал запросов или None, если не задан ни trace_file, ни metrics_file
+    """
+    global _tracer
+    if not settings.trace_file and not settings.metrics_file:
+        return None
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+
+def install(session: Session):
+    """
+        Метод подключает запись запросов к HTTP сессии GitLab
+    """
+    tracer = get_tracer()
+    if tracer:
+        session.hooks['response'].append(tracer.on_response)
+
+
+def span(name: str, **attributes):
+    """
+        Контекстный менеджер для замера отрезка выполнения (стадии, получения контекста MR и т.п.)
+    """
+    tracer = get_tracer()
+    return tracer.span(name, **attributes) if tracer else nullcontext()
+
+
+def export():
+    """
+        Метод сохраняет журнал в trace_file (JSON) и метрики в metrics_file (формат textfile Prometheus)
+    """
+    tracer = get_tracer()
+    if not tracer:
+        return
+
+    summary = tracer.summary()
+    requests = sum(stats['requests'] for stats in summary.values())
+    latency = sum(stats['latency'] for stats in summary.values())
+    logger.info(f'Запросов к GitLab: {requests}, суммарное время ответов: {latency:.2f} с')
+    for (method, endpoint), stats in sorted(summary.items(), key=lambda item: -item[1]['latency'])[:5]:
+        logger.debug(f'{method} {endpoint}: {stats["requests"]} запросов, {stats["latency"]:.2f} с, '
+                     f'{stats["bytes"]} байт')
+
+    try:
+        if settings.trace_file:
+            _write_atomic(settings.trace_file, json.dumps(tracer.to_json(), ensure_ascii=False, indent=2))
+        if settings.metrics_file:
+            _write_atomic(settings.metrics_file, tracer.to_prometheus())
+    except OSError as e:
+        logger.error(f'Не удалось сохранить трассировку запросов: {e}')
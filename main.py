@@ -1,36 +1,72 @@
-from gitlab.v4.objects import Project, MergeRequest
-from controller.gitlab import get_gitlab
-import gitlab.exceptions
+from typing import TYPE_CHECKING
 
-from app.prepare_readme import gen_yaml, get_parameters
-from app.gen_readme import create_markdown_file
 from config.settings import settings, logger
 
+if TYPE_CHECKING:
+    from gitlab import Gitlab
+
+    from app.context import MergeRequestContext
+
+
+# python-gitlab, requests, ruamel.yaml и jinja2 импортируются внутри функций: модуль загружается только
+# на том пути, где он нужен, и время старта CI job не тратится на неиспользуемые стадии
+
+
+def get_context(gl: 'Gitlab') -> 'MergeRequestContext':
+    """
+        Метод строит контекст MR из параметров CI job. Если проект или MR не найден - завершает процесс
+    """
+    import gitlab.exceptions
+
+    from app.context import load_context
+
+    logger.info(f'Получение merge request {settings.merge_request_iid} проекта {settings.source_project_id}')
+    try:
+        return load_context(gl, settings.source_project_id, settings.merge_request_iid,
+                            settings.source_branch, settings.target_branch)
+    except gitlab.exceptions.GitlabGetError as e:
+        logger.error(f'Проект с ID: {settings.source_project_id} или merge request {settings.merge_request_iid} '
+                     f'не найден: {e}')
+        exit(1)
+
 
 def main():
-    gl = get_gitlab()
-    if settings.source_project_id and settings.merge_request_iid:
-        try:
-            logger.info(f'Получение основных параметров project {settings.source_project_id}')
-            project = gl.projects.get(settings.source_project_id)
-        except gitlab.exceptions.GitlabGetError:
-            logger.error(f'Проект с ID: {settings.source_project_id} не найден.')
-            exit(1)
-
-        try:
-            logger.info(f'Получение основных параметров merge request {settings.merge_request_iid}')
-            merge_request = project.mergerequests.get(settings.merge_request_iid)
-        except Exception as e:
-            raise Exception(f'Ошибка при получении merge request {settings.merge_request_iid}: {e}')
-        if not merge_request:
-            raise Exception('MergeRequest не получен')
-
-        if settings.stage == 'prepare':
-            gen_yaml(project, merge_request)
-        elif settings.stage == 'generate':
-            create_markdown_file(project, merge_request)
-    else:
+    if not settings.serve and not settings.fleet and not settings.index and not settings.lookup \
+            and not (settings.source_project_id and settings.merge_request_iid):
         logger.info("Не заданы параметры project_id или merge_request_id")
+        return
+
+    if settings.lookup:
+        # Поиск идёт только по локальному индексу, подключение к GitLab не нужно
+        from app.namespace_index import print_lookup
+
+        return print_lookup(settings.lookup)
+
+    from controller.gitlab import get_gitlab
+    from controller.tracing import export, span
+
+    try:
+        gl = get_gitlab()
+        if settings.serve:
+            from app.webhook import serve
+
+            serve(gl, settings.stage or 'all')
+        elif settings.index:
+            from app.namespace_index import refresh_index
+
+            refresh_index(gl)
+        elif settings.fleet:
+            from app.fleet import run_fleet
+
+            run_fleet(gl, settings.stage)
+        else:
+            from app.stages import run_stage
+
+            with span('context'):
+                ctx = get_context(gl)
+            run_stage(settings.stage, ctx)
+    finally:
+        export()
 
 
 if __name__ == '__main__':